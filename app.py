@@ -3,17 +3,19 @@ import os
 from dotenv import load_dotenv
 import time
 import threading
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.service import Service
 import requests
+from requests.adapters import HTTPAdapter
+import atexit
 from bs4 import BeautifulSoup
 import json
 import random
+from viral_ai_agent import AIServiceUnavailable, Config, DatabaseManager, default_api_guard, estimate_tokens
+from browser_pool import BrowserPool
+from browser_waits import PageWaiter, WaitStats
+from tiktok_scanner import TrendingScanner
+from scheduler import Scheduler
+from outbox import OutboxPublisher
 
 load_dotenv()
 
@@ -21,28 +23,65 @@ app = Flask(__name__)
 
 # Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+DATABASE_FILE = os.getenv('DATABASE_FILE', Config.DATABASE_FILE)
 TIKTOK_USERNAME = os.getenv('TIKTOK_USERNAME')
 TIKTOK_PASSWORD = os.getenv('TIKTOK_PASSWORD')
 INSTAGRAM_USERNAME = os.getenv('INSTAGRAM_USERNAME')
 INSTAGRAM_PASSWORD = os.getenv('INSTAGRAM_PASSWORD')
 
+# Job cadences (seconds); POST_CRON, e.g. "0 9,13,19 * * *", replaces the posting interval
+SCAN_INTERVAL = int(os.getenv('SCAN_INTERVAL', '1800'))
+GENERATE_INTERVAL = int(os.getenv('GENERATE_INTERVAL', '1800'))
+POST_INTERVAL = int(os.getenv('POST_INTERVAL', '7200'))
+POST_CRON = os.getenv('POST_CRON')
+POSTS_PER_RUN = int(os.getenv('POSTS_PER_RUN', '1'))  # per platform, so a backlog keeps the post cadence
+JOB_JITTER = int(os.getenv('JOB_JITTER', '60'))  # random delay added to each start
+
+# One keep-alive connection pool for outbound API calls instead of a new TLS handshake per request
+http = requests.Session()
+http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+http.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+atexit.register(http.close)
+
+# Warm headless Chrome instances reused across scans and posts; each slot keeps its own
+# profile directory so platform logins survive between cycles (BROWSER_POOL_SIZE, default 2)
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close)
+
+# How long each explicit wait step actually took, reported by /stats
+wait_stats = WaitStats()
+
+# Generated posts wait in the post_outbox table until each platform has accepted them
+db = DatabaseManager(DATABASE_FILE)
+atexit.register(db.close)
+
 # Global variables
 viral_content = []
 posted_content = []
+content_lock = threading.Lock()  # shared by the job and publisher threads
 earnings = 0.0
-automation_running = False
 
-def setup_driver():
-    """Setup Chrome driver for automation"""
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--window-size=1920,1080')
+def ensure_logged_in(driver, platform, home_url, login_url, username, password, submit_selector,
+                     session_cookie='sessionid'):
+    """Log in only when the pooled browser's profile has no session cookie for the platform"""
+    driver.get(home_url)
+    if driver.get_cookie(session_cookie):
+        return True
+    
+    waiter = PageWaiter(driver, wait_stats)
+    driver.get(login_url)
     
-    service = Service(ChromeDriverManager().install())
-    return webdriver.Chrome(service=service, options=options)
+    username_field = waiter.visible(f"{platform}.login_form", By.NAME, "username")
+    password_field = driver.find_element(By.NAME, "password")
+    
+    username_field.send_keys(username)
+    password_field.send_keys(password)
+    
+    login_button = waiter.clickable(f"{platform}.login_button", By.CSS_SELECTOR, submit_selector)
+    login_button.click()
+    
+    return waiter.login_complete(f"{platform}.login_redirect", session_cookie, '/login')
 
 def generate_content_with_ai(viral_text):
     """Generate content using OpenAI API"""
@@ -70,48 +109,64 @@ def generate_content_with_ai(viral_text):
             'max_tokens': 100
         }
         
-        response = requests.post('https://api.openai.com/v1/chat/completions', 
+        def post():
+            response = http.post(f'{OPENAI_BASE_URL}/chat/completions', 
                                headers=headers, json=data, timeout=30)
+            response.raise_for_status()
+            return response
         
-        if response.status_code == 200:
-            return response.json()['choices'][0]['message']['content']
-        else:
-            return "Make money online with this simple trick! 💰"
+        # shares the rate budget, retries and circuit breaker with viral_ai_agent's OpenAI calls
+        tokens = estimate_tokens(viral_text) + data['max_tokens']
+        response = default_api_guard().call(post, tokens)
+        return response.json()['choices'][0]['message']['content']
             
+    except AIServiceUnavailable as e:
+        print(f"OpenAI unavailable, using fallback content: {e}")
+        return "Make money online with this simple trick! 💰"
     except Exception as e:
         print(f"OpenAI API Error: {e}")
         return "Make money online with this simple trick! 💰"
 
-def scan_tiktok_viral():
-    """Scan TikTok for viral content"""
-    global viral_content
-    
-    try:
-        driver = setup_driver()
+def scan_tiktok_browser(limit=5):
+    """Render the trending page in a pooled browser; fallback tier for trending_scanner"""
+    with browser_pool.acquire() as browser:
+        driver = browser.driver
+        waiter = PageWaiter(driver, wait_stats)
         driver.get("https://www.tiktok.com/trending")
-        time.sleep(5)
         
-        # Find trending content
-        posts = driver.find_elements(By.CSS_SELECTOR, "[data-e2e='video-desc']")
+        # Find trending content once the first descriptions render, then let lazy loads settle
+        posts = waiter.elements("tiktok.trending", By.CSS_SELECTOR, "[data-e2e='video-desc']")
+        waiter.network_idle("tiktok.trending_idle")
         
-        for post in posts[:5]:  # Get top 5 trending
+        texts = []
+        for post in posts[:limit * 2]:  # spare candidates for short or duplicate captions
             try:
-                text = post.text
-                if text and len(text) > 20:
-                    viral_content.append({
-                        'text': text,
-                        'timestamp': time.time(),
-                        'platform': 'tiktok'
-                    })
+                texts.append(post.text)
             except:
                 continue
-                
-        driver.quit()
-        return True
-        
-    except Exception as e:
-        print(f"TikTok scan error: {e}")
+        return texts
+
+# Plain HTTP + lxml first over the pooled session; Chrome only when the page yields nothing
+trending_scanner = TrendingScanner(http, browser_scan=scan_tiktok_browser)
+
+def scan_tiktok_viral():
+    """Scan TikTok for viral content"""
+    global viral_content
+    
+    result = trending_scanner.scan(limit=5)  # Get top 5 trending
+    with content_lock:
+        for text in result.texts:
+            viral_content.append({
+                'text': text,
+                'timestamp': time.time(),
+                'platform': 'tiktok',
+                'tier': result.tier
+            })
+    
+    if result.errors and not result.texts:
+        print(f"TikTok scan error: {'; '.join(result.errors)}")
         return False
+    return True
 
 def post_to_tiktok(content):
     """Post content to TikTok"""
@@ -119,26 +174,18 @@ def post_to_tiktok(content):
         return False
         
     try:
-        driver = setup_driver()
-        driver.get("https://www.tiktok.com/login")
-        time.sleep(3)
-        
-        # Login process
-        username_field = driver.find_element(By.NAME, "username")
-        password_field = driver.find_element(By.NAME, "password")
-        
-        username_field.send_keys(TIKTOK_USERNAME)
-        password_field.send_keys(TIKTOK_PASSWORD)
-        
-        login_button = driver.find_element(By.CSS_SELECTOR, "[data-e2e='login-button']")
-        login_button.click()
-        
-        time.sleep(5)
-        
-        # Post content (simplified)
-        # In real implementation, you'd navigate to upload and post
-        
-        driver.quit()
+        with browser_pool.acquire() as browser:
+            driver = browser.driver
+            
+            # Login process (skipped while the profile still holds a session)
+            if not ensure_logged_in(driver, "tiktok", "https://www.tiktok.com/", "https://www.tiktok.com/login",
+                                    TIKTOK_USERNAME, TIKTOK_PASSWORD, "[data-e2e='login-button']"):
+                print("TikTok post error: login did not complete")
+                return False
+            
+            # Post content (simplified)
+            # In real implementation, you'd navigate to upload and post
+            
         return True
         
     except Exception as e:
@@ -151,80 +198,96 @@ def post_to_instagram(content):
         return False
         
     try:
-        driver = setup_driver()
-        driver.get("https://www.instagram.com/accounts/login/")
-        time.sleep(3)
-        
-        # Login process
-        username_field = driver.find_element(By.NAME, "username")
-        password_field = driver.find_element(By.NAME, "password")
-        
-        username_field.send_keys(INSTAGRAM_USERNAME)
-        password_field.send_keys(INSTAGRAM_PASSWORD)
-        
-        login_button = driver.find_element(By.CSS_SELECTOR, "[type='submit']")
-        login_button.click()
-        
-        time.sleep(5)
-        
-        # Post content (simplified)
-        # In real implementation, you'd navigate to create post
-        
-        driver.quit()
+        with browser_pool.acquire() as browser:
+            driver = browser.driver
+            
+            # Login process (skipped while the profile still holds a session)
+            if not ensure_logged_in(driver, "instagram", "https://www.instagram.com/",
+                                    "https://www.instagram.com/accounts/login/",
+                                    INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD, "[type='submit']"):
+                print("Instagram post error: login did not complete")
+                return False
+            
+            # Post content (simplified)
+            # In real implementation, you'd navigate to create post
+            
         return True
         
     except Exception as e:
         print(f"Instagram post error: {e}")
         return False
 
-def automation_worker():
-    """Background automation worker"""
-    global automation_running, earnings
+def scan_job():
+    """Refresh viral_content from TikTok trending"""
+    if scan_tiktok_viral():
+        print("✅ Scanned TikTok for viral content")
+
+def generate_job():
+    """Turn the latest unused viral find into a caption for the post job"""
+    with content_lock:
+        fresh = [content for content in viral_content if not content.get('generated')]
+        if not fresh:
+            return False
+        content = fresh[-1]  # Get latest viral content
+        content['generated'] = True
     
-    while automation_running:
-        try:
-            # Scan for viral content every 30 minutes
-            if scan_tiktok_viral():
-                print("✅ Scanned TikTok for viral content")
-            
-            # Post content every 2 hours
-            if viral_content:
-                content = viral_content[-1]  # Get latest viral content
-                generated_content = generate_content_with_ai(content['text'])
-                
-                # Add affiliate links
-                full_content = f"{generated_content}\n\n💰 Make money: bit.ly/your-link"
-                
-                # Post to platforms
-                if post_to_tiktok(full_content):
-                    print("✅ Posted to TikTok")
-                    posted_content.append({
-                        'content': full_content,
-                        'platform': 'tiktok',
-                        'timestamp': time.time()
-                    })
-                    earnings += random.uniform(5.0, 25.0)  # Simulate earnings
-                
-                if post_to_instagram(full_content):
-                    print("✅ Posted to Instagram")
-                    posted_content.append({
-                        'content': full_content,
-                        'platform': 'instagram',
-                        'timestamp': time.time()
-                    })
-                    earnings += random.uniform(3.0, 15.0)  # Simulate earnings
-            
-            # Wait 2 hours before next post
-            time.sleep(7200)
-            
-        except Exception as e:
-            print(f"Automation error: {e}")
-            time.sleep(60)  # Wait 1 minute before retrying
+    generated_content = generate_content_with_ai(content['text'])
+    
+    # Add affiliate links
+    full_content = f"{generated_content}\n\n💰 Make money: bit.ly/your-link"
+    outbox.enqueue(full_content, configured_platforms())
+    return True
+
+def configured_platforms():
+    credentials = {
+        'tiktok': (TIKTOK_USERNAME, TIKTOK_PASSWORD),
+        'instagram': (INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
+    }
+    return [platform for platform, (username, password) in credentials.items() if username and password]
+
+def make_publisher(platform, label, post, payout):
+    """Outbox publisher around a post_to_* function; the outbox itself skips already-delivered posts"""
+    def publish(content, key):
+        global earnings
+        if not post(content):
+            return False
+        print(f"✅ Posted to {label}")
+        with content_lock:
+            posted_content.append({
+                'content': content,
+                'platform': platform,
+                'timestamp': time.time(),
+                'key': key
+            })
+            earnings += random.uniform(*payout)  # Simulate earnings
+        return True
+    return publish
+
+# One publisher per platform, drained concurrently; failures retry with backoff, then dead-letter
+outbox = OutboxPublisher(db, {
+    'tiktok': make_publisher('tiktok', 'TikTok', post_to_tiktok, (5.0, 25.0)),
+    'instagram': make_publisher('instagram', 'Instagram', post_to_instagram, (3.0, 15.0))
+})
+atexit.register(outbox.close)
+
+def post_job():
+    """Deliver the next due outbox posts, all platforms at once"""
+    return outbox.drain(max_posts=POSTS_PER_RUN)
+
+# Scan, generate and post on their own cadences; a slow step only delays itself
+scheduler = Scheduler(max_workers=3)
+scheduler.add_interval_job('scan', scan_job, SCAN_INTERVAL, jitter=JOB_JITTER, run_immediately=True)
+scheduler.add_interval_job('generate', generate_job, GENERATE_INTERVAL, jitter=JOB_JITTER)
+if POST_CRON:
+    scheduler.add_cron_job('post', post_job, POST_CRON, jitter=JOB_JITTER)
+else:
+    scheduler.add_interval_job('post', post_job, POST_INTERVAL, jitter=JOB_JITTER)
+atexit.register(scheduler.stop, 0)
 
 @app.route('/')
 def dashboard():
     """Main dashboard"""
-    status = "RUNNING WITH BROWSER AUTOMATION" if automation_running else "STOPPED"
+    status = "RUNNING WITH BROWSER AUTOMATION" if scheduler.running else "STOPPED"
     
     missing_vars = []
     if not OPENAI_API_KEY:
@@ -248,13 +311,7 @@ def dashboard():
 @app.route('/start-automation', methods=['POST'])
 def start_automation():
     """Start automation"""
-    global automation_running
-    
-    if not automation_running:
-        automation_running = True
-        thread = threading.Thread(target=automation_worker)
-        thread.daemon = True
-        thread.start()
+    if scheduler.start():
         return jsonify({"status": "started"})
     
     return jsonify({"status": "already_running"})
@@ -262,8 +319,7 @@ def start_automation():
 @app.route('/stop-automation', methods=['POST'])
 def stop_automation():
     """Stop automation"""
-    global automation_running
-    automation_running = False
+    scheduler.stop(wait=1)
     return jsonify({"status": "stopped"})
 
 @app.route('/stats')
@@ -273,7 +329,11 @@ def stats():
         "earnings": earnings,
         "viral_content": len(viral_content),
         "posted_content": len(posted_content),
-        "automation_running": automation_running
+        "automation_running": scheduler.running,
+        "jobs": scheduler.status(),
+        "outbox": db.outbox_counts(),
+        "browser_waits": wait_stats.summary(),
+        "scan_tiers": trending_scanner.stats()
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput benchmark for the AI paths, run offline against fake_openai_server.py
+Every scenario goes end to end: prompt assembly, rate limiting/retries, the OpenAI SDK over
+HTTP, response parsing and writes through DatabaseManager into a scratch database.
+
+    python benchmark_ai.py --items 200 --latency-ms 150 --rate-limit-rate 0.02
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from fake_openai_server import FakeServerConfig, start_server
+from viral_ai_agent import (AIAgent, ApiGuard, Config, DatabaseManager, RateLimiter, ResponseCache,
+                            ViralVideo, script_from_data)
+
+@dataclass
+class BenchResult:
+    scenario: str
+    items: int
+    wall: float
+    latencies: List[float] = field(default_factory=list)  # seconds per item (or per request)
+    errors: int = 0
+    requests: Optional[int] = None
+    
+    def row(self) -> str:
+        p50, p95, p99 = (np.percentile(self.latencies, [50, 95, 99]) * 1000) if self.latencies else (0, 0, 0)
+        requests = "" if self.requests is None else str(self.requests)
+        return (f"{self.scenario:<28} {self.items:>6} {requests:>6} {self.wall:>8.2f} "
+                f"{self.items / self.wall if self.wall else 0:>8.1f} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f} {self.errors:>6}")
+
+HEADER = (f"{'scenario':<28} {'items':>6} {'reqs':>6} {'wall s':>8} {'items/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+
+def make_videos(count: int) -> List[ViralVideo]:
+    """Synthetic, distinct videos so neither dedup nor the response cache collapses them"""
+    return [ViralVideo(
+        title=f"Benchmark video {i}",
+        platform=("tiktok", "instagram", "youtube")[i % 3],
+        url=f"https://example.com/bench/{i}",
+        views=50_000 + i * 1_000,
+        engagement_rate=5 + i % 10,
+        captions=f"Day {i} of my affiliate journey",
+        hashtags="#affiliatemarketing #passiveincome",
+        audio_transcript=(f"Day {i}: I made ${100 + i * 7:,} this week with one funnel. " * 8 +
+                          "Here is exactly what I did, step by step."),
+    ) for i in range(count)]
+
+def requests_served(fake_counts: dict, before: dict) -> int:
+    return fake_counts["requests"] - before["requests"]
+
+def reset(db: DatabaseManager):
+    with db.transaction() as conn:
+        conn.execute("UPDATE viral_videos SET ai_score = 0, status = 'discovered'")
+
+def bench_sync(agent: AIAgent, db: DatabaseManager, videos: List[ViralVideo]) -> BenchResult:
+    """One analyze_viral_video call at a time, each score written back as it arrives"""
+    result = BenchResult("sync analyze_viral_video", len(videos), 0.0)
+    start = time.perf_counter()
+    for video in videos:
+        call_start = time.perf_counter()
+        try:
+            analysis = agent.analyze_viral_video(video.url, video.audio_transcript, use_cache=False)
+            db.update_video_scores_many([(video.id, int(analysis["score"]), "analyzed")])
+        except Exception:
+            result.errors += 1
+        result.latencies.append(time.perf_counter() - call_start)
+    result.wall = time.perf_counter() - start
+    return result
+
+def bench_batch(name: str, run: Callable[[], List], items: int) -> BenchResult:
+    start = time.perf_counter()
+    results = run()
+    wall = time.perf_counter() - start
+    return BenchResult(name, items, wall, [r.elapsed for r in results], sum(not r.ok for r in results))
+
+def bench_stream(agent: AIAgent, db: DatabaseManager, count: int) -> List[BenchResult]:
+    """Time to first field and to the saved record for streamed script generation"""
+    first = BenchResult("stream_script first field", count, 0.0)
+    total = BenchResult("stream_script complete", count, 0.0)
+    start = time.perf_counter()
+    for i in range(count):
+        call_start = time.perf_counter()
+        try:
+            fields = {}
+            for key, value in agent.stream_script("AI Tools", "60s", "beginners", f"benchmark message {i}",
+                                                  "success-story", use_cache=False):
+                if not fields:
+                    first.latencies.append(time.perf_counter() - call_start)
+                fields[key] = value
+            db.insert_script(script_from_data(fields, "AI Tools", "60s", "beginners", "success-story"))
+        except Exception:
+            total.errors += 1
+        total.latencies.append(time.perf_counter() - call_start)
+    first.wall = total.wall = time.perf_counter() - start
+    return [first, total]
+
+def bench_app(base_url: str, count: int, db_file: str) -> Optional[BenchResult]:
+    """app.generate_content_with_ai over requests.post; skipped when the Flask app's deps are missing"""
+    os.environ['DATABASE_FILE'] = db_file  # app opens its database at import
+    try:
+        import app
+    except ImportError as e:
+        print(f"(skipping app.py scenario: {e})")
+        return None
+    app.OPENAI_API_KEY = app.OPENAI_API_KEY or "benchmark-key"
+    app.OPENAI_BASE_URL = base_url
+    result = BenchResult("app generate_content_with_ai", count, 0.0)
+    start = time.perf_counter()
+    for i in range(count):
+        call_start = time.perf_counter()
+        app.generate_content_with_ai(f"viral benchmark {i}")
+        result.latencies.append(time.perf_counter() - call_start)
+    result.wall = time.perf_counter() - start
+    app.db.close()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AI paths against a local fake OpenAI server")
+    parser.add_argument("--items", type=int, default=100, help="videos/captions per scenario")
+    parser.add_argument("--sync-items", type=int, default=20, help="items for the sequential scenarios")
+    parser.add_argument("--concurrency", type=int, default=Config.AI_CONCURRENCY)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--latency-dist", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    server, base_url = start_server(FakeServerConfig(
+        latency_ms=args.latency_ms, latency_dist=args.latency_dist, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, seed=args.seed
+    ))
+    fake = server.RequestHandlerClass.fake
+    Config.OPENAI_BASE_URL = base_url
+    
+    workdir = tempfile.mkdtemp(prefix="viral-bench-")
+    db = DatabaseManager(os.path.join(workdir, "bench.db"))
+    try:
+        videos = make_videos(args.items)
+        db.insert_viral_videos_many(videos)
+        videos = list(db.iter_viral_videos())
+        captions = [video.audio_transcript for video in videos]
+        
+        # generous client-side budget: measure the paths, not our own throttling
+        guard = ApiGuard(RateLimiter(requests_per_minute=1_000_000, tokens_per_minute=1_000_000_000))
+        agent = AIAgent("benchmark-key", cache=ResponseCache(db), use_cache=False, guard=guard, db=db)
+        
+        print(f"Fake OpenAI at {base_url}: {args.latency_dist} latency, median {args.latency_ms:.0f}ms, "
+              f"{args.error_rate:.0%} errors, {args.rate_limit_rate:.0%} 429s\n")
+        print(HEADER)
+        print("-" * len(HEADER))
+        
+        def report(result: Optional[BenchResult], before: dict):
+            if result is not None:
+                result.requests = requests_served(fake.counts, before)
+                print(result.row(), flush=True)
+        
+        before = dict(fake.counts)
+        report(bench_sync(agent, db, videos[:args.sync_items]), before)
+        
+        scenarios = [
+            ("async analyze_many", lambda: agent.run(
+                agent.analyze_many(videos, concurrency=args.concurrency)), len(videos)),
+            (f"packed analyze_many x{Config.ANALYSIS_PACK_SIZE}", lambda: agent.run(
+                agent.analyze_many(videos, concurrency=args.concurrency, pack_size=Config.ANALYSIS_PACK_SIZE)),
+             len(videos)),
+            ("async score_many", lambda: agent.run(
+                agent.score_many(captions, concurrency=args.concurrency)), len(captions)),
+            (f"packed score_many x{Config.AUTHENTICITY_PACK_SIZE}", lambda: agent.run(
+                agent.score_many(captions, concurrency=args.concurrency, pack_size=Config.AUTHENTICITY_PACK_SIZE)),
+             len(captions)),
+        ]
+        for name, run, items in scenarios:
+            reset(db)
+            before = dict(fake.counts)
+            report(bench_batch(name, run, items), before)
+        
+        before = dict(fake.counts)
+        first, total = bench_stream(agent, db, min(args.sync_items, 10))
+        report(first, before)
+        report(total, before)
+        
+        before = dict(fake.counts)
+        report(bench_app(base_url, args.sync_items, os.path.join(workdir, "app.db")), before)
+        
+        print(f"\nServer saw {fake.counts['requests']} requests "
+              f"({fake.counts['rate_limited']} 429s, {fake.counts['errors']} 500s, "
+              f"{fake.counts['streamed']} streamed)")
+    finally:
+        db.close()
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Pool of warm headless Chrome instances for the Flask automation worker
+Each slot keeps its own persistent Chrome profile, so cookies and logged-in sessions survive
+between posts and across browser recycling. The chromedriver binary is resolved once per process.
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+class BrowserPoolConfig:
+    SIZE = int(os.getenv('BROWSER_POOL_SIZE', '2'))
+    MAX_USES = int(os.getenv('BROWSER_MAX_USES', '50'))  # recycle a browser after this many checkouts
+    MAX_RSS_MB = int(os.getenv('BROWSER_MAX_RSS_MB', '1500'))  # ...or once its process tree grows past this
+    PROFILE_ROOT = os.getenv('BROWSER_PROFILE_ROOT', '.browser_profiles')
+    ACQUIRE_TIMEOUT = 300  # seconds to wait for a free browser
+
+_driver_path: Optional[str] = None
+_driver_path_lock = threading.Lock()
+
+def chromedriver_path() -> str:
+    """Resolve (and if needed download) chromedriver once per process"""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = os.getenv('CHROMEDRIVER_PATH') or ChromeDriverManager().install()
+        return _driver_path
+
+def chrome_options(profile_dir: Optional[str] = None) -> Options:
+    """Headless Chrome options used by the automation; profile_dir persists cookies between launches"""
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--window-size=1920,1080')
+    if profile_dir:
+        options.add_argument(f'--user-data-dir={os.path.abspath(profile_dir)}')
+    return options
+
+def launch_chrome(profile_dir: Optional[str] = None) -> webdriver.Chrome:
+    return webdriver.Chrome(service=Service(chromedriver_path()), options=chrome_options(profile_dir))
+
+def process_tree_rss_mb(pid: Optional[int]) -> Optional[float]:
+    """Resident memory of a process and all its descendants, from /proc (None where unavailable)"""
+    if not pid or not os.path.isdir('/proc'):
+        return None
+    children = {}
+    rss_pages = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))  # fields[1] is the parent pid
+        rss_pages[int(entry)] = int(fields[21])
+    
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss_pages.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+class PooledBrowser:
+    """One pool slot: a live driver plus its persistent profile directory"""
+    
+    def __init__(self, slot: int, driver, profile_dir: str):
+        self.slot = slot
+        self.driver = driver
+        self.profile_dir = profile_dir
+        self.uses = 0
+        self.created_at = time.time()
+        self.broken = False  # set when a WebDriverException escapes a checkout
+    
+    def rss_mb(self) -> Optional[float]:
+        service = getattr(self.driver, 'service', None)
+        process = getattr(service, 'process', None)
+        return process_tree_rss_mb(getattr(process, 'pid', None))
+    
+    def is_healthy(self) -> bool:
+        if self.broken:
+            return False
+        try:
+            self.driver.execute_script('return 1')
+            return True
+        except WebDriverException:
+            return False
+    
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+class BrowserPool:
+    """Fixed number of warm browsers handed out with acquire(); browsers are health-checked on
+    checkout and recycled after max_uses checkouts or once they exceed max_rss_mb"""
+    
+    def __init__(self, size: int = BrowserPoolConfig.SIZE, max_uses: int = BrowserPoolConfig.MAX_USES,
+                 max_rss_mb: Optional[float] = BrowserPoolConfig.MAX_RSS_MB,
+                 profile_root: str = BrowserPoolConfig.PROFILE_ROOT,
+                 launch: Callable[[Optional[str]], object] = launch_chrome):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self.profile_root = profile_root
+        self.launch = launch
+        self._idle: "queue.Queue[PooledBrowser]" = queue.Queue()
+        self._browsers: List[PooledBrowser] = []
+        self._lock = threading.Lock()
+        self._started = False
+        self.stats = {"launches": 0, "recycled": 0, "checkouts": 0}
+    
+    def start(self):
+        """Launch every slot up front (otherwise done lazily by the first acquire)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for slot in range(self.size):
+                browser = self._launch(slot)
+                self._browsers.append(browser)
+                self._idle.put(browser)
+    
+    def _launch(self, slot: int) -> PooledBrowser:
+        profile_dir = os.path.join(self.profile_root, f'slot-{slot}')
+        os.makedirs(profile_dir, exist_ok=True)
+        browser = PooledBrowser(slot, self.launch(profile_dir), profile_dir)
+        self.stats["launches"] += 1
+        return browser
+    
+    def _recycle(self, browser: PooledBrowser) -> PooledBrowser:
+        """Replace a browser in the same slot; the profile (and its cookies) carries over"""
+        browser.quit()
+        replacement = self._launch(browser.slot)  # if this raises, the old entry stays and is retried
+        with self._lock:
+            self._browsers[self._browsers.index(browser)] = replacement
+            self.stats["recycled"] += 1
+        return replacement
+    
+    def _needs_recycle(self, browser: PooledBrowser) -> bool:
+        if browser.uses >= self.max_uses:
+            return True
+        if self.max_rss_mb is not None:
+            rss = browser.rss_mb()
+            return rss is not None and rss > self.max_rss_mb
+        return False
+    
+    @contextmanager
+    def acquire(self, timeout: float = BrowserPoolConfig.ACQUIRE_TIMEOUT) -> Iterator[PooledBrowser]:
+        """Check out a healthy browser for the duration of the with-block"""
+        self.start()
+        try:
+            browser = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No browser free after {timeout}s (pool size {self.size})")
+        
+        try:
+            if not browser.is_healthy():
+                browser = self._recycle(browser)
+            self.stats["checkouts"] += 1
+            browser.uses += 1
+            yield browser
+        except TimeoutException:
+            raise  # an explicit wait gave up; the browser itself is fine (is_healthy checks next time)
+        except WebDriverException:
+            browser.broken = True
+            raise
+        finally:
+            try:
+                if browser.broken or self._needs_recycle(browser):
+                    browser = self._recycle(browser)
+            finally:
+                self._idle.put(browser)
+    
+    def close(self):
+        """Quit every browser; the pool can be started again afterwards"""
+        with self._lock:
+            browsers, self._browsers = self._browsers, []
+            self._started = False
+            self._idle = queue.Queue()
+        for browser in browsers:
+            browser.quit()
+    
+    def __enter__(self) -> 'BrowserPool':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
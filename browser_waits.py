@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Explicit waits for the browser automation, built on WebDriverWait/expected_conditions
+Each wait is a named step with its own timeout; WaitStats records how long every step actually
+took (and how often it timed out) so slow pages show up in /stats instead of as fixed sleeps.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+class WaitConfig:
+    PAGE_TIMEOUT = float(os.getenv('WAIT_PAGE_TIMEOUT', '20'))  # document.readyState == complete
+    SELECTOR_TIMEOUT = float(os.getenv('WAIT_SELECTOR_TIMEOUT', '15'))  # elements present / clickable
+    LOGIN_TIMEOUT = float(os.getenv('WAIT_LOGIN_TIMEOUT', '30'))  # session cookie set or redirected off the login page
+    NETWORK_IDLE_TIMEOUT = float(os.getenv('WAIT_NETWORK_IDLE_TIMEOUT', '8'))
+    NETWORK_IDLE_MS = 500  # no new resource loads for this long counts as idle
+    POLL_SECONDS = 0.1
+    SAMPLES_PER_STEP = 200
+
+class WaitStats:
+    """Thread-safe per-step wait durations"""
+    
+    def __init__(self, samples: int = WaitConfig.SAMPLES_PER_STEP):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._durations: Dict[str, deque] = {}
+        self._timeouts: Dict[str, int] = {}
+    
+    def record(self, step: str, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self._durations.setdefault(step, deque(maxlen=self.samples)).append(seconds)
+            self._timeouts[step] = self._timeouts.get(step, 0) + timed_out
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """count, timeouts, mean/p95/max/last seconds per step over the recent samples"""
+        with self._lock:
+            steps = {step: list(durations) for step, durations in self._durations.items()}
+            timeouts = dict(self._timeouts)
+        summary = {}
+        for step, durations in steps.items():
+            ordered = sorted(durations)
+            summary[step] = {
+                "count": len(durations),
+                "timeouts": timeouts.get(step, 0),
+                "mean": round(sum(durations) / len(durations), 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+                "max": round(ordered[-1], 3),
+                "last": round(durations[-1], 3),
+            }
+        return summary
+
+def document_ready(driver) -> bool:
+    return driver.execute_script("return document.readyState") == "complete"
+
+def cookie_present(name: str) -> Callable:
+    def condition(driver):
+        return driver.get_cookie(name) is not None
+    return condition
+
+def left_page(url_fragment: str) -> Callable:
+    """The browser has navigated away from a URL containing url_fragment (e.g. a login redirect)"""
+    def condition(driver):
+        return url_fragment not in driver.current_url
+    return condition
+
+def network_idle(idle_ms: int = WaitConfig.NETWORK_IDLE_MS) -> Callable:
+    """No new entries in the Resource Timing buffer for idle_ms, checked from the page's own clock"""
+    state = {"count": -1, "since": 0.0}
+    
+    def condition(driver):
+        count, now = driver.execute_script(
+            "return [performance.getEntriesByType('resource').length, performance.now()]")
+        if count != state["count"]:
+            state["count"], state["since"] = count, now
+            return False
+        return now - state["since"] >= idle_ms
+    return condition
+
+class PageWaiter:
+    """Named, timed explicit waits for one driver"""
+    
+    def __init__(self, driver, stats: Optional[WaitStats] = None, poll: float = WaitConfig.POLL_SECONDS):
+        self.driver = driver
+        self.stats = stats if stats is not None else WaitStats()
+        self.poll = poll
+    
+    def until(self, step: str, condition: Callable, timeout: float, message: str = ""):
+        """WebDriverWait(...).until(condition), recording the elapsed time under step"""
+        start = time.perf_counter()
+        try:
+            result = WebDriverWait(self.driver, timeout, poll_frequency=self.poll,
+                                   ignored_exceptions=(WebDriverException,)).until(condition, message)
+        except TimeoutException:
+            self.stats.record(step, time.perf_counter() - start, timed_out=True)
+            raise TimeoutException(message or f"{step} not ready after {timeout}s")
+        self.stats.record(step, time.perf_counter() - start)
+        return result
+    
+    def page_ready(self, step: str, timeout: float = WaitConfig.PAGE_TIMEOUT):
+        return self.until(step, document_ready, timeout)
+    
+    def elements(self, step: str, by: str, value: str,
+                 timeout: float = WaitConfig.SELECTOR_TIMEOUT) -> List:
+        """All elements matching the locator, once at least one is present"""
+        return self.until(step, EC.presence_of_all_elements_located((by, value)), timeout)
+    
+    def visible(self, step: str, by: str, value: str, timeout: float = WaitConfig.SELECTOR_TIMEOUT):
+        return self.until(step, EC.visibility_of_element_located((by, value)), timeout)
+    
+    def clickable(self, step: str, by: str, value: str, timeout: float = WaitConfig.SELECTOR_TIMEOUT):
+        return self.until(step, EC.element_to_be_clickable((by, value)), timeout)
+    
+    def network_idle(self, step: str, timeout: float = WaitConfig.NETWORK_IDLE_TIMEOUT,
+                     idle_ms: int = WaitConfig.NETWORK_IDLE_MS) -> bool:
+        """Best effort: False instead of raising when the page never settles (polling, video)"""
+        try:
+            self.until(step, network_idle(idle_ms), timeout)
+            return True
+        except TimeoutException:
+            return False
+    
+    def login_complete(self, step: str, session_cookie: str, login_url_fragment: str,
+                       timeout: float = WaitConfig.LOGIN_TIMEOUT) -> bool:
+        """Session cookie issued or redirected off the login page; False on timeout"""
+        try:
+            self.until(step, EC.any_of(cookie_present(session_cookie), left_page(login_url_fragment)), timeout)
+            return True
+        except TimeoutException:
+            return False
@@ -5,6 +5,7 @@ Demonstrates key features without requiring user interaction
 """
 
 import os
+from itertools import islice
 from viral_ai_agent import ViralAIAgent, Config
 
 def demo_without_api_key():
@@ -40,15 +41,13 @@ def demo_without_api_key():
     
     # Show viral videos
     print("\n🎬 Viral Videos Found")
-    videos = agent.scan_viral_content()
-    for video in videos[:3]:
+    for video in islice(agent.scan_viral_content(), 3):
         print(f"  • {video.title}")
         print(f"    {video.platform} | {video.views:,} views | AI Score: {video.ai_score}/100")
     
     # Show generated scripts
     print("\n📝 Generated Scripts")
-    scripts = agent.db.get_scripts()
-    for script in scripts[:2]:
+    for script in islice(agent.db.iter_scripts(), 2):
         print(f"  • {script.title}")
         print(f"    {script.content_type} | {script.video_length} | {script.target_audience}")
     
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stand-in for the chat-completions API
+Returns deterministic responses shaped like the ones AIAgent and app.py expect, with
+configurable latency, error rates, 429s and streaming. Standard library only, runs offline.
+
+    python fake_openai_server.py --port 8089 --latency-ms 300 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python viral_ai_agent.py
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+@dataclass
+class FakeServerConfig:
+    latency_ms: float = 200.0  # median response time
+    latency_dist: str = "lognormal"  # fixed, uniform (0.5x-1.5x) or lognormal
+    latency_sigma: float = 0.5  # lognormal spread; p99 is roughly 3.2x the median at 0.5
+    error_rate: float = 0.0  # fraction of requests answered with a 500
+    rate_limit_rate: float = 0.0  # fraction of requests answered with a 429
+    retry_after_ms: int = 50
+    stream_chunk_chars: int = 24
+    rpm_limit: int = 10000
+    tpm_limit: int = 2000000
+    seed: int = 0
+
+class FakeOpenAI:
+    """Request accounting and response synthesis, shared by the handler threads"""
+    
+    def __init__(self, config: FakeServerConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "rate_limited": 0, "streamed": 0}
+    
+    def latency(self) -> float:
+        base = self.config.latency_ms / 1000
+        with self.lock:
+            if self.config.latency_dist == "fixed":
+                return base
+            if self.config.latency_dist == "uniform":
+                return self.rng.uniform(0.5 * base, 1.5 * base)
+            return base * self.rng.lognormvariate(0, self.config.latency_sigma)
+    
+    def fault(self) -> Optional[int]:
+        """Status code to fail this request with, if any"""
+        with self.lock:
+            self.counts["requests"] += 1
+            roll = self.rng.random()
+            if roll < self.config.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return 429
+            if roll < self.config.rate_limit_rate + self.config.error_rate:
+                self.counts["errors"] += 1
+                return 500
+            return None
+    
+    def rate_limit_headers(self) -> Dict[str, str]:
+        return {
+            "x-ratelimit-limit-requests": str(self.config.rpm_limit),
+            "x-ratelimit-remaining-requests": str(self.config.rpm_limit - 1),
+            "x-ratelimit-reset-requests": "6ms",
+            "x-ratelimit-limit-tokens": str(self.config.tpm_limit),
+            "x-ratelimit-remaining-tokens": str(self.config.tpm_limit - 1000),
+            "x-ratelimit-reset-tokens": "30ms",
+        }
+
+def _score(text: str, salt: str = "") -> int:
+    """Deterministic 40-99 score so repeated prompts get identical answers"""
+    return 40 + int(hashlib.sha256((salt + text).encode()).hexdigest(), 16) % 60
+
+def _analysis(text: str) -> Dict[str, Any]:
+    return {
+        "score": _score(text),
+        "engagement_quality": ("low", "medium", "high")[_score(text, "quality") % 3],
+        "content_themes": ["passive income", "AI tools"],
+        "success_factors": ["specific income numbers", "personal story"],
+        "recommendations": ["Lead with the result", "Pin a comment with the link"],
+    }
+
+def _script(text: str) -> Dict[str, Any]:
+    hook = "I almost quit affiliate marketing until one tool changed everything."
+    sections = {
+        "hook": hook,
+        "problem": "Most beginners post every day and still make nothing.",
+        "solution": "Build one simple funnel and let automation follow up for you.",
+        "proof": f"Last month that funnel brought in ${_score(text) * 41:,} in commissions.",
+        "cta": "Follow for the exact setup and comment FUNNEL for the link.",
+    }
+    return {
+        "title": f"How I Make ${_score(text) * 41:,}/Month With One Funnel",
+        **sections,
+        "full_script": " ".join(sections.values()),
+        "hashtags": ["#affiliatemarketing", "#passiveincome", "#aitools"],
+        "estimated_engagement": _score(text, "engagement") % 20,
+    }
+
+def completion_content(messages: List[Dict[str, str]]) -> str:
+    """Answer in the shape the caller's prompt asks for"""
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "").lower()
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    
+    packed = re.search(r'Items: (\[.*\])', user)
+    if packed:
+        items = json.loads(packed.group(1))
+        if "authenticity" in system:
+            results = [{"id": item["id"], "score": _score(item.get("content", ""))} for item in items]
+        else:
+            results = [{"id": item["id"], **_analysis(item.get("transcript", ""))} for item in items]
+        return json.dumps({"results": results})
+    if "analyzing viral content" in system:
+        return json.dumps(_analysis(user))
+    if "scripts" in system:
+        return json.dumps(_script(user))
+    if "authenticity" in system:
+        return str(_score(user))
+    return f"This one habit made me ${_score(user) * 12:,} last month 💰 #sidehustle"
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body are separate writes; avoid delayed-ACK stalls on reused connections
+    fake: FakeOpenAI = None  # set per server by start_server
+    
+    def log_message(self, format, *args):
+        pass  # quiet by default; load tests would drown in access logs
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+        
+        delay = self.fake.latency()
+        status = self.fake.fault()
+        if status == 429:
+            time.sleep(delay * 0.1)
+            return self._json(429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                              "code": "rate_limit_exceeded"}},
+                              {"retry-after-ms": str(self.fake.config.retry_after_ms)})
+        if status:
+            time.sleep(delay)
+            return self._json(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+        
+        content = completion_content(body.get("messages", []))
+        model = body.get("model", "gpt-4o")
+        if body.get("stream"):
+            return self._stream(content, model, delay)
+        
+        time.sleep(delay)
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        self._json(200, {
+            "id": f"chatcmpl-fake-{self.fake.counts['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }, self.fake.rate_limit_headers())
+    
+    def _json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _stream(self, content: str, model: str, delay: float):
+        """Server-sent events: first chunk after ~30% of the latency, the rest spread over the remainder"""
+        with self.fake.lock:
+            self.fake.counts["streamed"] += 1
+        size = self.fake.config.stream_chunk_chars
+        pieces = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        for name, value in self.fake.rate_limit_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+        
+        time.sleep(delay * 0.3)
+        base = {"id": "chatcmpl-fake-stream", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        for piece in pieces:
+            self._event({**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+            time.sleep(delay * 0.7 / len(pieces))
+        self._event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+    
+    def _event(self, payload: Dict[str, Any]):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+        self.wfile.flush()
+
+def start_server(config: Optional[FakeServerConfig] = None, host: str = "127.0.0.1",
+                 port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve on a background thread; returns the server and its base_url (port 0 picks a free port)"""
+    handler = type("BoundFakeOpenAIHandler", (FakeOpenAIHandler,), {"fake": FakeOpenAI(config or FakeServerConfig())})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+def parse_args(argv: Optional[List[str]] = None) -> Tuple[argparse.Namespace, FakeServerConfig]:
+    defaults = FakeServerConfig()
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat-completions stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--latency-dist", choices=("fixed", "uniform", "lognormal"), default=defaults.latency_dist)
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--retry-after-ms", type=int, default=defaults.retry_after_ms)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args(argv)
+    config = FakeServerConfig(latency_ms=args.latency_ms, latency_dist=args.latency_dist,
+                              latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                              rate_limit_rate=args.rate_limit_rate, retry_after_ms=args.retry_after_ms,
+                              seed=args.seed)
+    return args, config
+
+def main():
+    args, config = parse_args()
+    server, base_url = start_server(config, args.host, args.port)
+    print(f"Fake OpenAI server listening on {base_url}")
+    print(f"Point the agent at it with: OPENAI_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("Stopped.")
+
+if __name__ == "__main__":
+    main()
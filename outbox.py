@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Drains the durable post_outbox table with one publisher per platform, all platforms concurrently
+Delivery is at-least-once: a post is acknowledged only after its publisher returns True, and a
+claim whose worker died is re-delivered once its lease expires. Every successful delivery is
+recorded durably (even a late one), so a re-claimed post that already went out is acknowledged
+without publishing it again; publishers also get the row's idempotency key for platform-side dedup.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from viral_ai_agent import Config, DatabaseManager
+
+Publisher = Callable[[str, str], bool]  # (content, idempotency_key) -> delivered
+
+@dataclass
+class DrainResult:
+    platform: str
+    sent: int = 0
+    retried: int = 0
+    dead: int = 0
+    stale: int = 0  # results for claims whose lease had expired; the newer claim owns the post
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+class OutboxPublisher:
+    """Runs every platform's drain on its own worker thread, so a drain takes as long as the slowest
+    platform rather than the sum of them"""
+    
+    def __init__(self, db: DatabaseManager, publishers: Dict[str, Publisher],
+                 max_attempts: int = Config.OUTBOX_MAX_ATTEMPTS,
+                 base_delay: float = Config.OUTBOX_RETRY_BASE_DELAY,
+                 max_delay: float = Config.OUTBOX_RETRY_MAX_DELAY,
+                 lease_seconds: float = Config.OUTBOX_LEASE_SECONDS):
+        self.db = db
+        self.publishers = publishers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def platforms(self) -> List[str]:
+        return list(self.publishers)
+    
+    def enqueue(self, content: str, platforms: Optional[List[str]] = None) -> List[str]:
+        """Queue content for the given (default: every) platform; re-queuing the same content is a no-op"""
+        return self.db.enqueue_posts(content, self.platforms if platforms is None else platforms)
+    
+    def retry_delay(self, attempts: int) -> float:
+        """Exponential backoff with equal jitter, like ApiGuard's"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    def drain(self, max_posts: Optional[int] = None) -> Dict[str, DrainResult]:
+        """Deliver every due post (up to max_posts per platform), all platforms in parallel"""
+        if not self.publishers:
+            return {}
+        pool = self._pool()
+        futures = {platform: pool.submit(self.drain_platform, platform, max_posts) for platform in self.publishers}
+        return {platform: future.result() for platform, future in futures.items()}
+    
+    def _pool(self) -> ThreadPoolExecutor:
+        """One long-lived worker per platform, so repeated drains reuse threads (and their DB connections)"""
+        with self._lock:
+            if self._executor is None or self._workers < len(self.publishers):  # publishers can be added later
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._workers = len(self.publishers)
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="outbox")
+            return self._executor
+    
+    def close(self):
+        """Stop the drain workers; a later drain starts new ones"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def __enter__(self) -> 'OutboxPublisher':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def drain_platform(self, platform: str, max_posts: Optional[int] = None) -> DrainResult:
+        result = DrainResult(platform)
+        start = time.perf_counter()
+        publish = self.publishers[platform]
+        while max_posts is None or result.sent + result.retried + result.dead + result.stale < max_posts:
+            claimed = self.db.claim_posts(platform, 1, self.lease_seconds)
+            if not claimed:
+                break
+            post_id, key, content, attempts = claimed[0]
+            error = None
+            if not self.db.post_delivered(post_id):  # skip posts an unacknowledged attempt already delivered
+                try:
+                    if not publish(content, key):
+                        error = "publisher reported failure"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+            
+            if error is None:
+                if self.db.complete_post(post_id, attempts):
+                    result.sent += 1
+                else:
+                    result.stale += 1
+            elif attempts >= self.max_attempts:
+                if not self.db.fail_post(post_id, attempts, error, None):
+                    result.stale += 1
+                    continue
+                result.dead += 1
+                result.errors.append(error)
+                print(f"Dead-lettered {platform} post {post_id} after {attempts} attempts: {error}")
+            else:
+                if not self.db.fail_post(post_id, attempts, error, self.retry_delay(attempts)):
+                    result.stale += 1
+                    continue
+                result.retried += 1
+                result.errors.append(error)
+                # one failure is likely to repeat right away (session crashed, site down): retry later
+                break
+        result.elapsed = time.perf_counter() - start
+        return result
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Small job scheduler for the Flask automation: independent interval and cron jobs on a bounded pool
+A job never overlaps itself (a tick that finds it still running is skipped), start times get random
+jitter, and stop() takes effect immediately because the loop waits on an Event rather than sleeping.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set
+
+class CronSchedule:
+    """Five-field cron expression (minute hour day-of-month month day-of-week) in local time
+    Supports *, */n, a-b, a-b/n and comma lists; day-of-week 0 or 7 is Sunday."""
+    
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+    
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {len(fields)}: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(text, low, high) for text, (low, high) in zip(fields, self.RANGES))
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+    
+    @staticmethod
+    def _parse(text: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in text.split(","):
+            base, _, step = part.partition("/")
+            if base == "*":
+                start, end = low, high
+            elif "-" in base:
+                start, end = (int(v) for v in base.split("-", 1))
+            else:
+                start = end = int(base)
+                if step:
+                    end = high
+            if not (low <= start <= end <= high):
+                raise ValueError(f"Cron field {text!r} out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+    
+    def _day_matches(self, moment: datetime) -> bool:
+        in_month = moment.day in self.days
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays  # cron counts from Sunday
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week  # both restricted: cron matches either
+    
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Any]
+    interval: Optional[float] = None  # seconds between starts...
+    cron: Optional[CronSchedule] = None  # ...or a cron schedule
+    jitter: float = 0.0  # up to this many seconds added to each start
+    run_immediately: bool = False  # interval jobs: first run at start() instead of one interval later
+    next_run: Optional[float] = None  # epoch seconds
+    running: bool = False
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0  # ticks dropped because the previous run was still going
+    last_started: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_error: Optional[str] = None
+    last_result: Any = None
+    
+    def schedule_next(self, now: float, first: bool = False):
+        if self.cron is not None:
+            base = self.cron.next_after(datetime.fromtimestamp(now)).timestamp()
+        elif first and self.run_immediately:
+            base = now
+        else:
+            base = now + self.interval
+        self.next_run = base + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+    
+    def status(self) -> Dict[str, Any]:
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+        return {
+            "schedule": self.cron.expression if self.cron else f"every {self.interval:g}s",
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_run": iso(self.last_started),
+            "last_duration": None if self.last_duration is None else round(self.last_duration, 3),
+            "last_error": self.last_error,
+            "next_run": iso(self.next_run),
+        }
+
+class Scheduler:
+    """Runs registered jobs on a ThreadPoolExecutor of max_workers threads; start()/stop() can repeat"""
+    
+    def __init__(self, max_workers: int = 3, clock: Callable[[], float] = time.time):
+        self.max_workers = max_workers
+        self.clock = clock
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    def add_interval_job(self, name: str, func: Callable[[], Any], seconds: float, jitter: float = 0.0,
+                         run_immediately: bool = False) -> Job:
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        return self._add(Job(name, func, interval=seconds, jitter=jitter, run_immediately=run_immediately))
+    
+    def add_cron_job(self, name: str, func: Callable[[], Any], expression: str, jitter: float = 0.0) -> Job:
+        return self._add(Job(name, func, cron=CronSchedule(expression), jitter=jitter))
+    
+    def _add(self, job: Job) -> Job:
+        with self._lock:
+            if job.name in self.jobs:
+                raise ValueError(f"Job {job.name!r} already registered")
+            self.jobs[job.name] = job
+            if self.running:
+                job.schedule_next(self.clock(), first=True)
+        self._wake.set()
+        return job
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    @property
+    def stopping(self) -> bool:
+        """Long-running jobs can poll this to bail out early"""
+        return self._stop.is_set()
+    
+    def start(self) -> bool:
+        """Start the dispatcher thread; False if it was already running"""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            now = self.clock()
+            for job in self.jobs.values():
+                job.schedule_next(now, first=True)
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+        return True
+    
+    def stop(self, wait: float = 5.0):
+        """Stop dispatching now; jobs already running get up to `wait` seconds to finish"""
+        self._stop.set()
+        self._wake.set()
+        thread, executor = self._thread, self._executor
+        if thread is not None:
+            thread.join(timeout=wait)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            deadline = time.monotonic() + wait
+            while any(job.running for job in self.jobs.values()) and time.monotonic() < deadline:
+                time.sleep(0.05)
+    
+    def run_now(self, name: str) -> bool:
+        """Dispatch a job on the next loop tick (False if it is already running)"""
+        with self._lock:
+            job = self.jobs[name]
+            if job.running:
+                return False
+            job.next_run = self.clock()
+        self._wake.set()
+        return True
+    
+    def _loop(self):
+        while not self._stop.is_set():
+            now = self.clock()
+            with self._lock:
+                for job in self.jobs.values():
+                    if job.next_run is not None and job.next_run <= now:
+                        if job.running:
+                            job.skipped += 1
+                        else:
+                            job.running = True
+                            self._executor.submit(self._run, job).add_done_callback(
+                                lambda future, job=job: future.cancelled() and setattr(job, "running", False))
+                        job.schedule_next(now)
+                upcoming = [job.next_run for job in self.jobs.values() if job.next_run is not None]
+            timeout = max(0.0, min(upcoming) - self.clock()) if upcoming else None
+            self._wake.wait(timeout)
+            self._wake.clear()
+    
+    def _run(self, job: Job):
+        job.last_started = self.clock()
+        start = time.perf_counter()
+        try:
+            job.last_result = job.func()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = f"{type(e).__name__}: {e}"
+            print(f"Job {job.name} failed: {job.last_error}")
+        finally:
+            job.last_duration = time.perf_counter() - start
+            job.runs += 1
+            job.running = False
+    
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: job.status() for name, job in self.jobs.items()}
@@ -4,9 +4,21 @@ Test script for the Viral AI Agent Python conversion
 """
 
 import os
+import re
 import sys
+import json
+import asyncio
+import threading
+import builtins
+import openai
+import requests
 import sqlite3
-from viral_ai_agent import ViralAIAgent, Config, DatabaseManager
+from types import SimpleNamespace
+from fake_openai_server import FakeServerConfig, start_server
+from viral_ai_agent import (ViralAIAgent, AIAgent, Config, DatabaseManager, ResponseCache, ViralVideo,
+                            GeneratedScript, Analytics, SCHEMA_MIGRATIONS, AIServiceUnavailable, ApiGuard,
+                            AdaptiveConcurrency, CircuitBreaker, HeuristicScorer, RateLimiter, TokenBucket,
+                            compact_text, estimate_tokens, pack_items, parse_hashtags, parse_reset_duration)
 
 def test_database_setup():
     """Test database initialization"""
@@ -66,6 +78,1177 @@ def test_seed_data():
     except FileNotFoundError:
         pass
 
+def test_connection_layer():
+    """Test persistent connections and grouped transactions"""
+    print("\nTesting connection layer...")
+    db = DatabaseManager('test_viral_agent.db')
+    
+    assert db.connection() is db.connection()
+    journal_mode = db.connection().execute("PRAGMA journal_mode").fetchone()[0]
+    assert journal_mode == 'wal'
+    print(f"✓ Reusing one connection per thread (journal_mode={journal_mode})")
+    
+    with db.transaction():
+        db.insert_viral_video(ViralVideo(title="Grouped", platform="TikTok", url="https://tiktok.com/a"))
+        db.insert_viral_video(ViralVideo(title="Grouped", platform="TikTok", url="https://tiktok.com/b"))
+    
+    try:
+        with db.transaction():
+            db.insert_viral_video(ViralVideo(title="Rolled back", platform="TikTok", url="https://tiktok.com/c"))
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    
+    titles = [v.title for v in db.get_viral_videos()]
+    assert titles == ["Grouped", "Grouped"]
+    print("✓ Transactions commit grouped writes and roll back on error")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_bulk_ingest():
+    """Test chunked bulk inserts"""
+    print("\nTesting bulk ingest...")
+    db = DatabaseManager('test_viral_agent.db')
+    db.insert_viral_video(ViralVideo(title="Existing", platform="TikTok", url="https://tiktok.com/existing"))
+    
+    chunks = []
+    videos = (ViralVideo(title=f"Bulk {i}", platform="TikTok", url=f"https://tiktok.com/bulk{i}") for i in range(1250))
+    ids = db.insert_viral_videos_many(videos, chunk_size=500, on_chunk=chunks.append)
+    
+    assert len(ids) == 1250 and len(chunks) == 3
+    row = db.connection().execute("SELECT title FROM viral_videos WHERE id = ?", (ids[-1],)).fetchone()
+    assert row[0] == "Bulk 1249"
+    print(f"✓ Inserted {len(ids)} videos in {len(chunks)} chunks "
+          f"({chunks[0]['rows_per_second']:,.0f} rows/s first chunk)")
+    
+    script_ids = db.insert_scripts_many([GeneratedScript(title="Bulk", content="Body", content_type="AI Tools",
+                                                         video_length="60s", target_audience="All",
+                                                         template_type="tips-tricks")])
+    analytics_ids = db.insert_analytics_many(Analytics(platform="TikTok", views=i) for i in range(3))
+    assert len(script_ids) == 1 and len(analytics_ids) == 3
+    print("✓ Inserted scripts and analytics in bulk")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_keyset_readers():
+    """Test streaming keyset-paginated readers"""
+    print("\nTesting keyset readers...")
+    db = DatabaseManager('test_viral_agent.db')
+    db.insert_viral_videos_many(
+        ViralVideo(title=f"Video {i}", platform="TikTok" if i % 2 else "YouTube",
+                   url=f"https://example.com/{i}", ai_score=90 - (i // 3) * 5)
+        for i in range(10)
+    )
+    
+    streamed = [(v.ai_score, v.id) for v in db.iter_viral_videos(page_size=3)]
+    assert streamed == sorted(streamed, reverse=True) and len(set(streamed)) == 10
+    print(f"✓ Streamed {len(streamed)} videos in pages of 3 without gaps or repeats")
+    
+    tiktok = list(db.iter_viral_videos(page_size=2, platform="TikTok", min_score=80))
+    assert tiktok and all(v.platform == "TikTok" and v.ai_score >= 80 for v in tiktok)
+    assert db.count_viral_videos(platform="TikTok", min_score=80) == len(tiktok)
+    print(f"✓ Filtered stream returned {len(tiktok)} TikTok videos scoring 80+")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_schema_migrations():
+    """Test versioned migrations and hot query plans"""
+    print("\nTesting schema migrations...")
+    db = DatabaseManager('test_viral_agent.db')
+    
+    version = db.connection().execute("PRAGMA user_version").fetchone()[0]
+    assert version == SCHEMA_MIGRATIONS[-1][0]
+    assert db.migrate() == version
+    print(f"✓ Schema at version {version}, re-running migrations is a no-op")
+    
+    for name, result in db.check_query_plans().items():
+        assert result['uses_index'], f"{name}: {result['plan']}"
+        print(f"✓ {name} uses {result['index']}")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_dashboard_aggregates():
+    """Test SQL-side dashboard statistics"""
+    print("\nTesting dashboard aggregates...")
+    db = DatabaseManager('test_viral_agent.db')
+    db.seed_sample_data()
+    
+    stats = db.get_dashboard_aggregates()
+    videos = db.get_viral_videos()
+    assert stats['total_views'] == sum(v.views for v in videos)
+    assert stats['viral_videos_found'] == len([v for v in videos if v.ai_score > Config.VIRAL_SCORE_THRESHOLD])
+    assert stats['videos_created'] == len(db.get_scripts())
+    assert stats['monthly_revenue'] == 5600
+    print(f"✓ Aggregates match row-by-row totals (revenue ${stats['monthly_revenue']:,})")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_dashboard_counters():
+    """Test trigger-maintained dashboard counters"""
+    print("\nTesting dashboard counters...")
+    db = DatabaseManager('test_viral_agent.db')
+    db.seed_sample_data()
+    
+    conn = db.connection()
+    conn.execute("UPDATE viral_videos SET views = views + 1000, ai_score = 50 WHERE id = (SELECT MIN(id) FROM viral_videos)")
+    conn.execute("DELETE FROM generated_scripts WHERE id = (SELECT MIN(id) FROM generated_scripts)")
+    db.insert_analytics_many([Analytics(platform="TikTok", revenue=400, conversion_rate=2.0)])
+    
+    def rounded(stats):
+        return {key: round(value, 6) for key, value in stats.items()}
+    
+    assert rounded(db.get_dashboard_counters()) == rounded(db.get_dashboard_aggregates())
+    print("✓ Counters track inserts, updates and deletes")
+    
+    tiktok = db.get_dashboard_counters(platform="TikTok")
+    views, engagement, viral = conn.execute(
+        "SELECT SUM(views), AVG(engagement_rate), SUM(ai_score > ?) FROM viral_videos WHERE platform = 'TikTok'",
+        (Config.VIRAL_SCORE_THRESHOLD,)).fetchone()
+    assert (tiktok['total_views'], tiktok['viral_videos_found']) == (views, viral)
+    assert round(tiktok['avg_engagement'], 6) == round(engagement, 6)
+    assert tiktok['monthly_revenue'] == 2800 and tiktok['videos_created'] is None
+    assert db.get_dashboard_counters(platform="Snapchat")['total_views'] == 0
+    print(f"✓ Per-platform counters: TikTok revenue ${tiktok['monthly_revenue']:,}, no platform-less script count")
+    
+    conn.execute("UPDATE dashboard_counters SET total_views = 0")
+    db.rebuild_counters()
+    assert rounded(db.get_dashboard_counters()) == rounded(db.get_dashboard_aggregates())
+    print("✓ rebuild_counters() recovers from drift")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_full_text_search():
+    """Test FTS5 search over videos and scripts"""
+    print("\nTesting full-text search...")
+    db = DatabaseManager('test_viral_agent.db')
+    db.seed_sample_data()
+    
+    hits = db.search("passive income")
+    assert hits.videos and hits.scripts
+    assert all(hit.kind == "video" for hit in hits.videos) and all(hit.kind == "script" for hit in hits.scripts)
+    for group in (hits.videos, hits.scripts):
+        assert group == sorted(group, key=lambda hit: hit.bm25)
+    print(f"✓ 'passive income' matched {len(hits.videos)} videos and {len(hits.scripts)} scripts, ranked per table")
+    
+    limited = db.search("passive income", limit=1)
+    assert limited.videos == hits.videos[:1] and limited.scripts == hits.scripts[:1]
+    print("✓ The limit applies to each kind, so one table's scores can't crowd out the other")
+    
+    youtube = db.search("wealth", platform="YouTube")
+    assert youtube.videos and not youtube.scripts
+    assert all(hit.platform == "YouTube" for hit in youtube.videos)
+    print(f"✓ Platform filter returned {len(youtube.videos)} YouTube hits")
+    
+    assert db.search("$8,600")
+    db.connection().execute("DELETE FROM viral_videos")
+    remaining = db.search("passive income")
+    assert not remaining.videos and remaining.scripts
+    print("✓ Literal fallback and delete sync work")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_hashtag_index():
+    """Test normalized hashtag tables and trend queries"""
+    print("\nTesting hashtag index...")
+    db = DatabaseManager('test_viral_agent.db')
+    db.seed_sample_data()
+    db.insert_viral_video(ViralVideo(title="Tagged", platform="TikTok", url="https://tiktok.com/tagged",
+                                     ai_score=70, hashtags="#PassiveIncome #newtag"))
+    
+    top = db.top_hashtags()
+    assert top[0] == {"tag": "#makemoneywithai", "videos": 3}
+    assert {"tag": "#passiveincome", "videos": 3} in top
+    print(f"✓ Top hashtag this week: {top[0]['tag']} ({top[0]['videos']} videos)")
+    
+    tiktok = db.top_hashtags(window=None, platform="TikTok", limit=3)
+    assert all(entry['videos'] <= 3 for entry in tiktok)
+    
+    both = db.videos_with_tags(all_of=["#passiveincome", "#sidehustle"])
+    assert [v.title for v in both] == ["How I Make $8,600/Month in Passive Income (Work 2 Hours Daily)"]
+    either = db.videos_with_tags(any_of=["#chatgpt", "newtag"])
+    assert [v.ai_score for v in either] == [91, 70]
+    mixed = db.videos_with_tags(all_of=["#passiveincome"], any_of=["#investing", "#newtag"])
+    assert len(mixed) == 2
+    print("✓ all_of / any_of tag queries return the expected videos")
+    
+    tagged_id = db.upsert_viral_video(ViralVideo(title="Tagged again", platform="TikTok",
+                                                 url="https://tiktok.com/tagged?utm_source=share",
+                                                 hashtags="#rescantag"))
+    assert [v.id for v in db.videos_with_tags(any_of=["#newtag"])] == [tagged_id]
+    assert db.videos_with_tags(any_of=["#rescantag"]) == []
+    print("✓ A re-scanned URL keeps the links of its stored hashtags")
+    
+    raw = sqlite3.connect('test_viral_agent.db')  # any client, not just DatabaseManager
+    with raw:
+        raw.execute("UPDATE viral_videos SET hashtags = ? WHERE id = ?",
+                    ('#Retagged,#PassiveIncome\t# "quoted"  ##double retagged', tagged_id))
+    raw.close()
+    assert db.videos_with_tags(any_of=["#newtag"]) == []
+    assert [v.id for v in db.videos_with_tags(all_of=["#retagged", "#passiveincome"])] == [tagged_id]
+    linked = [tag for tag, in db.connection().execute(
+        "SELECT h.tag FROM video_hashtags vh JOIN hashtags h ON h.id = vh.hashtag_id WHERE vh.video_id = ?",
+        (tagged_id,))]
+    assert sorted(linked) == sorted(parse_hashtags('#Retagged,#PassiveIncome\t# "quoted"  ##double retagged'))
+    print("✓ Updating viral_videos.hashtags from any SQLite client relinks the video like parse_hashtags")
+    
+    db.connection().execute("DELETE FROM viral_videos")
+    assert db.top_hashtags() == []
+    print("✓ Deleting videos clears their hashtag links")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_projected_rows():
+    """Test slotted row models, column projection and lazy text fields"""
+    print("\nTesting projected rows...")
+    db = DatabaseManager('test_viral_agent.db')
+    db.seed_sample_data()
+    
+    statements = []
+    db.connection().set_trace_callback(statements.append)
+    videos = db.get_viral_videos(columns=['title', 'views'])
+    assert not hasattr(videos[0], '__dict__')
+    assert 'audio_transcript' not in statements[-1]
+    print(f"✓ Projected {len(videos)} videos without loading transcripts")
+    
+    statements.clear()
+    assert videos[0].audio_transcript == "Hey everyone, so I know this sounds crazy..."
+    assert len(statements) == 1
+    _ = videos[0].audio_transcript
+    assert len(statements) == 1
+    print("✓ Transcript loaded once on first access")
+    
+    scripts = db.get_scripts(columns=['title'])
+    assert scripts[0].content.startswith("🎯 Hook")
+    try:
+        db.get_scripts(columns=['nope'])
+        assert False, "unknown column accepted"
+    except ValueError:
+        print("✓ Unknown projection columns are rejected")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_video_dedup():
+    """Test URL upserts and near-duplicate transcript detection"""
+    print("\nTesting video dedup...")
+    db = DatabaseManager('test_viral_agent.db')
+    db.seed_sample_data()
+    
+    first_id = db.get_viral_videos()[0].id
+    upserted_id = db.upsert_viral_video(ViralVideo(title="Rescan", platform="TikTok",
+                                                   url="https://www.TikTok.com/sample1/?utm_source=share",
+                                                   views=1300000, engagement_rate=13.0))
+    refreshed = db.get_viral_videos()[0]
+    assert upserted_id == first_id and db.count_viral_videos() == 5
+    assert (refreshed.views, refreshed.engagement_rate, refreshed.title) == (1300000, 13.0, "How I Make $8,600/Month in Passive Income (Work 2 Hours Daily)")
+    print("✓ Re-scanned URL refreshed views/engagement instead of inserting a row")
+    
+    ids = db.insert_viral_videos_many([
+        ViralVideo(title="Repost", platform="Instagram", url="https://instagram.com/repost",
+                   captions="Lost my waitressing job during pandemic. Now I make $8,600/month with affiliate marketing...",
+                   audio_transcript="Hey everyone, so I know this sounds crazy..."),
+        ViralVideo(title="Repost again", platform="Instagram", url="https://instagram.com/repost?igsh=abc", views=10),
+    ])
+    assert ids[0] == ids[1]
+    repost = next(v for v in db.get_viral_videos() if v.id == ids[0])
+    assert repost.duplicate_of == first_id and repost.views == 10
+    assert db.count_viral_videos(include_duplicates=False) == 5
+    print(f"✓ Cross-platform repost flagged as duplicate of video {repost.duplicate_of}")
+    
+    matches = db.find_near_duplicates("Lost my waitressing job during pandemic. Now I make $8,600/month "
+                                      "with affiliate marketing... Hey everyone, so I know this sounds crazy...")
+    assert [video_id for video_id, _ in matches] == [first_id, ids[0]]
+    print(f"✓ find_near_duplicates returned {len(matches)} matches")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def raw_completion(content, headers=None):
+    """Shape of an OpenAI with_raw_response result: headers plus parse()"""
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    return SimpleNamespace(headers=headers or {}, parse=lambda: completion)
+
+class FakeChatClient:
+    """Stand-in for the OpenAI client that returns a canned chat completion"""
+    
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self.create, with_raw_response=SimpleNamespace(create=self.create)))
+    
+    def create(self, **request):
+        self.calls += 1
+        return raw_completion(self.content)
+
+def test_response_cache():
+    """Test the two-tier LLM response cache"""
+    print("\nTesting response cache...")
+    db = DatabaseManager('test_viral_agent.db')
+    agent = AIAgent("test-key-123", cache=ResponseCache(db), db=db)
+    agent.client = FakeChatClient("87")
+    
+    assert agent.score_content_authenticity("I made $3,200 this week") == 87
+    assert agent.score_content_authenticity("I made $3,200 this week") == 87
+    assert agent.client.calls == 1 and agent.cache.stats()['memory_hits'] == 1
+    print("✓ Repeat call served from the in-process LRU")
+    
+    agent.cache = ResponseCache(db)
+    assert agent.score_content_authenticity("I made $3,200 this week") == 87
+    assert agent.client.calls == 1 and agent.cache.stats()['disk_hits'] == 1
+    print("✓ Fresh process served from the SQLite tier")
+    
+    agent.score_content_authenticity("I made $3,200 this week", use_cache=False)
+    assert agent.client.calls == 2
+    print("✓ use_cache=False bypasses the cache")
+    
+    small = ResponseCache(db, max_memory_entries=2, max_rows=3)
+    for i in range(5):
+        small.set(f"key{i}", "score_content_authenticity", str(i))
+    small.evict()
+    assert small.stats()['memory_entries'] == 2
+    assert db.connection().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 3
+    assert small.get("key0") is None and small.get("key4") == "4"
+    print("✓ Both tiers are size-bounded with LRU eviction")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+class FakeAsyncChatClient:
+    """Async stand-in for AsyncOpenAI that records how many requests run at once"""
+    
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.closed = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self.create, with_raw_response=SimpleNamespace(create=self.create)))
+    
+    async def create(self, **request):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            content = self.respond(request['messages'][-1]['content'])
+        finally:
+            self.in_flight -= 1
+        return raw_completion(content)
+    
+    async def close(self):
+        self.closed = True
+
+def test_batch_analysis():
+    """Test concurrent batch analysis with bounded parallelism"""
+    print("\nTesting batch analysis...")
+    db = DatabaseManager('test_viral_agent.db')
+    agent = AIAgent("test-key-123", cache=ResponseCache(db), use_cache=False, db=db)
+    fake = FakeAsyncChatClient(
+        lambda prompt: "not json" if "broken" in prompt else json.dumps({"score": 70 + prompt.count("x")})
+    )
+    agent.async_client_factory = lambda: fake
+    
+    videos = [ViralVideo(title=f"Video {i}", platform="tiktok", url=f"https://example.com/batch/{i}",
+                         audio_transcript="broken" if i == 5 else "x" * i)
+              for i in range(12)]
+    db.insert_viral_videos_many(videos)
+    videos = list(db.iter_viral_videos(status="discovered"))
+    
+    results = asyncio.run(agent.analyze_many(videos, concurrency=4))
+    assert fake.max_in_flight == 4
+    print("✓ In-flight requests are bounded by the concurrency limit")
+    
+    assert [result.index for result in results] == list(range(12))
+    failed = [result for result in results if not result.ok]
+    assert len(failed) == 1 and failed[0].item.audio_transcript == "broken"
+    print("✓ Results keep input order and one failure does not sink the batch")
+    
+    rows = dict(db.connection().execute("SELECT url, ai_score FROM viral_videos WHERE status = 'analyzed'").fetchall())
+    assert len(rows) == 11 and rows["https://example.com/batch/3"] == 73
+    print("✓ Successful scores written back in one transaction")
+    
+    scores = asyncio.run(agent.score_many(["101", "88"], ordered=False))
+    assert sorted(result.index for result in scores) == [0, 1]
+    print("✓ Unordered batches return as requests complete")
+    
+    agent.guard = ApiGuard(concurrency=AdaptiveConcurrency(2))
+    fake.max_in_flight = 0
+    asyncio.run(agent.analyze_many(videos, concurrency=6))
+    assert fake.max_in_flight == 6 and agent.guard.concurrency.max_limit == 6
+    print("✓ A caller's concurrency above the guard's cap raises the cap")
+    
+    async def wait_for_slot(concurrency):
+        waiter = asyncio.ensure_future(concurrency.aacquire())
+        await asyncio.sleep(0.05)
+        parked = len(concurrency._async_waiters)
+        threading.Timer(0.01, concurrency.release).start()  # released from another thread
+        await asyncio.wait_for(waiter, 1)
+        return parked
+    
+    limited = AdaptiveConcurrency(1)
+    limited.acquire()
+    assert asyncio.run(wait_for_slot(limited)) == 1 and limited.in_flight == 1
+    print("✓ Async waiters park until a slot is released instead of polling")
+    
+    clients = []
+    def new_client():
+        clients.append(FakeAsyncChatClient(lambda prompt: json.dumps({"score": 80})))
+        return clients[-1]
+    agent.async_client_factory = new_client
+    for _ in range(2):  # each asyncio.run is a new event loop
+        asyncio.run(agent.score_many(["one", "two", "three"], pack_size=2))
+    assert len(clients) == 2 and all(client.closed for client in clients) and not agent._async_clients
+    print("✓ Each loop's client is closed on that loop once its batches finish")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status} error", response=response)
+
+def test_api_guard():
+    """Test rate limiting, retries and the circuit breaker around API calls"""
+    print("\nTesting API guard...")
+    sleeps = []
+    guard = ApiGuard(RateLimiter(requests_per_minute=60, tokens_per_minute=10000),
+                     CircuitBreaker(failure_threshold=3, reset_timeout=30),
+                     AdaptiveConcurrency(8), max_retries=4, sleep=sleeps.append)
+    
+    outcomes = [http_error(429, {'retry-after': '2'}), http_error(503), "ok"]
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(headers={'x-ratelimit-limit-requests': '120',
+                                        'x-ratelimit-remaining-requests': '119',
+                                        'x-ratelimit-reset-requests': '500ms'})
+    
+    guard.call(flaky, tokens=100)
+    assert len(sleeps) == 2 and sleeps[0] >= 2.0
+    assert guard.concurrency.limit < 8 and guard.limiter.requests.capacity == 120
+    print("✓ 429/503 retried with backoff honoring retry-after; 429 halves concurrency")
+    
+    try:
+        guard.call(lambda: (_ for _ in ()).throw(http_error(400)))
+        assert False, "400 should not be retried"
+    except requests.HTTPError:
+        pass
+    print("✓ Non-transient errors surface immediately")
+    
+    def down():
+        raise http_error(500)
+    try:
+        guard.call(down)
+        assert False, "sustained outage should give up"
+    except AIServiceUnavailable:
+        pass
+    assert guard.breaker.is_open
+    try:
+        guard.call(lambda: "never called")
+        assert False, "open circuit should fail fast"
+    except AIServiceUnavailable:
+        pass
+    print("✓ Sustained outage opens the circuit breaker")
+    
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60) == 0 and 0.9 < bucket.reserve(1) <= 1.0
+    assert parse_reset_duration("6m0s") == 360 and parse_reset_duration("20ms") == 0.02
+    print("✓ Token bucket queues callers once the budget is spent")
+    
+    db = DatabaseManager('test_viral_agent.db')
+    agent = AIAgent("test-key-123", cache=ResponseCache(db), use_cache=False, guard=guard, db=db)
+    try:
+        agent.analyze_viral_video("https://example.com/v", "transcript")
+        assert False, "outage should not become a score of 0"
+    except AIServiceUnavailable:
+        pass
+    print("✓ Outages raise instead of returning a fallback score")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_heuristic_scorer():
+    """Test the local heuristic pre-filter"""
+    print("\nTesting heuristic scorer...")
+    scorer = HeuristicScorer()
+    
+    scores = scorer.authenticity([
+        "I made $3,200 last month after 6 months of testing Systeme.io",
+        "Get rich overnight, guaranteed secret trick!",
+    ])
+    assert scores[0] > 70 > 30 > scores[1]
+    print("✓ Specific numbers and personal story beat hype")
+    
+    strong = ViralVideo(title="strong", views=2_000_000, engagement_rate=12.0, hashtags="#affiliatemarketing #aitools",
+                        audio_transcript="My first month with ClickFunnels I made $1,150, here's what I did")
+    weak = ViralVideo(title="weak", views=20_000, engagement_rate=1.0, hashtags="#dance",
+                      audio_transcript="Quit your job, easy money while you sleep!")
+    middle = ViralVideo(title="middle", views=500_000, engagement_rate=8.0, hashtags="#passiveincome",
+                        audio_transcript="Three tools that save time")
+    videos = [weak, middle, strong]
+    assert list(scorer.score_videos(videos)) == list(scorer.score_videos(videos))
+    assert [video.title for video in scorer.select(videos, top_k=2, threshold=None)] == ["strong", "middle"]
+    assert [video.title for video in scorer.select(videos, top_k=None, threshold=75)] == ["strong"]
+    assert scorer.select([], top_k=5) == []
+    print("✓ Gate keeps the top-K / above-threshold candidates, best first")
+
+def test_prompt_budget():
+    """Test token budgeting and transcript compaction"""
+    print("\nTesting prompt budgets...")
+    transcript = ("Um, so hey guys. " + " ".join(f"Filler sentence number {i} about nothing." for i in range(300)) +
+                  " I made $4,200 last month with Systeme.io. " +
+                  " ".join(f"Random talk {i}." for i in range(300)) + " Subscribe for part two.")
+    compacted = compact_text(transcript, 150, ["systeme"])
+    assert estimate_tokens(compacted) <= 150 < estimate_tokens(transcript)
+    assert compacted.startswith("so hey guys.") and compacted.endswith("Subscribe for part two.")
+    assert "I made $4,200 last month with Systeme.io." in compacted and "…" in compacted
+    print("✓ Oversized transcripts keep head, tail and keyword windows within budget")
+    
+    captions = ("so today i want to show you " + " ".join(f"word{i}" for i in range(2000)) +
+                " and i made 4200 dollars with systeme io " + " ".join(f"more{i}" for i in range(2000)) +
+                " follow for part two")
+    compacted = compact_text(captions, 150, ["systeme"])
+    assert 0 < estimate_tokens(compacted) <= 150
+    assert compacted.startswith("so today i want") and compacted.endswith("follow for part two")
+    assert "systeme" in compacted
+    print("✓ Unpunctuated captions are cut at word level instead of compacting to nothing")
+    
+    assert compact_text("Uh, this is short. This is short.\nThis is short!", 100) == "this is short."
+    print("✓ Filler and repeated lines are stripped")
+    
+    db = DatabaseManager('test_viral_agent.db')
+    agent = AIAgent("test-key-123", cache=ResponseCache(db), db=db)
+    request = agent._analysis_request(transcript)
+    assert request.prompt_tokens < Config.PROMPT_TOKEN_BUDGETS["analyze_viral_video"] + 200
+    assert request.prompt_tokens == estimate_tokens(request.system_prompt) + estimate_tokens(request.user_prompt)
+    print("✓ Prompts are assembled within the per-call budget")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+class FakeStreamingClient:
+    """Stand-in for a stream=True chat completion that hands out the content in small chunks"""
+    
+    def __init__(self, content, chunk_size=7):
+        self.content = content
+        self.chunk_size = chunk_size
+        self.sent = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=self.create)))
+    
+    def chunks(self):
+        for start in range(0, len(self.content), self.chunk_size):
+            self.sent = start + self.chunk_size
+            delta = SimpleNamespace(content=self.content[start:start + self.chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+    
+    def create(self, stream=False, **request):
+        assert stream
+        return SimpleNamespace(headers={}, parse=self.chunks)
+
+def test_streaming_script():
+    """Test streaming script generation"""
+    print("\nTesting streaming script generation...")
+    script_data = {"title": "My $3,200 Week", "hook": "I almost quit, {really}.", "problem": "No traffic",
+                   "solution": "Systeme.io funnels", "proof": "3,200 \"real\" dollars", "cta": "Follow for part 2",
+                   "full_script": "Full script text", "hashtags": ["#affiliate"], "estimated_engagement": 12}
+    content = json.dumps(script_data)
+    
+    agent = ViralAIAgent(db=DatabaseManager('test_viral_agent.db'))
+    agent.ai.client = FakeStreamingClient(content)
+    
+    stream = agent.stream_content_script("AI Tools", "60s", "beginners", "streaming test", "success-story")
+    field, value = next(stream)
+    assert (field, value) == ("title", "My $3,200 Week") and agent.ai.client.sent < len(content)
+    print("✓ First field arrives before the response is complete")
+    
+    rest = dict(stream)
+    assert [key for key in rest if key in ("hook", "problem", "solution", "proof", "cta")] == \
+        ["hook", "problem", "solution", "proof", "cta"]
+    assert rest["proof"] == '3,200 "real" dollars'
+    script = rest["script"]
+    assert script.id and agent.db.get_scripts()[0].title == "My $3,200 Week"
+    print("✓ Final record persisted via insert_script")
+    
+    agent.ai.client = None  # a repeat request must come from the cache
+    assert dict(agent.ai.stream_script("AI Tools", "60s", "beginners", "streaming test", "success-story")) == script_data
+    print("✓ Completed streams are cached")
+    
+    def rejected(*args):
+        raise openai.OpenAIError("Incorrect API key provided")
+        yield
+    answers = iter(["AI Tools", "60s", "beginners", "rejected request", "success-story"])
+    agent.find_similar_script = lambda *args: None
+    agent.stream_content_script = rejected
+    original_input, builtins.input = builtins.input, lambda prompt="": next(answers)
+    try:
+        agent.generate_script_interactive()
+    finally:
+        builtins.input = original_input
+    print("✓ A non-retryable OpenAI error doesn't crash the CLI")
+    
+    agent.db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_prompt_packing():
+    """Test multi-item prompt packing"""
+    print("\nTesting prompt packing...")
+    db = DatabaseManager('test_viral_agent.db')
+    agent = AIAgent("test-key-123", cache=ResponseCache(db), use_cache=False, db=db)
+    dropped = set()
+    
+    def respond(prompt):
+        items = json.loads(re.search(r'Items: (\[.*\])', prompt).group(1))
+        results = []
+        for item in items:
+            if item["id"] == "7" and "7" not in dropped:
+                dropped.add("7")  # first answer loses item 7
+                continue
+            results.append({"id": item["id"], "score": 40 + int(item["id"])})
+        return json.dumps({"results": results})
+    
+    fake = FakeAsyncChatClient(respond)
+    agent.async_client_factory = lambda: fake
+    
+    contents = [f"Caption number {i} with $100 proof" for i in range(45)]
+    results = asyncio.run(agent.score_many(contents, pack_size=20))
+    assert all(result.ok for result in results)
+    assert [result.result for result in results] == [40 + i for i in range(45)]
+    assert fake.calls == 4  # 3 packs of <=20, plus one re-queue for the dropped item
+    print("✓ 45 items scored in 3 packed requests, results split back by id")
+    print("✓ Only the item missing from its pack was re-queued")
+    
+    costs = {i: 100 for i in range(10)}
+    assert pack_items(costs, max_items=20, max_tokens=350) == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+    print("✓ Pack size adapts to the token budget")
+    
+    db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_fake_openai_server():
+    """Test the AI paths end to end against the local fake OpenAI server"""
+    print("\nTesting fake OpenAI server...")
+    server, base_url = start_server(FakeServerConfig(latency_ms=1, latency_dist="fixed"))
+    original_base_url = Config.OPENAI_BASE_URL
+    Config.OPENAI_BASE_URL = base_url
+    db = DatabaseManager('test_viral_agent.db')
+    try:
+        guard = ApiGuard(RateLimiter(requests_per_minute=100000, tokens_per_minute=10**9))
+        agent = AIAgent("test-key-123", cache=ResponseCache(db), use_cache=False, guard=guard, db=db)
+        
+        analysis = agent.analyze_viral_video("https://example.com/v", "I made $900 last week")
+        assert analysis == agent.analyze_viral_video("https://example.com/v", "I made $900 last week")
+        assert 40 <= analysis["score"] <= 99 and analysis["engagement_quality"] in ("low", "medium", "high")
+        assert 40 <= agent.score_content_authenticity("I made $900 last week") <= 99
+        print("✓ Deterministic responses in the shapes AIAgent expects")
+        
+        fields = dict(agent.stream_script("AI Tools", "60s", "beginners", "fake server", "success-story"))
+        assert {"hook", "problem", "solution", "proof", "cta"} <= set(fields)
+        print("✓ Streaming over server-sent events")
+        
+        results = agent.run(agent.score_many([f"caption {i}" for i in range(6)], pack_size=4))
+        assert all(result.ok for result in results) and server.RequestHandlerClass.fake.counts["requests"] == 6
+        print("✓ Packed batches through the async client")
+    finally:
+        Config.OPENAI_BASE_URL = original_base_url
+        server.shutdown()
+        db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_similar_script_cache():
+    """Test the near-duplicate generate_script request cache"""
+    print("\nTesting similar script cache...")
+    agent = ViralAIAgent(db=DatabaseManager('test_viral_agent.db'))
+    agent.ai.client = FakeChatClient(json.dumps({"title": "My $3,200 Funnel", "full_script": "Script body"}))
+    
+    first = agent.generate_content_script("AI Tools", "60s", "Beginners",
+                                          "How I made $3,200 with Systeme.io", "success-story")
+    assert agent.ai.client.calls == 1 and first.key_message == "How I made $3,200 with Systeme.io"
+    
+    again = agent.generate_content_script("ai tools", "60 seconds", "beginners",
+                                          "how I made $3200 with systeme io!", "Success Story")
+    assert again.id == first.id and agent.ai.client.calls == 1
+    assert agent.db.get_script(first.id).cache_hits == 1
+    print("✓ Reworded request served the existing script and recorded the hit")
+    
+    other = agent.generate_content_script("AI Tools", "60s", "Beginners",
+                                          "Why most people fail at affiliate marketing", "success-story")
+    assert other.id != first.id and agent.ai.client.calls == 2
+    agent.generate_content_script("AI Tools", "30s", "Beginners", "How I made $3,200 with Systeme.io", "success-story")
+    assert agent.ai.client.calls == 3
+    print("✓ Different message or video length generates a new script")
+    
+    agent._script_index = None  # a fresh process warms the index from generated_scripts
+    assert agent.find_similar_script("AI tools", "60s", "beginners", "How I made $3,200 with Systeme.io",
+                                     "success-story")[0].id == first.id
+    print("✓ Index warms from the database")
+    
+    agent.ai.client = FakeChatClient("not json")
+    failed = agent.generate_content_script("Email Marketing", "60s", "Coaches", "My welcome sequence", "tutorial")
+    assert failed.id is None and failed.title == "Error generating script"
+    agent.ai.client = FakeChatClient(json.dumps({"title": "Welcome Sequence", "full_script": "Body"}))
+    retried = agent.generate_content_script("Email Marketing", "60s", "Coaches", "My welcome sequence", "tutorial")
+    assert retried.title == "Welcome Sequence" and agent.ai.client.calls == 1
+    print("✓ Failed generations are neither stored nor reused")
+    
+    agent.db.close()
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_shared_resources():
+    """Test that agents share one database handle and one OpenAI client"""
+    print("\nTesting shared resources...")
+    with ViralAIAgent(db=DatabaseManager('test_viral_agent.db')) as agent:
+        assert agent.ai.db is agent.db and agent.ai.cache.db is agent.db
+        assert AIAgent("test-key-123", db=agent.db).client is AIAgent("test-key-123", db=agent.db).client
+        print("✓ One DatabaseManager per agent and one pooled OpenAI client per key")
+        
+        statements = []
+        agent.db.connection().set_trace_callback(statements.append)
+        agent.db.init_database()
+        agent.db.connection().set_trace_callback(None)
+        assert statements == ['PRAGMA user_version']
+        print("✓ Up-to-date schema skips the migration write lock")
+    
+    shared = DatabaseManager('test_viral_agent.db')
+    with AIAgent("test-key-123", db=shared) as borrowed:
+        borrowed.db.connection()
+    assert shared._connections
+    shared.close()
+    
+    import tempfile
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # an agent without db= opens the default path, so keep it out of the repo
+        try:
+            with AIAgent("test-key-123") as owned:
+                owned.db.connection()
+            assert not owned.db._connections
+        finally:
+            os.chdir(cwd)
+    agent.db.close()
+    print("✓ Context managers release what the agent created and leave a passed-in database open")
+    
+    # Clean up test database
+    try:
+        os.remove('test_viral_agent.db')
+    except FileNotFoundError:
+        pass
+
+def test_browser_pool():
+    """Test that browsers are reused, health-checked and recycled with their profiles"""
+    print("\nTesting browser pool...")
+    import tempfile
+    import browser_pool
+    from browser_pool import BrowserPool
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+    
+    class FakeDriver:
+        def __init__(self, profile_dir):
+            self.profile_dir = profile_dir
+            self.alive = True
+            self.quit_calls = 0
+        
+        def execute_script(self, script):
+            if not self.alive:
+                raise WebDriverException("chrome not reachable")
+            return 1
+        
+        def quit(self):
+            self.quit_calls += 1
+    
+    launched = []
+    def launch(profile_dir):
+        launched.append(FakeDriver(profile_dir))
+        return launched[-1]
+    
+    with tempfile.TemporaryDirectory() as root:
+        pool = BrowserPool(size=2, max_uses=3, max_rss_mb=None, profile_root=root, launch=launch)
+        assert not launched
+        drivers = set()
+        for _ in range(4):
+            with pool.acquire() as browser:
+                drivers.add(id(browser.driver))
+        assert len(launched) == 2 and len(drivers) == 2
+        print("✓ Browsers start lazily and are reused across checkouts")
+        
+        with pool.acquire() as browser:
+            browser.driver.alive = False
+        for _ in range(2):
+            with pool.acquire() as browser:
+                assert browser.driver.alive
+        assert pool.stats["recycled"] >= 1 and any(d.quit_calls for d in launched)
+        print("✓ Dead or worn-out browsers are replaced")
+        
+        try:
+            with pool.acquire() as browser:
+                profile, broken = browser.profile_dir, browser.driver
+                raise WebDriverException("tab crashed")
+        except WebDriverException:
+            pass
+        assert broken.quit_calls == 1 and launched[-1].profile_dir == profile
+        assert os.path.isdir(profile)
+        print("✓ Replacement browsers reopen the same persistent profile")
+        
+        launches = pool.stats["launches"]
+        try:
+            with pool.acquire() as browser:
+                raise TimeoutException("selector never appeared")
+        except TimeoutException:
+            pass
+        assert pool.stats["launches"] == launches and not browser.broken
+        print("✓ Wait timeouts keep the warm browser")
+        
+        def failing_launch(profile_dir):
+            raise WebDriverException("chrome failed to start")
+        pool.launch = failing_launch
+        for _ in range(2):
+            try:
+                with pool.acquire() as browser:
+                    raise WebDriverException("tab crashed")
+            except WebDriverException:
+                pass
+        pool.launch = launch
+        with pool.acquire() as browser:
+            assert browser.driver.alive and len(pool._browsers) == 2
+        print("✓ A failed relaunch is retried on the next checkout")
+        
+        pool.close()
+        assert all(d.quit_calls for d in launched)
+    
+    installs = []
+    original = browser_pool.ChromeDriverManager, browser_pool._driver_path
+    browser_pool.ChromeDriverManager = lambda: SimpleNamespace(install=lambda: installs.append(1) or "/bin/chromedriver")
+    browser_pool._driver_path = None
+    try:
+        assert browser_pool.chromedriver_path() == browser_pool.chromedriver_path() == "/bin/chromedriver"
+        assert len(installs) == 1
+    finally:
+        browser_pool.ChromeDriverManager, browser_pool._driver_path = original
+    print("✓ chromedriver is resolved once per process")
+
+def test_browser_waits():
+    """Test explicit waits return as soon as the page is ready and record their timings"""
+    print("\nTesting browser waits...")
+    import time
+    from browser_waits import PageWaiter, WaitStats
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    
+    class FakePage:
+        def __init__(self, ready_after):
+            self.polls = 0
+            self.ready_after = ready_after
+            self.current_url = "https://example.com/login"
+            self.cookies = {}
+        
+        def find_elements(self, by, value):
+            self.polls += 1
+            return ["post"] * 3 if self.polls > self.ready_after else []
+        
+        def get_cookie(self, name):
+            self.polls += 1
+            if self.polls > self.ready_after:
+                self.cookies[name] = {"name": name}
+            return self.cookies.get(name)
+        
+        def execute_script(self, script):
+            self.polls += 1
+            # resource count keeps growing for a few polls, then holds
+            return [min(self.polls, 3), self.polls * 100.0]
+    
+    stats = WaitStats()
+    waiter = PageWaiter(FakePage(ready_after=2), stats, poll=0.01)
+    start = time.perf_counter()
+    assert waiter.elements("site.feed", By.CSS_SELECTOR, ".post", timeout=5) == ["post"] * 3
+    assert time.perf_counter() - start < 1
+    print("✓ Selector waits return once elements appear")
+    
+    assert waiter.network_idle("site.idle", timeout=5, idle_ms=300)
+    assert PageWaiter(FakePage(ready_after=0), stats, poll=0.01).login_complete("site.login", "sessionid", "/login", timeout=5)
+    print("✓ Network idle and login redirect conditions")
+    
+    try:
+        PageWaiter(FakePage(ready_after=10**6), stats, poll=0.01).elements("site.missing", By.CSS_SELECTOR, ".x", timeout=0.05)
+        assert False, "expected a timeout"
+    except TimeoutException as e:
+        assert "site.missing" in str(e)
+    summary = stats.summary()
+    assert summary["site.feed"]["count"] == 1 and summary["site.feed"]["timeouts"] == 0
+    assert summary["site.missing"]["timeouts"] == 1 and summary["site.missing"]["last"] >= 0.05
+    print(f"✓ Wait timings recorded: {sorted(summary)}")
+
+def test_trending_scanner():
+    """Test the HTTP/lxml fast path against saved pages and the browser fallback"""
+    print("\nTesting trending scanner...")
+    from tiktok_scanner import TrendingScanner, parse_trending
+    fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'tiktok')
+    
+    def page(name):
+        with open(os.path.join(fixtures, name), encoding='utf-8') as f:
+            return f.read()
+    
+    universal = parse_trending(page('trending_universal_data.html'))
+    assert universal.tier == "http-json" and len(universal.texts) == 3
+    assert universal.texts[0].startswith("I made $4,200") and "short one" not in universal.texts
+    assert parse_trending(page('trending_sigi_state.html')).tier == "http-json"
+    markup = parse_trending(page('trending_markup.html'))
+    assert markup.tier == "http-html" and markup.texts[0] == "My first $500 week from one pinned comment #sidehustle"
+    assert parse_trending(page('trending_js_challenge.html')).tier == "none"
+    print("✓ Hydration JSON and server-rendered markup parsed offline")
+    
+    class FakeSession:
+        def __init__(self, html=None, error=None):
+            self.html, self.error = html, error
+        
+        def get(self, url, headers=None, timeout=None):
+            if self.error:
+                raise self.error
+            return SimpleNamespace(text=self.html, raise_for_status=lambda: None)
+    
+    browser_calls = []
+    def browser_scan(limit):
+        browser_calls.append(limit)
+        return ["Rendered caption about a $900 week from one funnel", "ok"]
+    
+    scanner = TrendingScanner(FakeSession(page('trending_universal_data.html')), browser_scan=browser_scan)
+    assert scanner.scan().tier == "http-json" and not browser_calls
+    scanner.session = FakeSession(page('trending_js_challenge.html'))
+    fallback = scanner.scan()
+    assert fallback.tier == "browser" and fallback.texts == ["Rendered caption about a $900 week from one funnel"]
+    scanner.session = FakeSession(error=requests.ConnectionError("offline"))
+    assert scanner.scan().tier == "browser" and len(browser_calls) == 2
+    assert scanner.stats()["tiers"] == {"http-json": 1, "browser": 2}
+    print(f"✓ Browser only used when the fast path is empty: {scanner.stats()['tiers']}")
+
+def test_scheduler():
+    """Test independent job cadences, overlap prevention and prompt stop"""
+    print("\nTesting scheduler...")
+    import time
+    import threading
+    from datetime import datetime
+    from scheduler import CronSchedule, Scheduler
+    
+    release = threading.Event()
+    runs = {"fast": 0, "slow": 0}
+    def fast():
+        runs["fast"] += 1
+    def slow():
+        runs["slow"] += 1
+        release.wait(2)
+    
+    scheduler = Scheduler(max_workers=2)
+    scheduler.add_interval_job("fast", fast, 0.02, run_immediately=True)
+    scheduler.add_interval_job("slow", slow, 0.02, jitter=0.01, run_immediately=True)
+    assert scheduler.start() and not scheduler.start()
+    time.sleep(0.3)
+    status = scheduler.status()
+    assert runs["fast"] >= 5 and runs["slow"] == 1
+    assert status["slow"]["running"] and status["slow"]["skipped"] >= 3
+    assert status["fast"]["last_duration"] is not None and status["fast"]["next_run"]
+    print(f"✓ Slow job skipped {status['slow']['skipped']} overlapping ticks while fast job ran {runs['fast']} times")
+    
+    release.set()
+    start = time.perf_counter()
+    scheduler.stop(wait=1)
+    assert not scheduler.running and time.perf_counter() - start < 1
+    settled = runs["fast"]
+    time.sleep(0.1)
+    assert runs["fast"] == settled and scheduler.status()["slow"]["runs"] == 1
+    print("✓ Stop takes effect without waiting out the interval")
+    
+    weekdays = CronSchedule("*/30 9-17 * * 1-5")
+    assert weekdays.next_after(datetime(2026, 10, 16, 17, 45)) == datetime(2026, 10, 19, 9, 0)
+    assert CronSchedule("0 0 29 2 *").next_after(datetime(2026, 3, 1)) == datetime(2028, 2, 29)
+    try:
+        CronSchedule("61 * * * *")
+        assert False, "expected a ValueError"
+    except ValueError:
+        pass
+    print("✓ Cron schedules")
+
+def test_post_outbox():
+    """Test concurrent outbox delivery, retries, dead-lettering and idempotent enqueue"""
+    print("\nTesting post outbox...")
+    import time
+    from outbox import OutboxPublisher
+    db = DatabaseManager('test_outbox.db')
+    
+    delivered = {"tiktok": [], "instagram": []}
+    failures = {"instagram": 1}
+    def publisher(platform):
+        def publish(content, key):
+            time.sleep(0.2)
+            if failures.get(platform):
+                failures[platform] -= 1
+                raise RuntimeError("browser session crashed")
+            delivered[platform].append(key)
+            return True
+        return publish
+    
+    outbox = OutboxPublisher(db, {p: publisher(p) for p in delivered}, max_attempts=2, base_delay=0)
+    assert len(outbox.enqueue("Caption one")) == 2 and outbox.enqueue("Caption one") == []
+    start = time.perf_counter()
+    results = outbox.drain()
+    assert time.perf_counter() - start < 0.35
+    assert results["tiktok"].sent == 1 and results["instagram"].retried == 1
+    print("✓ Platforms drain concurrently; a crash schedules a retry instead of dropping the post")
+    
+    results = outbox.drain()
+    assert results["instagram"].sent == 1 and len(delivered["instagram"]) == 1
+    assert db.outbox_counts() == {"tiktok": {"sent": 1}, "instagram": {"sent": 1}}
+    
+    outbox.enqueue("Caption two", ["tiktok"])
+    db.claim_posts("tiktok", lease_seconds=0)  # a worker claimed it and died
+    assert outbox.drain()["tiktok"].sent == 1
+    print("✓ Expired claims are delivered again")
+    
+    outbox.enqueue("Caption three", ["instagram"])
+    failures["instagram"] = 10
+    assert outbox.drain()["instagram"].retried == 1 and outbox.drain()["instagram"].dead == 1
+    assert db.outbox_counts()["instagram"] == {"sent": 1, "dead": 1}
+    assert db.requeue_dead_posts("instagram") == 1 and db.outbox_counts()["instagram"] == {"sent": 1, "pending": 1}
+    print(f"✓ Dead-lettered after retries and replayable: {db.outbox_counts()}")
+    
+    outbox.enqueue("Caption four", ["tiktok"])
+    post_id, _, _, attempts = db.claim_posts("tiktok", lease_seconds=0)[0]  # slow worker, lease runs out
+    assert outbox.drain()["tiktok"].sent == 1
+    assert not db.fail_post(post_id, attempts, "late failure", 0)
+    assert db.outbox_counts()["tiktok"]["sent"] == 3
+    print("✓ A late result from an expired claim cannot reopen a sent post")
+    
+    outbox.enqueue("Caption five", ["tiktok"])
+    post_id, _, _, attempts = db.claim_posts("tiktok", lease_seconds=0)[0]
+    db.claim_posts("tiktok", lease_seconds=0)  # the lease was taken over before the ack arrived
+    assert not db.complete_post(post_id, attempts)
+    sent_before = len(delivered["tiktok"])
+    restarted = OutboxPublisher(DatabaseManager('test_outbox.db'), outbox.publishers)
+    assert restarted.drain()["tiktok"].sent == 1 and len(delivered["tiktok"]) == sent_before
+    restarted.close()
+    restarted.db.close()
+    print("✓ Delivered posts are not published again after a restart")
+    
+    for _ in range(20):
+        outbox.drain()
+    workers = {thread for thread in threading.enumerate() if thread.name.startswith("outbox")}
+    assert len(workers) == 2
+    for _ in range(20):  # one short-lived thread per call, like werkzeug's per-request threads
+        thread = threading.Thread(target=db.outbox_counts)
+        thread.start()
+        thread.join()
+    assert len(db._connections) <= len(workers) + 2
+    outbox.close()
+    assert not any(thread.name.startswith("outbox") for thread in threading.enumerate())
+    print(f"✓ Drains reuse their workers and finished threads' connections are closed ({len(db._connections)} open)")
+    
+    db.close()
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove('test_outbox.db' + suffix)
+        except FileNotFoundError:
+            pass
+
 def test_affiliate_products():
     """Test affiliate product configuration"""
     print("\nTesting affiliate products...")
@@ -93,7 +1276,7 @@ def test_agent_initialization():
     Config.OPENAI_API_KEY = "test-key-123"
     
     try:
-        agent = ViralAIAgent()
+        agent = ViralAIAgent(db=DatabaseManager('test_viral_agent.db'))
         print("✓ Agent initialized successfully")
         
         # Test dashboard stats
@@ -104,10 +1287,15 @@ def test_agent_initialization():
         products = agent.get_affiliate_products()
         print(f"✓ Affiliate products: {len(products)} available")
         
+        agent.db.close()
     except Exception as e:
         print(f"✗ Agent initialization failed: {e}")
     finally:
         Config.OPENAI_API_KEY = original_key
+        try:
+            os.remove('test_viral_agent.db')
+        except FileNotFoundError:
+            pass
 
 def main():
     """Run all tests"""
@@ -117,6 +1305,31 @@ def main():
     try:
         test_database_setup()
         test_seed_data()
+        test_connection_layer()
+        test_bulk_ingest()
+        test_keyset_readers()
+        test_schema_migrations()
+        test_dashboard_aggregates()
+        test_dashboard_counters()
+        test_full_text_search()
+        test_hashtag_index()
+        test_projected_rows()
+        test_video_dedup()
+        test_response_cache()
+        test_batch_analysis()
+        test_api_guard()
+        test_heuristic_scorer()
+        test_prompt_budget()
+        test_streaming_script()
+        test_prompt_packing()
+        test_fake_openai_server()
+        test_similar_script_cache()
+        test_shared_resources()
+        test_browser_pool()
+        test_browser_waits()
+        test_trending_scanner()
+        test_scheduler()
+        test_post_outbox()
         test_affiliate_products()
         test_agent_initialization()
         
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tiered TikTok trending scanner: plain HTTP + lxml first, the browser pool only as a fallback
+The fast path reads the JSON TikTok embeds for hydration (or the server-rendered markup) from a
+pooled requests.Session. Chrome is only used when that yields nothing, e.g. behind a JS challenge.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import lxml.etree
+import lxml.html
+import requests
+
+TRENDING_URL = "https://www.tiktok.com/trending"
+HYDRATION_SCRIPT_IDS = ("__UNIVERSAL_DATA_FOR_REHYDRATION__", "SIGI_STATE", "__NEXT_DATA__")
+DESC_XPATH = "//*[@data-e2e='video-desc']"
+BROWSER_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+@dataclass
+class ScanResult:
+    tier: str  # http-json, http-html, browser or none
+    texts: List[str]
+    elapsed: float
+    errors: List[str] = field(default_factory=list)
+
+def _video_items(node: Any) -> Iterator[Dict[str, Any]]:
+    """Every dict in the hydration state that looks like a video (a desc next to an id plus author/stats)"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if isinstance(node.get("desc"), str) and "id" in node and ("author" in node or "stats" in node):
+                yield node
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+
+def _unique(texts: List[str], min_length: int, limit: int) -> List[str]:
+    seen, result = set(), []
+    for text in texts:
+        text = " ".join(text.split())
+        if len(text) > min_length and text not in seen:
+            seen.add(text)
+            result.append(text)
+            if len(result) == limit:
+                break
+    return result
+
+def parse_embedded_json(document, limit: int = 5, min_length: int = 20) -> List[str]:
+    """Video descriptions from TikTok's hydration <script> blocks"""
+    texts = []
+    for script_id in HYDRATION_SCRIPT_IDS:
+        for script in document.xpath(f"//script[@id='{script_id}']"):
+            try:
+                state = json.loads(script.text or "")
+            except ValueError:
+                continue
+            texts.extend(item["desc"] for item in _video_items(state))
+    return _unique(texts, min_length, limit)
+
+def parse_markup(document, limit: int = 5, min_length: int = 20) -> List[str]:
+    """Video descriptions from server-rendered [data-e2e='video-desc'] elements"""
+    return _unique([element.text_content() for element in document.xpath(DESC_XPATH)], min_length, limit)
+
+def parse_trending(html: str, limit: int = 5, min_length: int = 20) -> ScanResult:
+    """Parse a fetched page; tier is 'none' when neither the JSON nor the markup has descriptions"""
+    start = time.perf_counter()
+    if not html or not html.strip():
+        return ScanResult("none", [], time.perf_counter() - start)
+    document = lxml.html.fromstring(html)
+    texts = parse_embedded_json(document, limit, min_length)
+    if texts:
+        return ScanResult("http-json", texts, time.perf_counter() - start)
+    texts = parse_markup(document, limit, min_length)
+    return ScanResult("http-html" if texts else "none", texts, time.perf_counter() - start)
+
+class TrendingScanner:
+    """HTTP fast path with a browser fallback; counts which tier served each scan"""
+    
+    def __init__(self, session: Optional[requests.Session] = None,
+                 browser_scan: Optional[Callable[[int], List[str]]] = None,
+                 url: str = TRENDING_URL, timeout: float = 10, history: int = 50):
+        self.session = session or requests.Session()
+        self.browser_scan = browser_scan
+        self.url = url
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.tier_counts: Dict[str, int] = {}
+        self.recent: deque = deque(maxlen=history)
+    
+    def fetch(self) -> str:
+        response = self.session.get(self.url, headers=BROWSER_HEADERS, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+    
+    def scan(self, limit: int = 5, min_length: int = 20) -> ScanResult:
+        start = time.perf_counter()
+        errors = []
+        try:
+            result = parse_trending(self.fetch(), limit, min_length)
+        except (requests.RequestException, ValueError, lxml.etree.LxmlError) as e:
+            errors.append(f"http: {e}")
+            result = ScanResult("none", [], 0.0)
+        
+        if not result.texts and self.browser_scan is not None:
+            try:
+                texts = _unique(self.browser_scan(limit), min_length, limit)
+                result = ScanResult("browser" if texts else "none", texts, 0.0)
+            except Exception as e:
+                errors.append(f"browser: {e}")
+        
+        result.elapsed = time.perf_counter() - start
+        result.errors = errors
+        self._record(result)
+        return result
+    
+    def _record(self, result: ScanResult):
+        with self._lock:
+            self.tier_counts[result.tier] = self.tier_counts.get(result.tier, 0) + 1
+            self.recent.append({"tier": result.tier, "count": len(result.texts),
+                                "elapsed": round(result.elapsed, 3), "timestamp": time.time()})
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tiers": dict(self.tier_counts), "recent": list(self.recent)[-10:]}
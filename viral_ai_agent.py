@@ -5,20 +5,111 @@ Converts viral content analysis and script generation into a single Python scrip
 """
 
 import os
+import re
 import json
+import asyncio
+import atexit
+import hashlib
+import random
 import sqlite3
+import textwrap
+import threading
+import time
+import zlib
 import requests
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Any
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from dataclasses import dataclass, asdict, field
+import logging
+import httpx
+import numpy as np
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
 
 # Configuration
 class Config:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', 'your-openai-key-here')
+    OPENAI_MODEL = "gpt-4o"  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')  # e.g. http://127.0.0.1:8089/v1 for fake_openai_server.py
     DATABASE_FILE = 'viral_ai_agent.db'
     
+    # SQLite tuning applied to every long-lived connection
+    DATABASE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",  # safe with WAL, avoids an fsync per commit
+        "cache_size": -20000,  # negative = KiB, roughly 20MB page cache
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    }
+    DATABASE_STATEMENT_CACHE = 256  # prepared statements kept per connection
+    BULK_CHUNK_SIZE = 500  # rows per executemany transaction in the *_many APIs
+    PAGE_SIZE = 200  # rows fetched per keyset page by the iter_* readers
+    VIRAL_SCORE_THRESHOLD = 85  # ai_score above which a video counts as viral
+    SIMHASH_MAX_DISTANCE = 3  # max differing bits for two transcripts to count as a repost
+    
+    # LLM response cache (in-process LRU in front of the llm_cache table)
+    LLM_CACHE_MEMORY_ENTRIES = 512
+    LLM_CACHE_MAX_ROWS = 20000
+    LLM_CACHE_TTLS = {  # seconds per AIAgent method; 0 disables caching for that method
+        "analyze_viral_video": 7 * 24 * 3600,
+        "generate_script": 24 * 3600,
+        "score_content_authenticity": 7 * 24 * 3600,
+    }
+    LLM_CACHE_DEFAULT_TTL = 24 * 3600
+    
+    AI_CONCURRENCY = 8  # in-flight requests for the async *_many batch APIs
+    
+    # Client-side rate limiting and retries (ApiGuard); defaults match a tier-1 gpt-4o key
+    OPENAI_RPM_LIMIT = int(os.getenv('OPENAI_RPM_LIMIT', '500'))
+    OPENAI_TPM_LIMIT = int(os.getenv('OPENAI_TPM_LIMIT', '30000'))
+    OPENAI_COMPLETION_TOKENS = 800  # expected completion size reserved against the TPM budget
+    OPENAI_MAX_RETRIES = 5
+    RETRY_BASE_DELAY = 1.0  # seconds, doubled per attempt
+    RETRY_MAX_DELAY = 60.0
+    CIRCUIT_FAILURE_THRESHOLD = 8  # consecutive transient failures before failing fast
+    CIRCUIT_RESET_SECONDS = 60.0
+    
+    # Shared keep-alive HTTP pool for the OpenAI clients
+    HTTP_MAX_CONNECTIONS = 64
+    HTTP_MAX_KEEPALIVE = 32
+    HTTP_KEEPALIVE_EXPIRY = 120.0  # seconds an idle TLS connection is kept for the next job
+    HTTP_TIMEOUT = 60.0
+    
+    # Local HeuristicScorer gate in front of gpt-4o analysis
+    HEURISTIC_THRESHOLD = 45  # heuristic score a video needs before it is sent for paid analysis
+    HEURISTIC_TOP_K = 50  # at most this many videos per analyze_videos run
+    
+    # Token budgets for the user-supplied text interpolated into each prompt; longer text is compacted
+    PROMPT_TOKEN_BUDGETS = {
+        "analyze_viral_video": 1200,
+        "generate_script": 300,
+        "score_content_authenticity": 600,
+    }
+    
+    # Multi-item prompt packing for the *_many batch APIs
+    AUTHENTICITY_PACK_SIZE = 20
+    ANALYSIS_PACK_SIZE = 5
+    PACKED_PROMPT_TOKENS = 6000  # packs close early once their items reach this many input tokens
+    PACKED_COMPLETION_TOKENS = {"score_content_authenticity": 15, "analyze_viral_video": 200}  # per item
+    PACK_MAX_ATTEMPTS = 3  # items missing from a packed answer are re-queued up to this many times
+    
+    # Near-duplicate generate_script requests are served an existing script (ScriptRequestIndex)
+    SCRIPT_SIMILARITY_THRESHOLD = 0.9  # cosine similarity of the request parameter vectors
+    SCRIPT_INDEX_SIZE = 2000  # recent requests kept in memory
+    SCRIPT_INDEX_DIMS = 1024  # hashed character n-gram buckets (capacity x dims float32 in memory)
+    
+    # Durable post outbox drained by the platform publishers
+    OUTBOX_MAX_ATTEMPTS = 6  # failed deliveries after which a post is dead-lettered
+    OUTBOX_RETRY_BASE_DELAY = 60.0  # seconds; doubles per attempt, with jitter
+    OUTBOX_RETRY_MAX_DELAY = 3600.0
+    OUTBOX_LEASE_SECONDS = 600  # a claimed post not acknowledged by then is delivered again
+    
     # Affiliate Product Data
     AFFILIATE_PRODUCTS = [
         {
@@ -72,7 +163,7 @@ class Config:
     ]
 
 # Data Models
-@dataclass
+@dataclass(slots=True)
 class ViralVideo:
     id: Optional[int] = None
     title: str = ""
@@ -86,8 +177,9 @@ class ViralVideo:
     status: str = "discovered"
     audio_transcript: str = ""
     created_at: str = ""
+    duplicate_of: Optional[int] = None
 
-@dataclass
+@dataclass(slots=True)
 class AffiliateProduct:
     id: Optional[int] = None
     name: str = ""
@@ -98,7 +190,7 @@ class AffiliateProduct:
     is_recurring: bool = False
     created_at: str = ""
 
-@dataclass
+@dataclass(slots=True)
 class GeneratedScript:
     id: Optional[int] = None
     title: str = ""
@@ -110,8 +202,10 @@ class GeneratedScript:
     ai_generated: bool = True
     status: str = "generated"
     created_at: str = ""
+    key_message: str = ""
+    cache_hits: int = 0  # near-duplicate requests served this script instead of generating a new one
 
-@dataclass
+@dataclass(slots=True)
 class Analytics:
     id: Optional[int] = None
     platform: str = ""
@@ -121,261 +215,2541 @@ class Analytics:
     conversion_rate: float = 0.0
     date: str = ""
 
+@dataclass(slots=True)
+class SearchHit:
+    kind: str = ""  # "video" or "script"
+    id: int = 0
+    title: str = ""
+    platform: str = ""
+    bm25: float = 0.0  # lower is more relevant; only comparable with hits of the same kind
+    snippet: str = ""
+
+@dataclass(slots=True)
+class SearchResults:
+    """Video and script hits, each ranked by its own FTS table's bm25"""
+    videos: List[SearchHit] = field(default_factory=list)
+    scripts: List[SearchHit] = field(default_factory=list)
+    
+    def __bool__(self) -> bool:
+        return bool(self.videos or self.scripts)
+
+_UNLOADED = object()  # marks a lazy column that has not been fetched yet
+
+def _lazy_row_type(model: type, table: str, lazy_fields: tuple) -> type:
+    """Subclass a slotted row model so its large text fields load from the database on first access"""
+    namespace = {'__slots__': ('_db',), 'lazy_fields': lazy_fields}
+    
+    for name in lazy_fields:
+        slot = model.__dict__[name]
+        
+        def get(self, name=name, slot=slot):
+            value = slot.__get__(self, type(self))
+            if value is _UNLOADED:
+                value = self._db._load_column(table, name, self.id)
+                slot.__set__(self, value)
+            return value
+        
+        def set(self, value, slot=slot):
+            slot.__set__(self, value)
+        
+        namespace[name] = property(get, set)
+    
+    return type(f'Lazy{model.__name__}', (model,), namespace)
+
+# Row types returned by projected reads (get_viral_videos(columns=[...]) etc.)
+LazyViralVideo = _lazy_row_type(ViralVideo, 'viral_videos', ('audio_transcript', 'captions'))
+LazyGeneratedScript = _lazy_row_type(GeneratedScript, 'generated_scripts', ('content',))
+
+# Running dashboard totals, kept current by triggers on every write path.
+# period is '' for all-time video/script totals and 'YYYY-MM' for analytics months.
+# Missing counter rows are created with INSERT ... WHERE NOT EXISTS rather than INSERT OR IGNORE,
+# because an upsert's conflict policy overrides OR clauses inside the triggers it fires.
+COUNTER_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_viral_videos_counters_insert AFTER INSERT ON viral_videos BEGIN
+        INSERT INTO dashboard_counters (period, platform) SELECT '', NEW.platform
+        WHERE NOT EXISTS (SELECT 1 FROM dashboard_counters WHERE period = '' AND platform = NEW.platform);
+        UPDATE dashboard_counters SET
+            video_count = video_count + 1,
+            total_views = total_views + COALESCE(NEW.views, 0),
+            engagement_sum = engagement_sum + COALESCE(NEW.engagement_rate, 0),
+            viral_count = viral_count + (NEW.ai_score > {Config.VIRAL_SCORE_THRESHOLD})
+        WHERE period = '' AND platform = NEW.platform;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_viral_videos_counters_delete AFTER DELETE ON viral_videos BEGIN
+        UPDATE dashboard_counters SET
+            video_count = video_count - 1,
+            total_views = total_views - COALESCE(OLD.views, 0),
+            engagement_sum = engagement_sum - COALESCE(OLD.engagement_rate, 0),
+            viral_count = viral_count - (OLD.ai_score > {Config.VIRAL_SCORE_THRESHOLD})
+        WHERE period = '' AND platform = OLD.platform;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_viral_videos_counters_update
+    AFTER UPDATE OF platform, views, engagement_rate, ai_score ON viral_videos BEGIN
+        UPDATE dashboard_counters SET
+            video_count = video_count - 1,
+            total_views = total_views - COALESCE(OLD.views, 0),
+            engagement_sum = engagement_sum - COALESCE(OLD.engagement_rate, 0),
+            viral_count = viral_count - (OLD.ai_score > {Config.VIRAL_SCORE_THRESHOLD})
+        WHERE period = '' AND platform = OLD.platform;
+        INSERT INTO dashboard_counters (period, platform) SELECT '', NEW.platform
+        WHERE NOT EXISTS (SELECT 1 FROM dashboard_counters WHERE period = '' AND platform = NEW.platform);
+        UPDATE dashboard_counters SET
+            video_count = video_count + 1,
+            total_views = total_views + COALESCE(NEW.views, 0),
+            engagement_sum = engagement_sum + COALESCE(NEW.engagement_rate, 0),
+            viral_count = viral_count + (NEW.ai_score > {Config.VIRAL_SCORE_THRESHOLD})
+        WHERE period = '' AND platform = NEW.platform;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_generated_scripts_counters_insert AFTER INSERT ON generated_scripts BEGIN
+        INSERT INTO dashboard_counters (period, platform) SELECT '', ''
+        WHERE NOT EXISTS (SELECT 1 FROM dashboard_counters WHERE period = '' AND platform = '');
+        UPDATE dashboard_counters SET script_count = script_count + 1 WHERE period = '' AND platform = '';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_generated_scripts_counters_delete AFTER DELETE ON generated_scripts BEGIN
+        UPDATE dashboard_counters SET script_count = script_count - 1 WHERE period = '' AND platform = '';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_analytics_counters_insert AFTER INSERT ON analytics BEGIN
+        INSERT INTO dashboard_counters (period, platform)
+        SELECT COALESCE(strftime('%Y-%m', NEW.date), ''), NEW.platform
+        WHERE NOT EXISTS (SELECT 1 FROM dashboard_counters
+                          WHERE period = COALESCE(strftime('%Y-%m', NEW.date), '') AND platform = NEW.platform);
+        UPDATE dashboard_counters SET
+            analytics_count = analytics_count + 1,
+            revenue_sum = revenue_sum + COALESCE(NEW.revenue, 0),
+            conversion_sum = conversion_sum + COALESCE(NEW.conversion_rate, 0)
+        WHERE period = COALESCE(strftime('%Y-%m', NEW.date), '') AND platform = NEW.platform;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_analytics_counters_delete AFTER DELETE ON analytics BEGIN
+        UPDATE dashboard_counters SET
+            analytics_count = analytics_count - 1,
+            revenue_sum = revenue_sum - COALESCE(OLD.revenue, 0),
+            conversion_sum = conversion_sum - COALESCE(OLD.conversion_rate, 0)
+        WHERE period = COALESCE(strftime('%Y-%m', OLD.date), '') AND platform = OLD.platform;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_analytics_counters_update
+    AFTER UPDATE OF platform, revenue, conversion_rate, date ON analytics BEGIN
+        UPDATE dashboard_counters SET
+            analytics_count = analytics_count - 1,
+            revenue_sum = revenue_sum - COALESCE(OLD.revenue, 0),
+            conversion_sum = conversion_sum - COALESCE(OLD.conversion_rate, 0)
+        WHERE period = COALESCE(strftime('%Y-%m', OLD.date), '') AND platform = OLD.platform;
+        INSERT INTO dashboard_counters (period, platform)
+        SELECT COALESCE(strftime('%Y-%m', NEW.date), ''), NEW.platform
+        WHERE NOT EXISTS (SELECT 1 FROM dashboard_counters
+                          WHERE period = COALESCE(strftime('%Y-%m', NEW.date), '') AND platform = NEW.platform);
+        UPDATE dashboard_counters SET
+            analytics_count = analytics_count + 1,
+            revenue_sum = revenue_sum + COALESCE(NEW.revenue, 0),
+            conversion_sum = conversion_sum + COALESCE(NEW.conversion_rate, 0)
+        WHERE period = COALESCE(strftime('%Y-%m', NEW.date), '') AND platform = NEW.platform;
+    END
+    ''',
+]
+
+# Recomputes dashboard_counters from the base tables (used by migrations and rebuild_counters)
+COUNTER_REBUILD_SQL = [
+    'DELETE FROM dashboard_counters',
+    f'''
+    INSERT INTO dashboard_counters (period, platform, video_count, total_views, engagement_sum, viral_count)
+    SELECT '', platform, COUNT(*), COALESCE(SUM(views), 0), COALESCE(SUM(engagement_rate), 0),
+           COALESCE(SUM(ai_score > {Config.VIRAL_SCORE_THRESHOLD}), 0)
+    FROM viral_videos GROUP BY platform
+    ''',
+    '''
+    INSERT INTO dashboard_counters (period, platform, script_count)
+    SELECT '', '', COUNT(*) FROM generated_scripts WHERE true
+    ON CONFLICT (period, platform) DO UPDATE SET script_count = excluded.script_count
+    ''',
+    '''
+    INSERT INTO dashboard_counters (period, platform, analytics_count, revenue_sum, conversion_sum)
+    SELECT COALESCE(strftime('%Y-%m', date), ''), platform, COUNT(*),
+           COALESCE(SUM(revenue), 0), COALESCE(SUM(conversion_rate), 0)
+    FROM analytics WHERE true GROUP BY 1, 2
+    ON CONFLICT (period, platform) DO UPDATE SET
+        analytics_count = excluded.analytics_count,
+        revenue_sum = excluded.revenue_sum,
+        conversion_sum = excluded.conversion_sum
+    ''',
+]
+
+def parse_hashtags(text: Optional[str]) -> List[str]:
+    """Split a hashtag string like "#passiveincome #sidehustle" into unique lowercase tags"""
+    tags = []
+    for token in re.split(r'[\s,]+', text or ''):
+        tag = token.lstrip('#').lower()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+def _index_video_hashtags(conn: sqlite3.Connection, videos: Iterable[tuple]):
+    """Write (video_id, hashtags) pairs into the normalized hashtag tables"""
+    links = [(video_id, tag) for video_id, hashtags in videos for tag in parse_hashtags(hashtags)]
+    if not links:
+        return
+    
+    conn.executemany('INSERT OR IGNORE INTO hashtags (tag) VALUES (?)', sorted({(tag,) for _, tag in links}))
+    conn.executemany('''
+        INSERT OR IGNORE INTO video_hashtags (video_id, hashtag_id, platform, created_at)
+        SELECT v.id, h.id, v.platform, v.created_at
+        FROM viral_videos v, hashtags h
+        WHERE v.id = ? AND h.tag = ?
+    ''', links)
+
+def _backfill_video_hashtags(conn: sqlite3.Connection):
+    _index_video_hashtags(conn, conn.execute('SELECT id, hashtags FROM viral_videos'))
+
+def _reindex_video_hashtags(conn: sqlite3.Connection):
+    """Rebuild every hashtag link from the stored hashtags column"""
+    conn.execute('DELETE FROM video_hashtags')
+    _backfill_video_hashtags(conn)
+
+# parse_hashtags() in plain SQL, so the trigger works from any SQLite client: separators become
+# spaces, json_quote() escapes the rest and each space then splits the quoted string into a JSON array.
+# (SQLite's lower() only folds ASCII, so non-ASCII capitals stay as written.)
+_HASHTAG_TOKENS_SQL = (
+    "'[' || replace(json_quote(replace(replace(replace(replace(replace(replace(COALESCE(NEW.hashtags, ''), "
+    "',', ' '), char(9), ' '), char(10), ' '), char(11), ' '), char(12), ' '), char(13), ' ')), "
+    "' ', '\",\"') || ']'"
+)
+HASHTAG_RETAG_TRIGGER = f'''
+    CREATE TRIGGER IF NOT EXISTS trg_viral_videos_hashtags_retag
+    AFTER UPDATE OF hashtags ON viral_videos BEGIN
+        DELETE FROM video_hashtags WHERE video_id = NEW.id;
+        INSERT OR IGNORE INTO hashtags (tag)
+        SELECT lower(ltrim(value, '#')) FROM json_each({_HASHTAG_TOKENS_SQL}) WHERE ltrim(value, '#') != '';
+        INSERT OR IGNORE INTO video_hashtags (video_id, hashtag_id, platform, created_at)
+        SELECT NEW.id, h.id, NEW.platform, NEW.created_at
+        FROM json_each({_HASHTAG_TOKENS_SQL}) t JOIN hashtags h ON h.tag = lower(ltrim(t.value, '#'));
+    END
+'''
+
+# Query parameters that identify the video itself; everything else (utm_*, share ids...) is dropped
+URL_IDENTITY_PARAMS = {'v', 'id', 'video_id'}
+
+def normalize_url(url: str) -> str:
+    """Reduce a video URL to a stable dedup key (host without www/m, path, identifying params)"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip('/')
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key in URL_IDENTITY_PARAMS]
+    
+    if host == 'youtu.be' and path:
+        host, query = 'youtube.com', [('v', path.lstrip('/'))]
+        path = '/watch'
+    
+    return f"{host}{path}?{urlencode(sorted(query))}" if query else f"{host}{path}"
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4  # 16-bit LSH bands: fingerprints within 3 bits always share a band
+
+def simhash(text: Optional[str]) -> Optional[int]:
+    """64-bit SimHash of a text's word unigrams and bigrams, as a signed SQLite integer"""
+    words = re.findall(r'\w+', (text or '').lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return None
+    
+    # One row of feature-hash bits per feature, least significant bit first; a bit is set in the
+    # fingerprint when more features have it set than clear
+    digests = b''.join(hashlib.blake2b(feature.encode(), digest_size=8).digest() for feature in features)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8)[:, ::-1], axis=1, bitorder='little')
+    majority = 2 * bits.sum(axis=0, dtype=np.int64) > len(features)
+    fingerprint = int.from_bytes(np.packbits(majority, bitorder='little').tobytes(), 'little')
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+def simhash_bands(fingerprint: int) -> List[int]:
+    unsigned = fingerprint & ((1 << 64) - 1)
+    width = SIMHASH_BITS // SIMHASH_BANDS
+    return [unsigned >> (band * width) & ((1 << width) - 1) for band in range(SIMHASH_BANDS)]
+
+def hamming_distance(a: int, b: int) -> int:
+    return ((a ^ b) & ((1 << 64) - 1)).bit_count()
+
+def _video_fingerprint_text(captions: Optional[str], transcript: Optional[str]) -> str:
+    return f"{captions or ''} {transcript or ''}"
+
+def _find_near_duplicates(conn: sqlite3.Connection, fingerprint: int, max_distance: int,
+                          exclude_id: Optional[int] = None) -> List[tuple]:
+    """LSH lookup: candidates share at least one band, then are confirmed by Hamming distance"""
+    bands = simhash_bands(fingerprint)
+    rows = conn.execute(f'''
+        SELECT DISTINCT v.id, v.simhash FROM video_fingerprints f JOIN viral_videos v ON v.id = f.video_id
+        WHERE {' OR '.join('(f.band = ? AND f.band_value = ?)' for _ in bands)}
+    ''', [value for band, band_value in enumerate(bands) for value in (band, band_value)]).fetchall()
+    
+    matches = [(video_id, hamming_distance(fingerprint, other)) for video_id, other in rows
+               if video_id != exclude_id and other is not None]
+    return sorted((match for match in matches if match[1] <= max_distance), key=lambda match: (match[1], match[0]))
+
+def _index_video_fingerprints(conn: sqlite3.Connection, videos: Iterable[tuple],
+                              max_distance: int = Config.SIMHASH_MAX_DISTANCE):
+    """Store LSH bands for (video_id, simhash) pairs and flag reposts of earlier videos"""
+    for video_id, fingerprint in videos:
+        if fingerprint is None:
+            continue
+        
+        earlier = [match for match in _find_near_duplicates(conn, fingerprint, max_distance, video_id)
+                   if match[0] < video_id]
+        if earlier:
+            original = min(video_id for video_id, _ in earlier)
+            conn.execute('UPDATE viral_videos SET duplicate_of = ? WHERE id = ? AND duplicate_of IS NULL',
+                         (original, video_id))
+        
+        conn.executemany('INSERT OR IGNORE INTO video_fingerprints (band, band_value, video_id) VALUES (?, ?, ?)',
+                         [(band, value, video_id) for band, value in enumerate(simhash_bands(fingerprint))])
+
+def _backfill_video_dedup(conn: sqlite3.Connection):
+    """Fill url_key/simhash for existing rows and merge exact URL duplicates into the oldest row"""
+    rows = conn.execute('SELECT id, url, captions, audio_transcript FROM viral_videos ORDER BY id').fetchall()
+    keep = {}
+    for video_id, url, captions, transcript in rows:
+        key = normalize_url(url)
+        if key in keep:
+            # Later scans carry the fresher metrics
+            conn.execute('''
+                UPDATE viral_videos SET views = (SELECT views FROM viral_videos WHERE id = ?),
+                    engagement_rate = (SELECT engagement_rate FROM viral_videos WHERE id = ?)
+                WHERE id = ?
+            ''', (video_id, video_id, keep[key]))
+            conn.execute('DELETE FROM viral_videos WHERE id = ?', (video_id,))
+            continue
+        keep[key] = video_id
+        conn.execute('UPDATE viral_videos SET url_key = ?, simhash = ? WHERE id = ?',
+                     (key, simhash(_video_fingerprint_text(captions, transcript)), video_id))
+    
+    _index_video_fingerprints(conn, conn.execute('SELECT id, simhash FROM viral_videos ORDER BY id').fetchall())
+
+# Schema migrations, applied in order on startup and tracked in PRAGMA user_version.
+# Each step is either a SQL statement or a callable that receives the connection.
+SCHEMA_MIGRATIONS = [
+    (1, "Create core tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS viral_videos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            url TEXT NOT NULL,
+            views INTEGER DEFAULT 0,
+            engagement_rate REAL DEFAULT 0.0,
+            ai_score INTEGER DEFAULT 0,
+            captions TEXT,
+            hashtags TEXT,
+            status TEXT DEFAULT 'discovered',
+            audio_transcript TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS affiliate_products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            commission_rate INTEGER NOT NULL,
+            commission_amount INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            is_recurring BOOLEAN DEFAULT FALSE,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS generated_scripts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            video_length TEXT NOT NULL,
+            target_audience TEXT NOT NULL,
+            template_type TEXT NOT NULL,
+            ai_generated BOOLEAN DEFAULT TRUE,
+            status TEXT DEFAULT 'generated',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS analytics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            platform TEXT NOT NULL,
+            views INTEGER DEFAULT 0,
+            engagement_rate REAL DEFAULT 0.0,
+            revenue INTEGER DEFAULT 0,
+            conversion_rate REAL DEFAULT 0.0,
+            date TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, "Index the hot query paths", [
+        'CREATE INDEX IF NOT EXISTS idx_viral_videos_score ON viral_videos(ai_score, id)',
+        'CREATE INDEX IF NOT EXISTS idx_viral_videos_platform_status ON viral_videos(platform, status)',
+        'CREATE INDEX IF NOT EXISTS idx_generated_scripts_created ON generated_scripts(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_analytics_platform_date ON analytics(platform, date)',
+    ]),
+    (3, "Maintain dashboard counters incrementally", [
+        '''
+        CREATE TABLE IF NOT EXISTS dashboard_counters (
+            period TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            video_count INTEGER NOT NULL DEFAULT 0,
+            total_views INTEGER NOT NULL DEFAULT 0,
+            engagement_sum REAL NOT NULL DEFAULT 0,
+            viral_count INTEGER NOT NULL DEFAULT 0,
+            script_count INTEGER NOT NULL DEFAULT 0,
+            analytics_count INTEGER NOT NULL DEFAULT 0,
+            revenue_sum INTEGER NOT NULL DEFAULT 0,
+            conversion_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, platform)
+        ) WITHOUT ROWID
+        ''',
+        *COUNTER_TRIGGERS,
+        *COUNTER_REBUILD_SQL,
+    ]),
+    (4, "Full-text search over videos and scripts", [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS viral_videos_fts USING fts5(
+            title, captions, hashtags, audio_transcript, content='viral_videos', content_rowid='id'
+        )
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS generated_scripts_fts USING fts5(
+            title, content, content='generated_scripts', content_rowid='id'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_viral_videos_fts_insert AFTER INSERT ON viral_videos BEGIN
+            INSERT INTO viral_videos_fts (rowid, title, captions, hashtags, audio_transcript)
+            VALUES (NEW.id, NEW.title, NEW.captions, NEW.hashtags, NEW.audio_transcript);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_viral_videos_fts_delete AFTER DELETE ON viral_videos BEGIN
+            INSERT INTO viral_videos_fts (viral_videos_fts, rowid, title, captions, hashtags, audio_transcript)
+            VALUES ('delete', OLD.id, OLD.title, OLD.captions, OLD.hashtags, OLD.audio_transcript);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_viral_videos_fts_update
+        AFTER UPDATE OF title, captions, hashtags, audio_transcript ON viral_videos BEGIN
+            INSERT INTO viral_videos_fts (viral_videos_fts, rowid, title, captions, hashtags, audio_transcript)
+            VALUES ('delete', OLD.id, OLD.title, OLD.captions, OLD.hashtags, OLD.audio_transcript);
+            INSERT INTO viral_videos_fts (rowid, title, captions, hashtags, audio_transcript)
+            VALUES (NEW.id, NEW.title, NEW.captions, NEW.hashtags, NEW.audio_transcript);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_generated_scripts_fts_insert AFTER INSERT ON generated_scripts BEGIN
+            INSERT INTO generated_scripts_fts (rowid, title, content) VALUES (NEW.id, NEW.title, NEW.content);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_generated_scripts_fts_delete AFTER DELETE ON generated_scripts BEGIN
+            INSERT INTO generated_scripts_fts (generated_scripts_fts, rowid, title, content)
+            VALUES ('delete', OLD.id, OLD.title, OLD.content);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_generated_scripts_fts_update
+        AFTER UPDATE OF title, content ON generated_scripts BEGIN
+            INSERT INTO generated_scripts_fts (generated_scripts_fts, rowid, title, content)
+            VALUES ('delete', OLD.id, OLD.title, OLD.content);
+            INSERT INTO generated_scripts_fts (rowid, title, content) VALUES (NEW.id, NEW.title, NEW.content);
+        END
+        ''',
+        "INSERT INTO viral_videos_fts (viral_videos_fts) VALUES ('rebuild')",
+        "INSERT INTO generated_scripts_fts (generated_scripts_fts) VALUES ('rebuild')",
+    ]),
+    (5, "Normalized hashtag index", [
+        'CREATE TABLE IF NOT EXISTS hashtags (id INTEGER PRIMARY KEY, tag TEXT NOT NULL UNIQUE)',
+        '''
+        CREATE TABLE IF NOT EXISTS video_hashtags (
+            video_id INTEGER NOT NULL,
+            hashtag_id INTEGER NOT NULL,
+            platform TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (video_id, hashtag_id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_video_hashtags_tag ON video_hashtags(hashtag_id, video_id)',
+        'CREATE INDEX IF NOT EXISTS idx_video_hashtags_recent ON video_hashtags(created_at, platform, hashtag_id)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_viral_videos_hashtags_delete AFTER DELETE ON viral_videos BEGIN
+            DELETE FROM video_hashtags WHERE video_id = OLD.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_viral_videos_hashtags_update
+        AFTER UPDATE OF platform, created_at ON viral_videos BEGIN
+            UPDATE video_hashtags SET platform = NEW.platform, created_at = NEW.created_at
+            WHERE video_id = NEW.id;
+        END
+        ''',
+        _backfill_video_hashtags,
+    ]),
+    (6, "URL dedup and near-duplicate fingerprints", [
+        # Recreate the counter triggers so they tolerate the new upsert insert path
+        *[f'DROP TRIGGER IF EXISTS {name}' for name in re.findall(r'EXISTS (trg_\w+)', ' '.join(COUNTER_TRIGGERS))],
+        *COUNTER_TRIGGERS,
+        'ALTER TABLE viral_videos ADD COLUMN url_key TEXT',
+        'ALTER TABLE viral_videos ADD COLUMN simhash INTEGER',
+        'ALTER TABLE viral_videos ADD COLUMN duplicate_of INTEGER',
+        '''
+        CREATE TABLE IF NOT EXISTS video_fingerprints (
+            band INTEGER NOT NULL,
+            band_value INTEGER NOT NULL,
+            video_id INTEGER NOT NULL,
+            PRIMARY KEY (band, band_value, video_id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_video_fingerprints_video ON video_fingerprints(video_id)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_viral_videos_fingerprints_delete AFTER DELETE ON viral_videos BEGIN
+            DELETE FROM video_fingerprints WHERE video_id = OLD.id;
+        END
+        ''',
+        _backfill_video_dedup,
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_viral_videos_url_key ON viral_videos(url_key)',
+    ]),
+    (7, "LLM response cache", [
+        '''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            method TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)',
+        'CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at)',
+    ]),
+    (8, "Script request parameters and similarity-cache hits", [
+        "ALTER TABLE generated_scripts ADD COLUMN key_message TEXT NOT NULL DEFAULT ''",
+        'ALTER TABLE generated_scripts ADD COLUMN cache_hits INTEGER NOT NULL DEFAULT 0',
+    ]),
+    (9, "Post outbox", [
+        # status: pending -> sending (leased until next_attempt_at) -> sent, or back to pending / dead
+        '''
+        CREATE TABLE IF NOT EXISTS post_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            platform TEXT NOT NULL,
+            content TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_post_outbox_due ON post_outbox(platform, status, next_attempt_at)',
+    ]),
+    (10, "Durable post delivery marker", [
+        # Set on any successful delivery, even one whose lease had already expired, so a re-delivery
+        # of the same post is skipped after a restart
+        'ALTER TABLE post_outbox ADD COLUMN delivered_at REAL',
+    ]),
+    (11, "Keep hashtag links in sync with viral_videos.hashtags", [
+        HASHTAG_RETAG_TRIGGER,
+        # Upserts used to link a re-scanned row's tags to the existing video
+        _reindex_video_hashtags,
+    ]),
+    (12, "Hashtag relink trigger without app-registered SQL functions", [
+        # An earlier version of migration 11 called a Python function only DatabaseManager registered
+        'DROP TRIGGER IF EXISTS trg_viral_videos_hashtags_retag',
+        HASHTAG_RETAG_TRIGGER,
+    ]),
+]
+
 class DatabaseManager:
+    VIDEO_COLUMNS = ('id', 'title', 'platform', 'url', 'views', 'engagement_rate', 'ai_score',
+                     'captions', 'hashtags', 'status', 'audio_transcript', 'created_at', 'duplicate_of')
+    SCRIPT_COLUMNS = ('id', 'title', 'content', 'content_type', 'video_length', 'target_audience',
+                      'template_type', 'ai_generated', 'status', 'created_at', 'key_message', 'cache_hits')
+    
+    # Upsert: re-discovering a URL refreshes its metrics instead of adding a duplicate row
+    VIDEO_INSERT_SQL = '''
+        INSERT INTO viral_videos 
+        (title, platform, url, views, engagement_rate, ai_score, captions, hashtags, status, audio_transcript,
+         url_key, simhash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (url_key) DO UPDATE SET views = excluded.views, engagement_rate = excluded.engagement_rate
+    '''
+    SCRIPT_INSERT_SQL = '''
+        INSERT INTO generated_scripts 
+        (title, content, content_type, video_length, target_audience, template_type, ai_generated, status,
+         key_message)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    ANALYTICS_INSERT_SQL = '''
+        INSERT INTO analytics (platform, views, engagement_rate, revenue, conversion_rate, date)
+        VALUES (?, ?, ?, ?, ?, COALESCE(NULLIF(?, ''), CURRENT_TIMESTAMP))
+    '''
+    # Pending posts whose retry time has come, plus claimed ones whose lease ran out. No ORDER BY:
+    # the index already yields each status oldest-first and sorting the IN would need a temp b-tree
+    DUE_POSTS_SQL = '''
+        SELECT id, idempotency_key, content, attempts FROM post_outbox
+        WHERE platform = ? AND status IN ('pending', 'sending') AND next_attempt_at <= ?
+        LIMIT ?
+    '''
+    
     def __init__(self, db_file: str = Config.DATABASE_FILE):
         self.db_file = db_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._generation = 0
         self.init_database()
     
-    def init_database(self):
-        """Initialize SQLite database with all required tables"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS viral_videos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                platform TEXT NOT NULL,
-                url TEXT NOT NULL,
-                views INTEGER DEFAULT 0,
-                engagement_rate REAL DEFAULT 0.0,
-                ai_score INTEGER DEFAULT 0,
-                captions TEXT,
-                hashtags TEXT,
-                status TEXT DEFAULT 'discovered',
-                audio_transcript TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS affiliate_products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                category TEXT NOT NULL,
-                commission_rate INTEGER NOT NULL,
-                commission_amount INTEGER NOT NULL,
-                url TEXT NOT NULL,
-                is_recurring BOOLEAN DEFAULT FALSE,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS generated_scripts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                content_type TEXT NOT NULL,
-                video_length TEXT NOT NULL,
-                target_audience TEXT NOT NULL,
-                template_type TEXT NOT NULL,
-                ai_generated BOOLEAN DEFAULT TRUE,
-                status TEXT DEFAULT 'generated',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    def connection(self) -> sqlite3.Connection:
+        """Get this thread's long-lived connection, opening it on first use
+        Opening one also closes the connections of threads that have since finished (per-request server
+        threads, short-lived worker pools), so the number kept open follows the live threads."""
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            conn = sqlite3.connect(
+                self.db_file,
+                isolation_level=None,  # transactions are managed by transaction()
+                check_same_thread=False,  # lets close() shut down every thread's connection
+                cached_statements=Config.DATABASE_STATEMENT_CACHE
             )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS analytics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                platform TEXT NOT NULL,
-                views INTEGER DEFAULT 0,
-                engagement_rate REAL DEFAULT 0.0,
-                revenue INTEGER DEFAULT 0,
-                conversion_rate REAL DEFAULT 0.0,
-                date TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+            for pragma, value in Config.DATABASE_PRAGMAS.items():
+                conn.execute(f"PRAGMA {pragma}={value}")
+            
+            with self._lock:
+                finished = [thread for thread in self._connections if not thread.is_alive()]
+                stale = [self._connections.pop(thread) for thread in finished]
+                self._connections[threading.current_thread()] = conn
+                local.generation = self._generation
+            for old in stale:
+                old.close()
+            local.conn = conn
+            local.depth = 0
+        return local.conn
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Group writes into one transaction; nested calls become savepoints"""
+        conn = self.connection()
+        local = self._local
+        depth = local.depth
+        
+        if depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        else:
+            conn.execute(f'SAVEPOINT sp_{depth}')
+        local.depth = depth + 1
+        
+        try:
+            yield conn
+        except BaseException:
+            local.depth = depth
+            if depth == 0:
+                conn.execute('ROLLBACK')
+            else:
+                conn.execute(f'ROLLBACK TO sp_{depth}')
+                conn.execute(f'RELEASE sp_{depth}')
+            raise
+        
+        local.depth = depth
+        if depth == 0:
+            conn.execute('COMMIT')
+        else:
+            conn.execute(f'RELEASE sp_{depth}')
+    
+    def close(self):
+        """Close every connection opened by this manager, across all threads"""
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), {}
+            self._generation += 1
         
-        conn.commit()
-        conn.close()
+        for conn in connections:
+            try:
+                conn.execute('PRAGMA optimize')  # refresh planner statistics for the hashtag/trend queries
+            except sqlite3.Error:
+                pass
+            conn.close()
+    
+    def __enter__(self) -> 'DatabaseManager':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def init_database(self):
+        """Initialize SQLite database by applying any pending schema migrations"""
+        self.migrate()
+    
+    def migrate(self) -> int:
+        """Apply numbered migrations above PRAGMA user_version and return the new version"""
+        latest = SCHEMA_MIGRATIONS[-1][0]
+        version = self.connection().execute('PRAGMA user_version').fetchone()[0]
+        if version >= latest:
+            return version  # up to date: skip the write lock, the common case for per-job managers
+        
+        with self.transaction() as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            
+            for migration_version, description, statements in SCHEMA_MIGRATIONS:
+                if migration_version <= version:
+                    continue
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {migration_version}')
+                version = migration_version
+        
+        return version
+    
+    def explain(self, sql: str, params: Iterable[Any] = ()) -> List[str]:
+        """Return the EXPLAIN QUERY PLAN detail lines for a query"""
+        rows = self.connection().execute(f'EXPLAIN QUERY PLAN {sql}', tuple(params)).fetchall()
+        return [row[3] for row in rows]
+    
+    def check_query_plans(self) -> Dict[str, Dict[str, Any]]:
+        """Verify that every hot query is served by its index without a temp sort"""
+        hot_queries = {
+            "videos_by_score": (
+                self._keyset_sql('viral_videos', self.VIDEO_COLUMNS, ('ai_score', 'id'), []),
+                [Config.PAGE_SIZE], 'idx_viral_videos_score'
+            ),
+            "videos_by_score_seek": (
+                self._keyset_sql('viral_videos', self.VIDEO_COLUMNS, ('ai_score', 'id'),
+                                 ['(ai_score, id) < (?, ?)']),
+                [90, 1000, Config.PAGE_SIZE], 'idx_viral_videos_score'
+            ),
+            "videos_by_platform_status": (
+                'SELECT COUNT(*) FROM viral_videos WHERE platform = ? AND status = ?',
+                ['TikTok', 'processed'], 'idx_viral_videos_platform_status'
+            ),
+            "scripts_by_created": (
+                self._keyset_sql('generated_scripts', self.SCRIPT_COLUMNS, ('created_at', 'id'), []),
+                [Config.PAGE_SIZE], 'idx_generated_scripts_created'
+            ),
+            "analytics_by_platform_date": (
+                'SELECT SUM(revenue) FROM analytics WHERE platform = ? AND date >= ?',
+                ['TikTok', '2024-01-01'], 'idx_analytics_platform_date'
+            ),
+            "outbox_due": (
+                self.DUE_POSTS_SQL, ['tiktok', 0, 1], 'idx_post_outbox_due'
+            ),
+        }
+        
+        results = {}
+        for name, (sql, params, index) in hot_queries.items():
+            plan = self.explain(sql, params)
+            uses_index = (any(index in line for line in plan)
+                          and not any('TEMP B-TREE' in line for line in plan))
+            results[name] = {"index": index, "uses_index": uses_index, "plan": plan}
+        return results
     
     def insert_viral_video(self, video: ViralVideo) -> int:
         """Insert a viral video record"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO viral_videos 
-            (title, platform, url, views, engagement_rate, ai_score, captions, hashtags, status, audio_transcript)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (video.title, video.platform, video.url, video.views, video.engagement_rate, 
-              video.ai_score, video.captions, video.hashtags, video.status, video.audio_transcript))
-        
-        video_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return video_id
-    
-    def get_viral_videos(self) -> List[ViralVideo]:
-        """Get all viral videos"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM viral_videos ORDER BY ai_score DESC')
-        rows = cursor.fetchall()
-        
-        videos = []
-        for row in rows:
-            videos.append(ViralVideo(
-                id=row[0], title=row[1], platform=row[2], url=row[3], views=row[4],
-                engagement_rate=row[5], ai_score=row[6], captions=row[7], hashtags=row[8],
-                status=row[9], audio_transcript=row[10], created_at=row[11]
-            ))
+        params = self._video_params(video)
+        with self.transaction() as conn:
+            video_id = conn.execute(self.VIDEO_INSERT_SQL + ' RETURNING id', params).fetchone()[0]
+            self._index_video_chunk(conn, [params], [video_id])
+            return video_id
+    
+    def upsert_viral_video(self, video: ViralVideo) -> int:
+        """Insert a video, or refresh views/engagement of the row with the same normalized URL"""
+        return self.insert_viral_video(video)
+    
+    def insert_viral_videos_many(self, videos: Iterable[ViralVideo], chunk_size: int = Config.BULK_CHUNK_SIZE,
+                                 on_chunk: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[int]:
+        """Bulk insert viral videos, returning their ids in input order"""
+        rows = (self._video_params(video) for video in videos)
+        return self._insert_many('viral_videos', self.VIDEO_INSERT_SQL, rows, chunk_size, on_chunk,
+                                 self._index_video_chunk, self._resolve_video_ids)
+    
+    def update_video_scores_many(self, scores: Iterable[tuple]) -> int:
+        """Write (video_id, ai_score, status) analysis results in one transaction"""
+        rows = list(scores)
+        with self.transaction() as conn:
+            conn.executemany('UPDATE viral_videos SET ai_score = ?, status = ? WHERE id = ?',
+                             [(score, status, video_id) for video_id, score, status in rows])
+        return len(rows)
+    
+    def find_near_duplicates(self, text: str, max_distance: int = Config.SIMHASH_MAX_DISTANCE) -> List[tuple]:
+        """Find (video_id, distance) pairs whose captions+transcript fingerprint is close to text"""
+        fingerprint = simhash(text)
+        if fingerprint is None:
+            return []
+        return _find_near_duplicates(self.connection(), fingerprint, max_distance)
+    
+    @staticmethod
+    def _resolve_video_ids(conn: sqlite3.Connection, chunk: List[tuple]) -> List[int]:
+        """Map upserted rows back to ids through their url_key (conflicting rows keep their old id)"""
+        keys = [row[10] for row in chunk]
+        unique_keys = list(dict.fromkeys(keys))
+        ids = dict(conn.execute(
+            f"SELECT url_key, id FROM viral_videos WHERE url_key IN ({', '.join('?' * len(unique_keys))})",
+            unique_keys
+        ).fetchall())
+        return [ids[key] for key in keys]
+    
+    @staticmethod
+    def _index_video_chunk(conn: sqlite3.Connection, chunk: List[tuple], chunk_ids: List[int]):
+        # Upserted rows keep the hashtags and fingerprint they were first stored with, so index what is
+        # in the table rather than the incoming rows
+        unique_ids = sorted(set(chunk_ids))
+        stored = conn.execute(
+            f"SELECT id, hashtags, simhash FROM viral_videos WHERE id IN ({', '.join('?' * len(unique_ids))}) "
+            "ORDER BY id",
+            unique_ids
+        ).fetchall()
+        _index_video_hashtags(conn, [(video_id, hashtags) for video_id, hashtags, _ in stored])
+        _index_video_fingerprints(conn, [(video_id, fingerprint) for video_id, _, fingerprint in stored])
+    
+    def top_hashtags(self, window: Optional[timedelta] = timedelta(days=7), platform: Optional[str] = None,
+                     limit: int = 10) -> List[Dict[str, Any]]:
+        """Most used hashtags among videos discovered within the window (None = all time)"""
+        filters, params = [], []
+        if window is not None:
+            cutoff = datetime.now(timezone.utc) - window
+            filters.append('vh.created_at >= ?')
+            params.append(cutoff.strftime('%Y-%m-%d %H:%M:%S'))
+        if platform:
+            filters.append('vh.platform = ?')
+            params.append(platform)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        
+        rows = self.connection().execute(f'''
+            SELECT h.tag, COUNT(*) AS uses
+            FROM video_hashtags vh JOIN hashtags h ON h.id = vh.hashtag_id
+            {where}
+            GROUP BY vh.hashtag_id
+            ORDER BY uses DESC, h.tag
+            LIMIT ?
+        ''', params + [limit]).fetchall()
+        return [{"tag": f"#{tag}", "videos": uses} for tag, uses in rows]
+    
+    def videos_with_tags(self, all_of: Optional[List[str]] = None, any_of: Optional[List[str]] = None,
+                         limit: Optional[int] = None) -> List[ViralVideo]:
+        """Videos tagged with every hashtag in all_of and at least one in any_of, best AI score first"""
+        all_tags = parse_hashtags(' '.join(all_of or []))
+        any_tags = parse_hashtags(' '.join(any_of or []))
+        if not all_tags and not any_tags:
+            return []
+        
+        subqueries, params = [], []
+        if all_tags:
+            subqueries.append(f'''
+                SELECT vh.video_id FROM video_hashtags vh JOIN hashtags h ON h.id = vh.hashtag_id
+                WHERE h.tag IN ({', '.join('?' * len(all_tags))})
+                GROUP BY vh.video_id HAVING COUNT(*) = ?
+            ''')
+            params.extend(all_tags + [len(all_tags)])
+        if any_tags:
+            subqueries.append(f'''
+                SELECT vh.video_id FROM video_hashtags vh JOIN hashtags h ON h.id = vh.hashtag_id
+                WHERE h.tag IN ({', '.join('?' * len(any_tags))})
+            ''')
+            params.extend(any_tags)
+        
+        rows = self.connection().execute(f'''
+            SELECT {', '.join(self.VIDEO_COLUMNS)} FROM viral_videos
+            WHERE id IN ({' INTERSECT '.join(subqueries)})
+            ORDER BY ai_score DESC, id DESC
+            LIMIT ?
+        ''', params + [limit if limit is not None else -1]).fetchall()
+        return [ViralVideo(*row) for row in rows]
+    
+    def get_viral_videos(self, columns: Optional[Iterable[str]] = None) -> List[ViralVideo]:
+        """Get all viral videos, optionally fetching only the given columns"""
+        return list(self.iter_viral_videos(columns=columns))
+    
+    def iter_viral_videos(self, page_size: int = Config.PAGE_SIZE, platform: Optional[str] = None,
+                          status: Optional[str] = None, min_score: Optional[int] = None,
+                          columns: Optional[Iterable[str]] = None,
+                          include_duplicates: bool = True) -> Iterator[ViralVideo]:
+        """Stream viral videos by AI score, one keyset page at a time"""
+        filters, params = self._video_filters(platform, status, min_score, include_duplicates)
+        order_by = ('ai_score', 'id')
+        selected = self._resolve_columns(self.VIDEO_COLUMNS, columns, order_by)
         
-        conn.close()
-        return videos
+        rows = self._iter_keyset('viral_videos', selected, order_by, filters, params, page_size)
+        return self._build_rows(rows, selected, self.VIDEO_COLUMNS, ViralVideo, LazyViralVideo)
+    
+    def count_viral_videos(self, platform: Optional[str] = None, status: Optional[str] = None,
+                           min_score: Optional[int] = None, include_duplicates: bool = True) -> int:
+        """Count viral videos matching the same filters as iter_viral_videos"""
+        filters, params = self._video_filters(platform, status, min_score, include_duplicates)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        return self.connection().execute(f'SELECT COUNT(*) FROM viral_videos {where}', params).fetchone()[0]
+    
+    @staticmethod
+    def _video_filters(platform: Optional[str], status: Optional[str],
+                       min_score: Optional[int], include_duplicates: bool = True) -> tuple:
+        filters, params = [], []
+        if platform:
+            filters.append('platform = ?')
+            params.append(platform)
+        if status:
+            filters.append('status = ?')
+            params.append(status)
+        if min_score is not None:
+            filters.append('ai_score >= ?')
+            params.append(min_score)
+        if not include_duplicates:
+            filters.append('duplicate_of IS NULL')
+        return filters, params
+    
+    def _iter_keyset(self, table: str, columns: tuple, order_by: tuple, filters: List[str],
+                     params: List[Any], page_size: int) -> Iterator[tuple]:
+        """Walk a table in descending order_by order, seeking past the last row of each page"""
+        key_positions = [columns.index(column) for column in order_by]
+        seek_clause = f"({', '.join(order_by)}) < ({', '.join('?' * len(order_by))})"
+        last_key = None
+        
+        while True:
+            where = list(filters)
+            page_params = list(params)
+            if last_key is not None:
+                where.append(seek_clause)
+                page_params.extend(last_key)
+            
+            sql = self._keyset_sql(table, columns, order_by, where)
+            rows = self.connection().execute(sql, page_params + [page_size]).fetchall()
+            
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_key = [rows[-1][position] for position in key_positions]
+    
+    @staticmethod
+    def _keyset_sql(table: str, columns: tuple, order_by: tuple, where: List[str]) -> str:
+        where_clause = f"WHERE {' AND '.join(where)}" if where else ""
+        order_clause = ', '.join(f'{column} DESC' for column in order_by)
+        return f"SELECT {', '.join(columns)} FROM {table} {where_clause} ORDER BY {order_clause} LIMIT ?"
     
     def insert_script(self, script: GeneratedScript) -> int:
         """Insert a generated script"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            cursor = conn.execute(self.SCRIPT_INSERT_SQL, self._script_params(script))
+            return cursor.lastrowid
+    
+    def get_script(self, script_id: int) -> Optional[GeneratedScript]:
+        """Fetch one generated script by id"""
+        row = self.connection().execute(
+            f"SELECT {', '.join(self.SCRIPT_COLUMNS)} FROM generated_scripts WHERE id = ?", (script_id,)
+        ).fetchone()
+        return GeneratedScript(*row) if row else None
+    
+    def record_script_hit(self, script_id: int):
+        """Count a near-duplicate request that was served this script"""
+        with self.transaction() as conn:
+            conn.execute('UPDATE generated_scripts SET cache_hits = cache_hits + 1 WHERE id = ?', (script_id,))
+    
+    def recent_script_requests(self, limit: int) -> List[tuple]:
+        """(id, content_type, video_length, target_audience, key_message, template_type) of the newest
+        scripts that recorded their request parameters"""
+        return self.connection().execute('''
+            SELECT id, content_type, video_length, target_audience, key_message, template_type
+            FROM generated_scripts WHERE key_message != '' AND title != ?
+            ORDER BY created_at DESC, id DESC LIMIT ?
+        ''', (SCRIPT_ERROR_TITLE, limit)).fetchall()
+    
+    @staticmethod
+    def post_key(platform: str, content: str) -> str:
+        """Idempotency key for one piece of content on one platform"""
+        return hashlib.sha256(f"{platform}\0{content}".encode()).hexdigest()
+    
+    def enqueue_posts(self, content: str, platforms: Iterable[str]) -> List[str]:
+        """Queue content for each platform; returns the idempotency keys of rows that were new"""
+        now = time.time()
+        added = []
+        with self.transaction() as conn:
+            for platform in platforms:
+                key = self.post_key(platform, content)
+                cursor = conn.execute('''
+                    INSERT INTO post_outbox (idempotency_key, platform, content, next_attempt_at, created_at)
+                    VALUES (?, ?, ?, ?, ?) ON CONFLICT (idempotency_key) DO NOTHING
+                ''', (key, platform, content, now, now))
+                if cursor.rowcount:
+                    added.append(key)
+        return added
+    
+    def claim_posts(self, platform: str, limit: int = 1,
+                    lease_seconds: float = Config.OUTBOX_LEASE_SECONDS) -> List[tuple]:
+        """Lease up to limit due posts as (id, idempotency_key, content, attempts); attempts counts this one"""
+        now = time.time()
+        with self.transaction() as conn:
+            rows = conn.execute(self.DUE_POSTS_SQL, (platform, now, limit)).fetchall()
+            conn.executemany('''
+                UPDATE post_outbox SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?
+                WHERE id = ?
+            ''', [(now + lease_seconds, row[0]) for row in rows])
+        return [(post_id, key, content, attempts + 1) for post_id, key, content, attempts in rows]
+    
+    def complete_post(self, post_id: int, attempts: int) -> bool:
+        """Record a delivery and mark the post sent; False when the claim for `attempts` was no longer
+        current (lease expired), in which case only the delivery marker is written"""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('UPDATE post_outbox SET delivered_at = COALESCE(delivered_at, ?) WHERE id = ?',
+                         (now, post_id))
+            return conn.execute('''
+                UPDATE post_outbox SET status = 'sent', sent_at = ?, last_error = NULL
+                WHERE id = ? AND status = 'sending' AND attempts = ?
+            ''', (now, post_id, attempts)).rowcount == 1
+    
+    def fail_post(self, post_id: int, attempts: int, error: str, retry_in: Optional[float]) -> bool:
+        """Schedule another attempt in retry_in seconds, or dead-letter the post when retry_in is None.
+        A stale claim (lease expired, post re-claimed or already sent) changes nothing and returns False."""
+        with self.transaction() as conn:
+            if retry_in is None:
+                cursor = conn.execute('''
+                    UPDATE post_outbox SET status = 'dead', last_error = ?
+                    WHERE id = ? AND status = 'sending' AND attempts = ?
+                ''', (error, post_id, attempts))
+            else:
+                cursor = conn.execute('''
+                    UPDATE post_outbox SET status = 'pending', last_error = ?, next_attempt_at = ?
+                    WHERE id = ? AND status = 'sending' AND attempts = ?
+                ''', (error, time.time() + retry_in, post_id, attempts))
+            return cursor.rowcount == 1
+    
+    def post_delivered(self, post_id: int) -> bool:
+        """Whether any earlier attempt already delivered this post"""
+        row = self.connection().execute('SELECT delivered_at FROM post_outbox WHERE id = ?', (post_id,)).fetchone()
+        return bool(row and row[0] is not None)
+    
+    def requeue_dead_posts(self, platform: Optional[str] = None) -> int:
+        """Give dead-lettered posts a fresh set of attempts"""
+        platform_filter = "AND platform = ?" if platform else ""
+        with self.transaction() as conn:
+            return conn.execute(f'''
+                UPDATE post_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+                WHERE status = 'dead' {platform_filter}
+            ''', (time.time(), *((platform,) if platform else ()))).rowcount
+    
+    def outbox_counts(self) -> Dict[str, Dict[str, int]]:
+        """{platform: {status: count}}"""
+        counts: Dict[str, Dict[str, int]] = {}
+        for platform, status, count in self.connection().execute(
+                'SELECT platform, status, COUNT(*) FROM post_outbox GROUP BY platform, status'):
+            counts.setdefault(platform, {})[status] = count
+        return counts
+    
+    def insert_scripts_many(self, scripts: Iterable[GeneratedScript], chunk_size: int = Config.BULK_CHUNK_SIZE,
+                            on_chunk: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[int]:
+        """Bulk insert generated scripts, returning their ids in input order"""
+        rows = (self._script_params(script) for script in scripts)
+        return self._insert_many('generated_scripts', self.SCRIPT_INSERT_SQL, rows, chunk_size, on_chunk)
+    
+    def insert_analytics_many(self, records: Iterable[Analytics], chunk_size: int = Config.BULK_CHUNK_SIZE,
+                              on_chunk: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[int]:
+        """Bulk insert analytics records, returning their ids in input order"""
+        rows = ((record.platform, record.views, record.engagement_rate, record.revenue,
+                 record.conversion_rate, record.date) for record in records)
+        return self._insert_many('analytics', self.ANALYTICS_INSERT_SQL, rows, chunk_size, on_chunk)
+    
+    def _insert_many(self, table: str, sql: str, rows: Iterable[tuple], chunk_size: int,
+                     on_chunk: Optional[Callable[[Dict[str, Any]], None]],
+                     index_chunk: Optional[Callable[[sqlite3.Connection, List[tuple], List[int]], None]] = None,
+                     resolve_ids: Optional[Callable[[sqlite3.Connection, List[tuple]], List[int]]] = None) -> List[int]:
+        """Write rows in chunked executemany transactions and report per-chunk throughput"""
+        ids: List[int] = []
+        rows = iter(rows)
+        chunk_number = 0
         
-        cursor.execute('''
-            INSERT INTO generated_scripts 
-            (title, content, content_type, video_length, target_audience, template_type, ai_generated, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (script.title, script.content, script.content_type, script.video_length,
-              script.target_audience, script.template_type, script.ai_generated, script.status))
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            
+            started = time.perf_counter()
+            with self.transaction() as conn:
+                conn.executemany(sql, chunk)
+                if resolve_ids:
+                    chunk_ids = resolve_ids(conn, chunk)
+                else:
+                    # The write lock is held for the whole chunk, so AUTOINCREMENT ids are consecutive
+                    last_id = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()[0]
+                    chunk_ids = list(range(last_id - len(chunk) + 1, last_id + 1))
+                if index_chunk:
+                    index_chunk(conn, chunk, chunk_ids)
+            elapsed = time.perf_counter() - started
+            
+            ids.extend(chunk_ids)
+            chunk_number += 1
+            if on_chunk:
+                on_chunk({
+                    "table": table,
+                    "chunk": chunk_number,
+                    "rows": len(chunk),
+                    "seconds": elapsed,
+                    "rows_per_second": len(chunk) / elapsed if elapsed else float('inf')
+                })
         
-        script_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return script_id
+        return ids
+    
+    @staticmethod
+    def _video_params(video: ViralVideo) -> tuple:
+        return (video.title, video.platform, video.url, video.views, video.engagement_rate,
+                video.ai_score, video.captions, video.hashtags, video.status, video.audio_transcript,
+                normalize_url(video.url), simhash(_video_fingerprint_text(video.captions, video.audio_transcript)))
+    
+    @staticmethod
+    def _script_params(script: GeneratedScript) -> tuple:
+        return (script.title, script.content, script.content_type, script.video_length,
+                script.target_audience, script.template_type, script.ai_generated, script.status,
+                script.key_message)
     
-    def get_scripts(self) -> List[GeneratedScript]:
-        """Get all generated scripts"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+    def get_scripts(self, columns: Optional[Iterable[str]] = None) -> List[GeneratedScript]:
+        """Get all generated scripts, optionally fetching only the given columns"""
+        return list(self.iter_scripts(columns=columns))
+    
+    def iter_scripts(self, page_size: int = Config.PAGE_SIZE, status: Optional[str] = None,
+                     columns: Optional[Iterable[str]] = None) -> Iterator[GeneratedScript]:
+        """Stream generated scripts newest first, one keyset page at a time"""
+        filters, params = [], []
+        if status:
+            filters.append('status = ?')
+            params.append(status)
+        order_by = ('created_at', 'id')
+        selected = self._resolve_columns(self.SCRIPT_COLUMNS, columns, order_by)
         
-        cursor.execute('SELECT * FROM generated_scripts ORDER BY created_at DESC')
-        rows = cursor.fetchall()
+        rows = self._iter_keyset('generated_scripts', selected, order_by, filters, params, page_size)
+        return self._build_rows(rows, selected, self.SCRIPT_COLUMNS, GeneratedScript, LazyGeneratedScript)
+    
+    @staticmethod
+    def _resolve_columns(all_columns: tuple, columns: Optional[Iterable[str]], required: tuple) -> tuple:
+        """Validate a column projection, keeping table order and the columns pagination needs"""
+        if columns is None:
+            return all_columns
         
-        scripts = []
+        columns = set(columns)
+        unknown = columns.difference(all_columns)
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        return tuple(column for column in all_columns if column in columns or column in required)
+    
+    def _build_rows(self, rows: Iterable[tuple], selected: tuple, all_columns: tuple,
+                    model: type, lazy_model: type) -> Iterator[Any]:
+        """Turn result tuples into row models; projected rows load skipped large fields lazily"""
+        if selected == all_columns:
+            for row in rows:
+                yield model(*row)
+            return
+        
+        unloaded = [model.__dict__[name] for name in lazy_model.lazy_fields if name not in selected]
         for row in rows:
-            scripts.append(GeneratedScript(
-                id=row[0], title=row[1], content=row[2], content_type=row[3],
-                video_length=row[4], target_audience=row[5], template_type=row[6],
-                ai_generated=row[7], status=row[8], created_at=row[9]
-            ))
+            item = lazy_model(**dict(zip(selected, row)))
+            item._db = self
+            for slot in unloaded:
+                slot.__set__(item, _UNLOADED)
+            yield item
+    
+    def _load_column(self, table: str, column: str, row_id: int) -> Any:
+        """Fetch one column of one row, used by lazy row models"""
+        known = {'viral_videos': self.VIDEO_COLUMNS, 'generated_scripts': self.SCRIPT_COLUMNS}
+        if column not in known[table]:
+            raise ValueError(f"Unknown column {column} for {table}")
+        row = self.connection().execute(f'SELECT {column} FROM {table} WHERE id = ?', (row_id,)).fetchone()
+        return row[0] if row else None
+    
+    def search(self, query: str, limit: int = 20, platform: Optional[str] = None) -> SearchResults:
+        """Full-text search captions, hashtags, transcripts and scripts, best bm25 matches of each kind"""
+        try:
+            return self._search(query, limit, platform)
+        except sqlite3.OperationalError:
+            # Not valid FTS5 syntax (e.g. "$8,600"): search for the words literally instead
+            quoted = ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+            return self._search(quoted, limit, platform) if quoted else SearchResults()
+    
+    def _search(self, query: str, limit: int, platform: Optional[str]) -> SearchResults:
+        conn = self.connection()
+        platform_filter = "AND v.platform = ?" if platform else ""
+        params = [query, platform, limit] if platform else [query, limit]
+        
+        videos = conn.execute(f'''
+            SELECT 'video', v.id, v.title, v.platform, bm25(viral_videos_fts),
+                   snippet(viral_videos_fts, -1, '[', ']', '...', 12)
+            FROM viral_videos_fts JOIN viral_videos v ON v.id = viral_videos_fts.rowid
+            WHERE viral_videos_fts MATCH ? {platform_filter}
+            ORDER BY bm25(viral_videos_fts) LIMIT ?
+        ''', params).fetchall()
+        
+        # Scripts have no platform, so they only appear in unfiltered searches. bm25 depends on each
+        # table's own term statistics, so the two result sets are ranked separately, never merged.
+        scripts = []
+        if not platform:
+            scripts = conn.execute('''
+                SELECT 'script', s.id, s.title, '', bm25(generated_scripts_fts),
+                       snippet(generated_scripts_fts, -1, '[', ']', '...', 12)
+                FROM generated_scripts_fts JOIN generated_scripts s ON s.id = generated_scripts_fts.rowid
+                WHERE generated_scripts_fts MATCH ?
+                ORDER BY bm25(generated_scripts_fts) LIMIT ?
+            ''', (query, limit)).fetchall()
+        
+        return SearchResults([SearchHit(*row) for row in videos], [SearchHit(*row) for row in scripts])
+    
+    def get_dashboard_aggregates(self, viral_threshold: int = Config.VIRAL_SCORE_THRESHOLD) -> Dict[str, Any]:
+        """Compute dashboard totals in a single SQL round trip"""
+        row = self.connection().execute('''
+            SELECT
+                (SELECT COALESCE(SUM(views), 0) FROM viral_videos),
+                (SELECT COALESCE(AVG(engagement_rate), 0) FROM viral_videos),
+                (SELECT COUNT(*) FROM viral_videos WHERE ai_score > ?),
+                (SELECT COUNT(*) FROM generated_scripts),
+                (SELECT COALESCE(SUM(revenue), 0) FROM analytics WHERE date >= strftime('%Y-%m-01', 'now')),
+                (SELECT COALESCE(AVG(conversion_rate), 0) FROM analytics WHERE date >= strftime('%Y-%m-01', 'now'))
+        ''', (viral_threshold,)).fetchone()
         
-        conn.close()
-        return scripts
+        total_views, avg_engagement, viral_count, script_count, monthly_revenue, conversion_rate = row
+        return {
+            "total_views": total_views,
+            "avg_engagement": avg_engagement,
+            "viral_videos_found": viral_count,
+            "videos_created": script_count,
+            "monthly_revenue": monthly_revenue,
+            "conversion_rate": conversion_rate
+        }
+    
+    def get_dashboard_counters(self, platform: Optional[str] = None) -> Dict[str, Any]:
+        """Read dashboard totals from the trigger-maintained counters table
+        Scripts have no platform, so a platform view reports videos_created as None rather than 0."""
+        platform_filter = "AND platform = ?" if platform else ""
+        params = (platform,) if platform else ()
+        row = self.connection().execute(f'''
+            SELECT
+                COALESCE(SUM(video_count), 0), COALESCE(SUM(total_views), 0), COALESCE(SUM(engagement_sum), 0),
+                COALESCE(SUM(viral_count), 0), COALESCE(SUM(script_count), 0),
+                COALESCE(SUM(analytics_count), 0), COALESCE(SUM(revenue_sum), 0), COALESCE(SUM(conversion_sum), 0)
+            FROM dashboard_counters
+            WHERE period IN ('', strftime('%Y-%m', 'now')) {platform_filter}
+        ''', params).fetchone()
+        
+        video_count, total_views, engagement_sum, viral_count, script_count, \
+            analytics_count, revenue_sum, conversion_sum = row
+        return {
+            "total_views": total_views,
+            "avg_engagement": engagement_sum / video_count if video_count else 0,
+            "viral_videos_found": viral_count,
+            "videos_created": None if platform else script_count,
+            "monthly_revenue": revenue_sum,
+            "conversion_rate": conversion_sum / analytics_count if analytics_count else 0
+        }
+    
+    def rebuild_counters(self):
+        """Recompute dashboard counters from the base tables to recover from drift"""
+        with self.transaction() as conn:
+            for statement in COUNTER_REBUILD_SQL:
+                conn.execute(statement)
     
     def seed_sample_data(self):
         """Populate database with sample data"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        # Clear existing data
-        cursor.execute('DELETE FROM viral_videos')
-        cursor.execute('DELETE FROM affiliate_products')
-        cursor.execute('DELETE FROM generated_scripts')
-        cursor.execute('DELETE FROM analytics')
-        
-        # Insert sample viral videos
-        sample_videos = [
-            ("How I Make $8,600/Month in Passive Income (Work 2 Hours Daily)", "TikTok", "https://tiktok.com/sample1", 
-             1200000, 12.5, 94, "Lost my waitressing job during pandemic. Now I make $8,600/month with affiliate marketing...", 
-             "#passiveincome #affiliatemarketing #sidehustle", "processed", "Hey everyone, so I know this sounds crazy..."),
-            ("5 AI Tools That Actually Make Money (I Made $3,200 This Week)", "Instagram", "https://instagram.com/sample2",
-             890000, 9.8, 87, "After testing 50+ AI tools, these 5 actually generate income...",
-             "#aitools #generativeai #makemoneywithai", "processed", "I've tested over 50 different AI tools..."),
-            ("Wealth Building Secrets They Don't Want You to Know", "YouTube", "https://youtube.com/sample3",
-             650000, 11.2, 89, "The wealth building strategies that made me $25K last month...",
-             "#wealthbuilding #passiveincome #investing", "processed", "What I'm about to share with you..."),
-            ("ChatGPT + This Tool = $500/Day (AI Money Method)", "TikTok", "https://tiktok.com/sample4",
-             750000, 10.3, 91, "Everyone uses ChatGPT wrong. I combine it with this one tool...",
-             "#chatgpt #aitools #makemoneywithai", "processed", "Most people are using ChatGPT completely wrong..."),
-            ("How AI Automation Replaced My 9-5 Income", "YouTube", "https://youtube.com/sample6",
-             580000, 11.8, 92, "AI didn't take my job - it gave me a better one...",
-             "#aiautomation #artificialintelligence #makemoneywithai", "processed", "A year ago I was making $60,000...")
-        ]
-        
-        for video_data in sample_videos:
-            cursor.execute('''
-                INSERT INTO viral_videos (title, platform, url, views, engagement_rate, ai_score, captions, hashtags, status, audio_transcript)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', video_data)
-        
-        # Insert affiliate products
-        for product in Config.AFFILIATE_PRODUCTS:
-            cursor.execute('''
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Clear existing data
+            cursor.execute('DELETE FROM viral_videos')
+            cursor.execute('DELETE FROM affiliate_products')
+            cursor.execute('DELETE FROM generated_scripts')
+            cursor.execute('DELETE FROM analytics')
+            
+            # Insert sample viral videos
+            sample_videos = [
+                ("How I Make $8,600/Month in Passive Income (Work 2 Hours Daily)", "TikTok", "https://tiktok.com/sample1", 
+                 1200000, 12.5, 94, "Lost my waitressing job during pandemic. Now I make $8,600/month with affiliate marketing...", 
+                 "#passiveincome #affiliatemarketing #sidehustle", "processed", "Hey everyone, so I know this sounds crazy..."),
+                ("5 AI Tools That Actually Make Money (I Made $3,200 This Week)", "Instagram", "https://instagram.com/sample2",
+                 890000, 9.8, 87, "After testing 50+ AI tools, these 5 actually generate income...",
+                 "#aitools #generativeai #makemoneywithai", "processed", "I've tested over 50 different AI tools..."),
+                ("Wealth Building Secrets They Don't Want You to Know", "YouTube", "https://youtube.com/sample3",
+                 650000, 11.2, 89, "The wealth building strategies that made me $25K last month...",
+                 "#wealthbuilding #passiveincome #investing", "processed", "What I'm about to share with you..."),
+                ("ChatGPT + This Tool = $500/Day (AI Money Method)", "TikTok", "https://tiktok.com/sample4",
+                 750000, 10.3, 91, "Everyone uses ChatGPT wrong. I combine it with this one tool...",
+                 "#chatgpt #aitools #makemoneywithai", "processed", "Most people are using ChatGPT completely wrong..."),
+                ("How AI Automation Replaced My 9-5 Income", "YouTube", "https://youtube.com/sample6",
+                 580000, 11.8, 92, "AI didn't take my job - it gave me a better one...",
+                 "#aiautomation #artificialintelligence #makemoneywithai", "processed", "A year ago I was making $60,000...")
+            ]
+            
+            self.insert_viral_videos_many(ViralVideo(None, *video) for video in sample_videos)
+            
+            # Insert affiliate products
+            cursor.executemany('''
                 INSERT INTO affiliate_products (name, category, commission_rate, commission_amount, url, is_recurring)
                 VALUES (?, ?, ?, ?, ?, ?)
-            ''', (product['name'], product['category'], product['commission_rate'], 
-                  product['commission_amount'], product['url'], product['is_recurring']))
-        
-        # Insert sample scripts
-        sample_scripts = [
-            ("Morning Motivation: Start Your Side Hustle Today", 
-             "🎯 Hook: 'I used to hate Monday mornings. Now I wake up excited because my side hustle made me $500 while I slept.'\n\n❗ Problem: 'Most people are stuck in jobs they hate, living paycheck to paycheck, with no way out.'\n\n💡 Solution: 'I discovered affiliate marketing - promoting products I believe in and earning commissions.'\n\n📊 Proof: 'In 6 months, I went from $0 to $8,600/month working just 2 hours daily.'\n\n📞 Call to Action: 'Comment START if you want the exact blueprint I used. It's completely free.'",
-             "Motivational", "60 seconds", "Aspiring Entrepreneurs", "success-story", True, "approved"),
-            ("5 AI Tools That Actually Make Money (Not ChatGPT)",
-             "🎯 Hook: 'Everyone talks about ChatGPT, but these 5 AI tools actually generate income.'\n\n❗ Problem: 'Most people use AI tools for fun, not profit. They're missing the real money-making opportunities.'\n\n💡 Solution: 'I use Jasper AI for content, Systeme.io for automation, and 3 other tools to create multiple income streams.'\n\n📊 Proof: 'Last month: $3,200 from AI-generated content, $2,100 from automation, $1,800 from AI affiliate commissions.'\n\n📞 Call to Action: 'Drop a 🤖 if you want my complete AI money-making toolkit.'",
-             "AI Tools Review", "45 seconds", "Tech-Savvy Entrepreneurs", "tips-tricks", True, "approved"),
-            ("Wealth Building Secrets Rich People Don't Share",
-             "🎯 Hook: 'Rich people have 7 income streams. Poor people have 1. Here's how to build yours.'\n\n❗ Problem: 'You're trading time for money. Rich people make money work for them while they sleep.'\n\n💡 Solution: 'I built multiple passive income streams: affiliate marketing, course sales, and recurring commissions.'\n\n📊 Proof: 'Stream 1: $2,400/month. Stream 2: $1,800/month. Stream 3: $4,400/month. Total: $8,600/month.'\n\n📞 Call to Action: 'Comment WEALTH if you want my 7-stream income blueprint.'",
-             "Wealth Building", "75 seconds", "Wealth Seekers", "success-story", True, "approved")
-        ]
-        
-        for script_data in sample_scripts:
-            cursor.execute('''
-                INSERT INTO generated_scripts (title, content, content_type, video_length, target_audience, template_type, ai_generated, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', script_data)
-        
-        # Insert sample analytics
-        sample_analytics = [
-            ("TikTok", 1200000, 12.5, 2400, 4.2),
-            ("Instagram", 890000, 9.8, 1800, 3.8),
-            ("YouTube", 650000, 11.2, 1400, 5.1)
-        ]
-        
-        for analytics_data in sample_analytics:
-            cursor.execute('''
+            ''', [(product['name'], product['category'], product['commission_rate'], 
+                   product['commission_amount'], product['url'], product['is_recurring'])
+                  for product in Config.AFFILIATE_PRODUCTS])
+            
+            # Insert sample scripts
+            sample_scripts = [
+                ("Morning Motivation: Start Your Side Hustle Today", 
+                 "🎯 Hook: 'I used to hate Monday mornings. Now I wake up excited because my side hustle made me $500 while I slept.'\n\n❗ Problem: 'Most people are stuck in jobs they hate, living paycheck to paycheck, with no way out.'\n\n💡 Solution: 'I discovered affiliate marketing - promoting products I believe in and earning commissions.'\n\n📊 Proof: 'In 6 months, I went from $0 to $8,600/month working just 2 hours daily.'\n\n📞 Call to Action: 'Comment START if you want the exact blueprint I used. It's completely free.'",
+                 "Motivational", "60 seconds", "Aspiring Entrepreneurs", "success-story", True, "approved",
+                 "Start a side hustle that earns while you sleep"),
+                ("5 AI Tools That Actually Make Money (Not ChatGPT)",
+                 "🎯 Hook: 'Everyone talks about ChatGPT, but these 5 AI tools actually generate income.'\n\n❗ Problem: 'Most people use AI tools for fun, not profit. They're missing the real money-making opportunities.'\n\n💡 Solution: 'I use Jasper AI for content, Systeme.io for automation, and 3 other tools to create multiple income streams.'\n\n📊 Proof: 'Last month: $3,200 from AI-generated content, $2,100 from automation, $1,800 from AI affiliate commissions.'\n\n📞 Call to Action: 'Drop a 🤖 if you want my complete AI money-making toolkit.'",
+                 "AI Tools Review", "45 seconds", "Tech-Savvy Entrepreneurs", "tips-tricks", True, "approved",
+                 "AI tools that actually make money"),
+                ("Wealth Building Secrets Rich People Don't Share",
+                 "🎯 Hook: 'Rich people have 7 income streams. Poor people have 1. Here's how to build yours.'\n\n❗ Problem: 'You're trading time for money. Rich people make money work for them while they sleep.'\n\n💡 Solution: 'I built multiple passive income streams: affiliate marketing, course sales, and recurring commissions.'\n\n📊 Proof: 'Stream 1: $2,400/month. Stream 2: $1,800/month. Stream 3: $4,400/month. Total: $8,600/month.'\n\n📞 Call to Action: 'Comment WEALTH if you want my 7-stream income blueprint.'",
+                 "Wealth Building", "75 seconds", "Wealth Seekers", "success-story", True, "approved",
+                 "Build multiple passive income streams")
+            ]
+            
+            cursor.executemany(self.SCRIPT_INSERT_SQL, sample_scripts)
+            
+            # Insert sample analytics
+            sample_analytics = [
+                ("TikTok", 1200000, 12.5, 2400, 4.2),
+                ("Instagram", 890000, 9.8, 1800, 3.8),
+                ("YouTube", 650000, 11.2, 1400, 5.1)
+            ]
+            
+            cursor.executemany('''
                 INSERT INTO analytics (platform, views, engagement_rate, revenue, conversion_rate)
                 VALUES (?, ?, ?, ?, ?)
-            ''', analytics_data)
+            ''', sample_analytics)
         
-        conn.commit()
-        conn.close()
         print("Database seeded with sample data successfully!")
 
+class ResponseCache:
+    """Two-tier LLM response cache: an in-process LRU in front of the llm_cache table"""
+    
+    EVICT_EVERY = 100  # sets between size checks on the SQLite tier
+    
+    def __init__(self, db: DatabaseManager, max_memory_entries: int = Config.LLM_CACHE_MEMORY_ENTRIES,
+                 max_rows: int = Config.LLM_CACHE_MAX_ROWS, ttls: Optional[Dict[str, int]] = None):
+        self.db = db
+        self.max_memory_entries = max_memory_entries
+        self.max_rows = max_rows
+        self.ttls = Config.LLM_CACHE_TTLS if ttls is None else ttls
+        self._memory: OrderedDict = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+        self._sets_since_evict = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str,
+                 response_format: Optional[Dict[str, Any]] = None) -> str:
+        payload = json.dumps([model, system_prompt, user_prompt, response_format], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def ttl_for(self, method: str) -> int:
+        return self.ttls.get(method, Config.LLM_CACHE_DEFAULT_TTL)
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, checking memory first and then SQLite"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            if entry:
+                del self._memory[key]
+        
+        row = self.db.connection().execute(
+            'SELECT response, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        self.db.connection().execute('UPDATE llm_cache SET last_access = ? WHERE key = ?', (now, key))
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, row[1], row[0])
+        return row[0]
+    
+    def set(self, key: str, method: str, response: str):
+        """Store a response in both tiers using the method's TTL"""
+        ttl = self.ttl_for(method)
+        if ttl <= 0:
+            return
+        
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO llm_cache (key, method, response, created_at, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, method, response, now, now + ttl, now))
+        
+        with self._lock:
+            self._remember(key, now + ttl, response)
+            self._sets_since_evict += 1
+            evict = self._sets_since_evict >= self.EVICT_EVERY
+            if evict:
+                self._sets_since_evict = 0
+        if evict:
+            self.evict()
+    
+    def evict(self):
+        """Drop expired rows, then the least recently used ones above max_rows"""
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (time.time(),))
+            conn.execute('''
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access
+                    LIMIT MAX(0, (SELECT COUNT(*) FROM llm_cache) - ?)
+                )
+            ''', (self.max_rows,))
+    
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM llm_cache')
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory)
+            }
+    
+    def _remember(self, key: str, expires_at: float, response: str):
+        # Caller holds self._lock
+        self._memory[key] = (expires_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+class AIServiceUnavailable(RuntimeError):
+    """Raised when an AI call exhausts its retries or the circuit breaker is open"""
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Local approximation of the BPE token count: one per word or symbol, plus one per extra
+    eight characters of long words. Within ~10% of tiktoken on English transcripts."""
+    return sum(1 + len(token) // 8 for token in TOKEN_RE.findall(text or ''))
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse rate-limit reset values such as "20ms", "1s" or "6m0s" into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    return sum(float(amount) * units[unit] for amount, unit in parts) if parts else None
+
+def _header_int(headers, name: str) -> Optional[int]:
+    try:
+        return int(float(headers[name]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """Thread-safe token bucket; reservations may go negative so callers queue fairly"""
+    
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = float(capacity)
+        self.per_seconds = per_seconds
+        self.rate = self.capacity / per_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self, amount: float) -> float:
+        """Take `amount` tokens and return how many seconds to wait before spending them"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    def sync(self, limit: Optional[int], remaining: Optional[int], reset_seconds: Optional[float]):
+        """Adopt the server's view of this bucket from rate-limit response headers"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if limit:
+                self.capacity = float(limit)
+                self.rate = self.capacity / self.per_seconds
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+                if remaining == 0 and reset_seconds:
+                    # the server will not refill before the reset, whatever our rate says
+                    self.tokens = min(self.tokens, -reset_seconds * self.rate)
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets shared by every AI caller"""
+    
+    def __init__(self, requests_per_minute: int = Config.OPENAI_RPM_LIMIT,
+                 tokens_per_minute: int = Config.OPENAI_TPM_LIMIT):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+    
+    def reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+    
+    def observe(self, headers) -> Optional[float]:
+        """Update both buckets from x-ratelimit-* headers; returns the server's retry-after, if any"""
+        if not headers:
+            return None
+        for kind, bucket in (('requests', self.requests), ('tokens', self.tokens)):
+            bucket.sync(_header_int(headers, f'x-ratelimit-limit-{kind}'),
+                        _header_int(headers, f'x-ratelimit-remaining-{kind}'),
+                        parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}')))
+        retry_after_ms = _header_int(headers, 'retry-after-ms')
+        if retry_after_ms is not None:
+            return retry_after_ms / 1000
+        return parse_reset_duration(headers.get('retry-after'))
+
+class CircuitBreaker:
+    """Fails fast after consecutive transient failures, letting one probe through per reset window"""
+    
+    def __init__(self, failure_threshold: int = Config.CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = Config.CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+    
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = self.reset_timeout - (now - self.opened_at)
+            if remaining > 0:
+                raise AIServiceUnavailable(f"Circuit open after {self.failures} failures; retry in {remaining:.0f}s")
+            self.opened_at = now  # half-open: this caller is the probe, everyone else keeps failing fast
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class AdaptiveConcurrency:
+    """AIMD cap on in-flight calls: halves on 429, creeps back up by one per window of successes
+    Shared by threads and event loops: sync callers wait on a Condition, async callers on a future
+    that release() resolves through the waiter's own loop."""
+    
+    def __init__(self, max_limit: int = Config.AI_CONCURRENCY):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters: deque = deque()  # (loop, future) pairs, oldest first
+    
+    def allow(self, limit: int):
+        """Raise the ceiling to a caller's explicit concurrency; a throttled limit still ramps up gradually"""
+        with self._cond:
+            if limit <= self.max_limit:
+                return
+            if self.limit >= self.max_limit:
+                self.limit = float(limit)
+            self.max_limit = limit
+            self._notify(all_waiters=True)
+    
+    def acquire(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+    
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                await waiter[1]
+            except asyncio.CancelledError:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+                    else:
+                        self._notify()  # pass on a wake-up this waiter can no longer use
+                raise
+    
+    def _notify(self, all_waiters: bool = False):
+        """Wake a sync and an async waiter (or all of them); call with _cond held"""
+        if all_waiters:
+            self._cond.notify_all()
+        else:
+            self._cond.notify()
+        while self._async_waiters:
+            loop, future = self._async_waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+            except RuntimeError:  # that loop has closed
+                continue
+            if not all_waiters:
+                break
+    
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._notify()
+    
+    def on_success(self):
+        with self._cond:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._notify()
+    
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(1.0, self.limit / 2)
+
+class ApiGuard:
+    """Rate limiting, retry with backoff and jitter, adaptive concurrency and a circuit breaker
+    wrapped around one upstream API. Transient failures are retried; anything still failing
+    raises AIServiceUnavailable instead of being mistaken for a real result."""
+    
+    def __init__(self, limiter: Optional[RateLimiter] = None, breaker: Optional[CircuitBreaker] = None,
+                 concurrency: Optional[AdaptiveConcurrency] = None, max_retries: int = Config.OPENAI_MAX_RETRIES,
+                 base_delay: float = Config.RETRY_BASE_DELAY, max_delay: float = Config.RETRY_MAX_DELAY,
+                 sleep: Callable[[float], Any] = time.sleep,
+                 async_sleep: Callable[[float], Any] = asyncio.sleep):
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+    
+    def call(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        """Run fn() under the guard; fn should raise on HTTP errors (e.g. raise_for_status)"""
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            wait = self.limiter.reserve(tokens)
+            if wait > 0:
+                self.sleep(wait)
+            self.concurrency.acquire()
+            try:
+                response = fn()
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+            else:
+                self._on_success(response)
+                return response
+            finally:
+                self.concurrency.release()
+            self.sleep(delay)
+    
+    async def acall(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        """Async counterpart of call(); fn returns an awaitable"""
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            wait = self.limiter.reserve(tokens)
+            if wait > 0:
+                await self.async_sleep(wait)
+            await self.concurrency.aacquire()
+            try:
+                response = await fn()
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+            else:
+                self._on_success(response)
+                return response
+            finally:
+                self.concurrency.release()
+            await self.async_sleep(delay)
+    
+    def _on_success(self, response: Any):
+        self.limiter.observe(getattr(response, 'headers', None))
+        self.breaker.record_success()
+        self.concurrency.on_success()
+    
+    def _on_error(self, error: Exception, attempt: int) -> float:
+        """Return the backoff before the next attempt, or raise if the error should not be retried"""
+        status, headers = self._classify(error)
+        if status is not None and status not in RETRYABLE_STATUS:
+            raise error
+        
+        self.breaker.record_failure()
+        retry_after = self.limiter.observe(headers)
+        if status == 429:
+            self.concurrency.on_throttle()
+        if attempt >= self.max_retries or self.breaker.is_open:
+            raise AIServiceUnavailable(f"AI service unavailable after {attempt + 1} attempts: {error}") from error
+        
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = max(retry_after or 0.0, random.uniform(backoff / 2, backoff))  # equal jitter
+        logger.warning("Transient AI error (%s); retrying in %.1fs", error, delay)
+        return delay
+    
+    @staticmethod
+    def _classify(error: Exception) -> tuple:
+        """(status, headers) for retryable errors; non-retryable ones get a non-retryable status"""
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code, error.response.headers
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code, error.response.headers
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError,
+                              requests.Timeout, requests.ConnectionError)):
+            return None, None
+        return -1, None
+
+_default_guard: Optional[ApiGuard] = None
+_default_guard_lock = threading.Lock()
+
+def default_api_guard() -> ApiGuard:
+    """Process-wide guard shared by every OpenAI caller so they draw on one rate budget"""
+    global _default_guard
+    with _default_guard_lock:
+        if _default_guard is None:
+            _default_guard = ApiGuard()
+        return _default_guard
+
+class HeuristicScorer:
+    """Local, deterministic scoring over the signals the gpt-4o prompts ask about.
+    Text features are counted per item, then weighted and combined for the whole batch with NumPy."""
+    
+    DOLLAR_RE = re.compile(r'\$\s?\d[\d,]*(?:\.\d+)?\s?[kKmM]?\b|\b\d[\d,]*(?:\.\d+)?\s?(?:dollars|usd)\b', re.I)
+    STORY_RE = re.compile(
+        r"\b(?:i|i'm|i've|i'd|my|me|myself|we|our)\b|\b(?:last|this|every) (?:week|month|year)\b|"
+        r"\b\d+ (?:days?|weeks?|months?|years?) ago\b|\bwhen i\b|\bi (?:tried|tested|started|made|lost|failed)\b",
+        re.I
+    )
+    HYPE_RE = re.compile(
+        r"\b(?:guaranteed|overnight|instantly|get rich|easy money|no effort|zero (?:work|effort)|"
+        r"secret (?:trick|method|system)|millionaire|life[- ]changing|100% (?:free|passive|guaranteed)|"
+        r"while you sleep|never work again|can't lose|risk[- ]free|quit your job)\b",
+        re.I
+    )
+    WORD_RE = re.compile(r"\w+")
+    
+    FEATURES = ('dollars', 'story', 'hype', 'tag_overlap', 'reach', 'engagement')
+    # authenticity = 50 + text features; potential = authenticity blended with audience signals
+    AUTHENTICITY_WEIGHTS = np.array([18.0, 30.0, -45.0, 0.0, 0.0, 0.0])
+    POTENTIAL_WEIGHTS = np.array([0.0, 0.0, 0.0, 25.0, 20.0, 15.0])
+    AUTHENTICITY_SHARE = 0.4
+    
+    def __init__(self, affiliate_keywords: Optional[Iterable[str]] = None):
+        self.affiliate_keywords = tuple(affiliate_keywords or self.default_affiliate_keywords())
+    
+    @staticmethod
+    def default_affiliate_keywords() -> List[str]:
+        """Hashtag fragments derived from the affiliate catalog names and categories"""
+        words = {'affiliate', 'passiveincome', 'sidehustle', 'makemoneyonline', 'highticket'}
+        for product in Config.AFFILIATE_PRODUCTS:
+            words.add(re.sub(r'[^a-z0-9]', '', product['name'].lower()))
+            words.update(word for word in re.findall(r'[a-z]+', product['category'].lower()) if len(word) > 2)
+        return sorted(words)
+    
+    def text_features(self, texts: Iterable[Optional[str]]) -> np.ndarray:
+        """(n, 3) dollar, story and hype densities; counts are damped so one long text can't dominate"""
+        counts = []
+        for text in texts:
+            text = text or ''
+            words = max(len(self.WORD_RE.findall(text)), 1)
+            counts.append((len(self.DOLLAR_RE.findall(text)), len(self.STORY_RE.findall(text)),
+                           len(self.HYPE_RE.findall(text)), words))
+        if not counts:
+            return np.zeros((0, 3))
+        dollars, story, hype, words = np.asarray(counts, dtype=float).T
+        return np.column_stack([
+            np.minimum(np.log1p(dollars), 2.0) / 2.0,
+            np.minimum(story / words * 10.0, 1.0),  # story markers per 10 words, saturating at one
+            np.minimum(np.log1p(hype), 2.0) / 2.0,
+        ])
+    
+    def tag_overlap(self, hashtags: Iterable[Optional[str]]) -> np.ndarray:
+        """Fraction of each item's hashtags that touch an affiliate keyword"""
+        overlap = []
+        for text in hashtags:
+            tags = parse_hashtags(text)
+            hits = sum(any(keyword in tag for keyword in self.affiliate_keywords) for tag in tags)
+            overlap.append(hits / len(tags) if tags else 0.0)
+        return np.asarray(overlap, dtype=float)
+    
+    def features(self, videos: List[ViralVideo]) -> np.ndarray:
+        """(n, len(FEATURES)) feature matrix for a batch of videos"""
+        text = self.text_features(f"{video.captions or ''} {video.audio_transcript or ''}" for video in videos)
+        views = np.fromiter((video.views or 0 for video in videos), dtype=float, count=len(videos))
+        engagement = np.fromiter((video.engagement_rate or 0.0 for video in videos), dtype=float, count=len(videos))
+        return np.column_stack([
+            text,
+            self.tag_overlap(video.hashtags for video in videos),
+            np.clip((np.log10(views + 1) - 4.0) / 3.0, 0.0, 1.0),  # 10K views -> 0, 10M -> 1
+            np.clip(engagement / 20.0, 0.0, 1.0),
+        ]) if videos else np.zeros((0, len(self.FEATURES)))
+    
+    def authenticity(self, texts: Iterable[Optional[str]]) -> np.ndarray:
+        """0-100 authenticity scores, the local counterpart of AIAgent.score_content_authenticity"""
+        features = self.text_features(texts)
+        return np.clip(50.0 + features @ self.AUTHENTICITY_WEIGHTS[:3], 0, 100).round()
+    
+    def score_videos(self, videos: List[ViralVideo]) -> np.ndarray:
+        """0-100 affiliate-potential scores, the local counterpart of AIAgent.analyze_viral_video"""
+        features = self.features(videos)
+        authenticity = np.clip(50.0 + features @ self.AUTHENTICITY_WEIGHTS, 0, 100)
+        audience = features @ self.POTENTIAL_WEIGHTS / self.POTENTIAL_WEIGHTS.sum() * 100.0
+        return (self.AUTHENTICITY_SHARE * authenticity + (1 - self.AUTHENTICITY_SHARE) * audience).round()
+    
+    def select(self, videos: List[ViralVideo], top_k: Optional[int] = Config.HEURISTIC_TOP_K,
+               threshold: Optional[float] = Config.HEURISTIC_THRESHOLD) -> List[ViralVideo]:
+        """Gate for paid analysis: videos at or above `threshold`, capped at the best `top_k`, best first"""
+        videos = list(videos)
+        scores = self.score_videos(videos)
+        keep = np.flatnonzero(scores >= threshold) if threshold is not None else np.arange(len(videos))
+        if top_k is not None and len(keep) > top_k:
+            keep = keep[np.argpartition(-scores[keep], top_k - 1)[:top_k]]
+        keep = keep[np.argsort(-scores[keep], kind='stable')]
+        return [videos[i] for i in keep]
+
+FILLER_RE = re.compile(r"\b(?:u+h+|u+m+|e+r+m+|you know|i mean|sort of|kind of|basically|literally)\b[,.]?\s*|"
+                       r"\blike,\s*", re.I)
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+
+def compact_text(text: Optional[str], max_tokens: int, keywords: Iterable[str] = ()) -> str:
+    """Fit text into max_tokens: strip filler and repeated sentences, then if still too long keep
+    the opening, the ending and the sentences around dollar figures, personal story or keywords"""
+    sentences, seen = [], set()
+    for raw in SENTENCE_SPLIT_RE.split(text or ''):
+        sentence = re.sub(r'\s+', ' ', FILLER_RE.sub('', raw)).strip()
+        key = sentence.lower().rstrip('.!? ')
+        if key and key not in seen:
+            seen.add(key)
+            sentences.append(sentence)
+    
+    costs = [estimate_tokens(sentence) for sentence in sentences]
+    if sum(costs) <= max_tokens:
+        return ' '.join(sentences)
+    
+    # Unpunctuated auto-captions arrive as one huge "sentence": cut those into word runs so the
+    # head, tail and keyword passes below still have pieces that fit
+    piece_budget = max(1, max_tokens // 5)
+    if max(costs) > piece_budget:
+        pieces = []
+        for sentence in sentences:
+            if estimate_tokens(sentence) <= piece_budget:
+                pieces.append(sentence)
+                continue
+            words, cost = [], 0
+            for word in sentence.split(' '):
+                word_cost = estimate_tokens(word)
+                if words and cost + word_cost > piece_budget:
+                    pieces.append(' '.join(words))
+                    words, cost = [], 0
+                words.append(word)
+                cost += word_cost
+            pieces.append(' '.join(words))
+        sentences = pieces
+        costs = [estimate_tokens(sentence) for sentence in sentences]
+    
+    keyword_re = re.compile('|'.join(re.escape(keyword) for keyword in keywords), re.I) if keywords else None
+    def salience(sentence: str) -> int:
+        hits = (2 * len(HeuristicScorer.DOLLAR_RE.findall(sentence)) +
+                len(HeuristicScorer.STORY_RE.findall(sentence)))
+        return hits + (2 * len(keyword_re.findall(sentence)) if keyword_re else 0)
+    
+    chosen, used = set(), 0
+    def take(index: int, budget: int) -> bool:
+        nonlocal used
+        if index in chosen or used + costs[index] > budget:
+            return False
+        chosen.add(index)
+        used += costs[index]
+        return True
+    
+    head_budget, tail_budget = int(max_tokens * 0.3), int(max_tokens * 0.5)
+    for index in range(len(sentences)):  # head
+        if not take(index, head_budget):
+            break
+    for index in reversed(range(len(sentences))):  # tail
+        if not take(index, tail_budget):
+            break
+    ranked = sorted(range(len(sentences)), key=lambda i: -salience(sentences[i]))
+    for index in ranked:  # keyword windows: each salient sentence with its neighbours
+        if not salience(sentences[index]):
+            break
+        for neighbour in (index, index - 1, index + 1):
+            if 0 <= neighbour < len(sentences):
+                take(neighbour, max_tokens)
+    
+    parts, previous = [], -1
+    for index in sorted(chosen):
+        if previous >= 0 and index != previous + 1:
+            parts.append('…')
+        parts.append(sentences[index])
+        previous = index
+    return ' '.join(parts)
+
+class JSONFieldStream:
+    """Incremental parser for a streamed JSON object: feed() text chunks and get back each
+    top-level (key, value) pair as soon as its value is complete"""
+    
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member_start: Optional[int] = None
+    
+    def feed(self, chunk: str) -> List[tuple]:
+        self.buffer += chunk
+        fields = []
+        for i in range(self.pos, len(self.buffer)):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+                if self.depth == 1 and char == '{':
+                    self.member_start = i + 1
+            elif char in '}]':
+                if self.depth == 1 and self.member_start is not None:
+                    fields.extend(self._member(i))
+                    self.member_start = None
+                self.depth -= 1
+            elif char == ',' and self.depth == 1 and self.member_start is not None:
+                fields.extend(self._member(i))
+                self.member_start = i + 1
+        self.pos = len(self.buffer)
+        return fields
+    
+    def _member(self, end: int) -> List[tuple]:
+        text = self.buffer[self.member_start:end].strip()
+        return list(json.loads('{' + text + '}').items()) if text else []
+
+def pack_items(costs: Dict[Any, int], max_items: int, max_tokens: int) -> List[List[Any]]:
+    """Greedily group item ids into packs of at most max_items and max_tokens (input order kept)"""
+    packs, current, used = [], [], 0
+    for item_id, cost in costs.items():
+        if current and (len(current) >= max_items or used + cost > max_tokens):
+            packs.append(current)
+            current, used = [], 0
+        current.append(item_id)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+class ScriptRequestIndex:
+    """In-memory index of recent generate_script requests for near-duplicate lookups.
+    Each request is vectorized locally from hashed character n-grams of its normalized
+    parameters; lookups are one matrix-vector product over the ring buffer."""
+    
+    FIELD_WEIGHTS = {'content_type': 1.0, 'target_audience': 1.0, 'key_message': 2.0, 'template_type': 1.0}
+    
+    def __init__(self, capacity: int = Config.SCRIPT_INDEX_SIZE, dims: int = Config.SCRIPT_INDEX_DIMS,
+                 ngram: int = 3):
+        self.capacity = capacity
+        self.dims = dims
+        self.ngram = ngram
+        self.vectors = np.zeros((capacity, dims), dtype=np.float32)
+        self.lengths: List[Optional[str]] = [None] * capacity
+        self.script_ids = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self.next = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(text: Optional[str]) -> str:
+        return ' '.join(re.findall(r'[a-z0-9$]+', (text or '').lower()))
+    
+    @classmethod
+    def normalize_length(cls, video_length: Optional[str]) -> str:
+        """"60s", "60 seconds" and "60 sec" all mean the same script length"""
+        digits = re.findall(r'\d+', video_length or '')
+        return digits[0] if digits else cls.normalize(video_length)
+    
+    def vectorize(self, content_type: str, target_audience: str, key_message: str, template_type: str) -> np.ndarray:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        fields = {'content_type': content_type, 'target_audience': target_audience,
+                  'key_message': key_message, 'template_type': template_type}
+        for name, value in fields.items():
+            text = f" {self.normalize(value)} "
+            grams = [text[i:i + self.ngram] for i in range(max(len(text) - self.ngram + 1, 1))]
+            buckets, counts = np.unique([zlib.crc32(f"{name}:{gram}".encode()) % self.dims for gram in grams],
+                                        return_counts=True)
+            field = np.zeros(self.dims, dtype=np.float32)
+            field[buckets] = 1 + np.log(counts)  # sublinear tf so repeated words don't dominate
+            norm = np.linalg.norm(field)
+            if norm:
+                vector += self.FIELD_WEIGHTS[name] * field / norm
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def add(self, script_id: int, video_length: str, vector: np.ndarray):
+        with self._lock:
+            slot = self.next
+            self.vectors[slot] = vector
+            self.lengths[slot] = self.normalize_length(video_length)
+            self.script_ids[slot] = script_id
+            self.next = (slot + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+    
+    def lookup(self, video_length: str, vector: np.ndarray,
+               threshold: float = Config.SCRIPT_SIMILARITY_THRESHOLD) -> Optional[tuple]:
+        """(script_id, similarity) of the most similar indexed request of the same length, if above threshold"""
+        length = self.normalize_length(video_length)
+        with self._lock:
+            if not self.size:
+                return None
+            similarities = self.vectors[:self.size] @ vector
+            same_length = np.fromiter((stored == length for stored in self.lengths[:self.size]),
+                                      dtype=bool, count=self.size)
+            similarities[~same_length] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] < threshold:
+                return None
+            return int(self.script_ids[best]), float(similarities[best])
+
+@dataclass(slots=True)
+class ChatRequest:
+    method: str
+    system_prompt: str
+    user_prompt: str
+    parse: Callable[[str], Any]
+    response_format: Optional[Dict[str, Any]] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = Config.OPENAI_COMPLETION_TOKENS
+
+@dataclass(slots=True)
+class BatchResult:
+    index: int
+    item: Any
+    result: Any = None
+    error: Optional[str] = None
+    elapsed: float = 0.0  # seconds spent in this item's request(s), excluding time queued
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+def _validate_analysis(analysis: Any) -> Dict[str, Any]:
+    score = analysis.get('score') if isinstance(analysis, dict) else None
+    if not isinstance(score, (int, float)) or not 0 <= score <= 100:
+        raise ValueError(f"Invalid analysis score: {score!r}")
+    return analysis
+
+def _validate_score(value: Any) -> int:
+    score = int(str(value).strip())
+    if not 0 <= score <= 100:
+        raise ValueError(f"Invalid authenticity score: {score}")
+    return score
+
+def _parse_analysis(content: str) -> Dict[str, Any]:
+    return _validate_analysis(json.loads(content))
+
+def _parse_score(content: str) -> int:
+    return _validate_score(content)
+
+def _parse_packed(content: str) -> Dict[str, Any]:
+    """Split a packed {"results": [{"id": ...}, ...]} response into entries by id"""
+    data = json.loads(content)
+    results = data.get('results') if isinstance(data, dict) else data
+    if not isinstance(results, list):
+        raise ValueError("Packed response has no results array")
+    return {str(entry.get('id')): entry for entry in results if isinstance(entry, dict)}
+
+SCRIPT_ERROR_TITLE = "Error generating script"
+
+def script_from_data(script_data: Dict[str, Any], content_type: str, video_length: str,
+                     target_audience: str, template_type: str, key_message: str = "") -> GeneratedScript:
+    """Build the GeneratedScript record for a generate_script response"""
+    return GeneratedScript(
+        title=script_data.get('title', 'Generated Script'),
+        content=script_data.get('full_script', 'Content generation failed'),
+        content_type=content_type,
+        video_length=video_length,
+        target_audience=target_audience,
+        template_type=template_type,
+        ai_generated=True,
+        status="generated",
+        key_message=key_message
+    )
+
+_shared_clients: Dict[tuple, OpenAI] = {}
+_shared_clients_lock = threading.Lock()
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=Config.HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE,
+                        keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY)
+
+def shared_openai_client(api_key: str, base_url: Optional[str] = None) -> OpenAI:
+    """Process-wide OpenAI client per (key, endpoint) so every agent reuses one keep-alive pool.
+    Retries are disabled: ApiGuard owns them so they share its rate budget and circuit breaker."""
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            http_client = openai.DefaultHttpxClient(limits=_http_limits(), timeout=Config.HTTP_TIMEOUT)
+            client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=http_client)
+            _shared_clients[key] = client
+        return client
+
+def close_shared_clients():
+    """Close the process-wide OpenAI clients (registered to run at exit)"""
+    with _shared_clients_lock:
+        clients = list(_shared_clients.values())
+        _shared_clients.clear()
+    for client in clients:
+        client.close()
+
+atexit.register(close_shared_clients)
+
 class AIAgent:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
-        self.db = DatabaseManager()
+    def __init__(self, api_key: str, cache: Optional[ResponseCache] = None, use_cache: bool = True,
+                 guard: Optional[ApiGuard] = None, db: Optional[DatabaseManager] = None,
+                 client: Optional[OpenAI] = None):
+        base_url = Config.OPENAI_BASE_URL
+        self.client = client or shared_openai_client(api_key, base_url)
+        self.async_client_factory: Callable[[], Any] = lambda: AsyncOpenAI(
+            api_key=api_key, base_url=base_url, max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_http_limits(), timeout=Config.HTTP_TIMEOUT)
+        )
+        self.guard = guard or default_api_guard()
+        self._async_clients: Dict[int, Any] = {}  # one AsyncOpenAI per event loop
+        self._async_scopes: Dict[int, int] = {}  # batches running on each loop
+        self._owns_db = db is None
+        self.db = db or DatabaseManager()
+        self.model = Config.OPENAI_MODEL
+        self.cache = cache or ResponseCache(self.db)
+        self.use_cache = use_cache  # set False to bypass the response cache for every call
+        self.keywords = HeuristicScorer.default_affiliate_keywords()  # kept when compacting transcripts
     
-    def analyze_viral_video(self, video_url: str, transcript: str) -> Dict[str, Any]:
-        """Analyze a viral video for affiliate marketing potential"""
+    def _fit(self, method: str, text: Optional[str]) -> str:
+        """Compact user-supplied text to the method's token budget"""
+        budget = Config.PROMPT_TOKEN_BUDGETS.get(method)
+        compacted = compact_text(text, budget, self.keywords) if budget else (text or '')
+        if compacted != text:
+            logger.debug("%s: compacted input %d -> %d tokens", method, estimate_tokens(text),
+                         estimate_tokens(compacted))
+        return compacted
+    
+    @staticmethod
+    def _request(method: str, system_prompt: str, prompt: str, parse: Callable[[str], Any],
+                 response_format: Optional[Dict[str, Any]] = None) -> ChatRequest:
+        prompt = textwrap.dedent(prompt).strip()  # the template's indentation is billed as tokens too
+        return ChatRequest(method, system_prompt, prompt, parse, response_format,
+                           estimate_tokens(system_prompt) + estimate_tokens(prompt))
+    
+    def _analysis_request(self, transcript: str) -> ChatRequest:
+        transcript = self._fit("analyze_viral_video", transcript)
+        prompt = f"""
+        Analyze this viral video for affiliate marketing potential. The video transcript is: "{transcript}"
+        
+        Provide a JSON response with:
+        - score: 0-100 rating for affiliate marketing potential
+        - engagement_quality: "high", "medium", or "low"
+        - content_themes: Array of main themes
+        - success_factors: Array of reasons why it's viral
+        - recommendations: Array of actionable suggestions
+        
+        Focus on Shannon Smith's authentic approach to affiliate marketing and AI/automation content.
+        """
+        return self._request(
+            "analyze_viral_video",
+            "You are an expert at analyzing viral content for affiliate marketing potential. Respond with valid JSON only.",
+            prompt, _parse_analysis, {"type": "json_object"}
+        )
+    
+    def _script_request(self, content_type: str, video_length: str, target_audience: str,
+                        key_message: str, template_type: str) -> ChatRequest:
+        key_message = self._fit("generate_script", key_message)
+        prompt = f"""
+        Generate a viral video script for affiliate marketing with these parameters:
+        - Content Type: {content_type}
+        - Video Length: {video_length}
+        - Target Audience: {target_audience}
+        - Key Message: {key_message}
+        - Template Type: {template_type}
+        
+        Create a script following Shannon Smith's authentic approach. Focus on:
+        - High-ticket affiliate products (Systeme.io, ClickFunnels, Jasper AI)
+        - Authentic storytelling with real income numbers
+        - Trust-building through personal experiences
+        - Clear call-to-action for engagement
+        
+        Return JSON with:
+        - title: Compelling video title
+        - hook: Opening hook (first 3 seconds)
+        - problem: Problem identification
+        - solution: Solution presentation
+        - proof: Social proof/results
+        - cta: Call to action
+        - full_script: Complete script
+        - hashtags: Array of relevant hashtags
+        - estimated_engagement: Predicted engagement rate (0-100)
+        """
+        return self._request(
+            "generate_script",
+            "You are an expert at creating viral affiliate marketing scripts. Respond with valid JSON only.",
+            prompt, json.loads, {"type": "json_object"}
+        )
+    
+    def _authenticity_request(self, content: str) -> ChatRequest:
+        content = self._fit("score_content_authenticity", content)
+        prompt = f"""
+        Score this content for authenticity on a scale of 0-100.
+        Consider: personal story elements, specific numbers, realistic claims, trust indicators.
+        
+        Content: "{content}"
+        
+        Return only a number between 0-100.
+        """
+        return self._request(
+            "score_content_authenticity",
+            "You are an expert at evaluating content authenticity. Return only a number.",
+            prompt, _parse_score
+        )
+    
+    def _packed_authenticity_request(self, items: List[tuple]) -> ChatRequest:
+        """One request scoring several (id, content) items"""
+        payload = json.dumps([{"id": item_id, "content": content} for item_id, content in items], ensure_ascii=False)
+        prompt = f"""
+        Score each content item for authenticity on a scale of 0-100.
+        Consider: personal story elements, specific numbers, realistic claims, trust indicators.
+        
+        Items: {payload}
+        
+        Return JSON: {{"results": [{{"id": "<item id>", "score": <0-100>}}]}} with exactly one entry per item.
+        """
+        request = self._request(
+            "score_content_authenticity",
+            "You are an expert at evaluating content authenticity. Respond with valid JSON only.",
+            prompt, _parse_packed, {"type": "json_object"}
+        )
+        request.completion_tokens = Config.PACKED_COMPLETION_TOKENS["score_content_authenticity"] * len(items)
+        return request
+    
+    def _packed_analysis_request(self, items: List[tuple]) -> ChatRequest:
+        """One request analyzing several (id, transcript) items"""
+        payload = json.dumps([{"id": item_id, "transcript": transcript} for item_id, transcript in items],
+                             ensure_ascii=False)
+        prompt = f"""
+        Analyze each of these viral video transcripts for affiliate marketing potential.
+        
+        Items: {payload}
+        
+        Return JSON: {{"results": [...]}} with exactly one entry per item, each containing:
+        - id: the item id
+        - score: 0-100 rating for affiliate marketing potential
+        - engagement_quality: "high", "medium", or "low"
+        - content_themes: Array of main themes
+        - success_factors: Array of reasons why it's viral
+        - recommendations: Array of actionable suggestions
+        
+        Focus on Shannon Smith's authentic approach to affiliate marketing and AI/automation content.
+        """
+        request = self._request(
+            "analyze_viral_video",
+            "You are an expert at analyzing viral content for affiliate marketing potential. Respond with valid JSON only.",
+            prompt, _parse_packed, {"type": "json_object"}
+        )
+        request.completion_tokens = Config.PACKED_COMPLETION_TOKENS["analyze_viral_video"] * len(items)
+        return request
+    
+    def _completion_kwargs(self, request: ChatRequest) -> Dict[str, Any]:
+        kwargs = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": request.system_prompt},
+                {"role": "user", "content": request.user_prompt}
+            ]
+        }
+        if request.response_format:
+            kwargs["response_format"] = request.response_format
+        return kwargs
+    
+    def _token_estimate(self, request: ChatRequest) -> int:
+        logger.info("%s: %d prompt tokens", request.method, request.prompt_tokens)
+        return request.prompt_tokens + request.completion_tokens
+    
+    def _cache_key(self, request: ChatRequest) -> str:
+        return ResponseCache.make_key(self.model, request.system_prompt, request.user_prompt,
+                                      request.response_format)
+    
+    def _chat(self, request: ChatRequest, use_cache: Optional[bool] = None) -> Any:
+        """Run one chat completion through the response cache and return the parsed content"""
+        use_cache = self.use_cache if use_cache is None else use_cache
+        key = self._cache_key(request)
+        
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return request.parse(cached)
+        
+        kwargs = self._completion_kwargs(request)
+        raw = self.guard.call(lambda: self.client.chat.completions.with_raw_response.create(**kwargs),
+                              self._token_estimate(request))
+        content = raw.parse().choices[0].message.content
+        result = request.parse(content)  # only responses that parse are cached
+        
+        if use_cache:
+            self.cache.set(key, request.method, content)
+        return result
+    
+    def _stream_chat(self, request: ChatRequest, use_cache: Optional[bool] = None) -> Iterator[tuple]:
+        """Stream a JSON-object completion, yielding each top-level (key, value) pair as it completes"""
+        use_cache = self.use_cache if use_cache is None else use_cache
+        key = self._cache_key(request)
+        
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield from request.parse(cached).items()
+                return
+        
+        kwargs = self._completion_kwargs(request)
+        raw = self.guard.call(lambda: self.client.chat.completions.with_raw_response.create(**kwargs, stream=True),
+                              self._token_estimate(request))
+        fields, parts = JSONFieldStream(), []
+        for chunk in raw.parse():
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield from fields.feed(delta)
+        
+        content = ''.join(parts)
+        request.parse(content)  # a truncated or malformed stream raises here and is not cached
+        if use_cache:
+            self.cache.set(key, request.method, content)
+    
+    async def _achat(self, request: ChatRequest, use_cache: Optional[bool] = None) -> Any:
+        """Async counterpart of _chat built on AsyncOpenAI"""
+        use_cache = self.use_cache if use_cache is None else use_cache
+        key = self._cache_key(request)
+        
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return request.parse(cached)
+        
+        client = self._async_client()
+        kwargs = self._completion_kwargs(request)
+        raw = await self.guard.acall(lambda: client.chat.completions.with_raw_response.create(**kwargs),
+                                     self._token_estimate(request))
+        content = raw.parse().choices[0].message.content
+        result = request.parse(content)
+        
+        if use_cache:
+            self.cache.set(key, request.method, content)
+        return result
+    
+    def _async_client(self) -> Any:
+        # AsyncOpenAI's connection pool is bound to the loop it first runs on
+        loop_id = id(asyncio.get_running_loop())
+        client = self._async_clients.get(loop_id)
+        if client is None:
+            client = self._async_clients[loop_id] = self.async_client_factory()
+        return client
+    
+    @asynccontextmanager
+    async def _loop_client_scope(self):
+        """Keep this loop's AsyncOpenAI client while any batch on the loop runs, then close it on that
+        loop (it can't be closed once the loop is gone), so plain asyncio.run() callers don't leak its pool"""
+        loop_id = id(asyncio.get_running_loop())
+        self._async_scopes[loop_id] = self._async_scopes.get(loop_id, 0) + 1
         try:
-            prompt = f"""
-            Analyze this viral video for affiliate marketing potential. The video transcript is: "{transcript}"
-            
-            Provide a JSON response with:
-            - score: 0-100 rating for affiliate marketing potential
-            - engagement_quality: "high", "medium", or "low"
-            - content_themes: Array of main themes
-            - success_factors: Array of reasons why it's viral
-            - recommendations: Array of actionable suggestions
-            
-            Focus on Shannon Smith's authentic approach to affiliate marketing and AI/automation content.
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
-                messages=[
-                    {"role": "system", "content": "You are an expert at analyzing viral content for affiliate marketing potential. Respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
+            yield
+        finally:
+            self._async_scopes[loop_id] -= 1
+            if not self._async_scopes[loop_id]:
+                del self._async_scopes[loop_id]
+                await self.aclose()
+    
+    def close(self):
+        """Release the database handle if this agent created it; shared clients stay open"""
+        if self._owns_db:
+            self.db.close()
+    
+    def __enter__(self) -> 'AIAgent':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    async def aclose(self):
+        """Close the AsyncOpenAI client bound to the running event loop"""
+        client = self._async_clients.pop(id(asyncio.get_running_loop()), None)
+        if client is not None:
+            await client.close()
+    
+    def run(self, coro: Any) -> Any:
+        """asyncio.run a batch coroutine from sync code, closing its loop's client before the loop goes away"""
+        async def main():
+            try:
+                return await coro
+            finally:
+                await self.aclose()
+        return asyncio.run(main())
+    
+    async def _run_batch(self, items: Iterable[Any], make_request: Callable[[Any], ChatRequest],
+                         concurrency: int, ordered: bool, use_cache: Optional[bool]) -> List[BatchResult]:
+        """Run one request per item with at most `concurrency` in flight, capturing per-item failures"""
+        self.guard.concurrency.allow(concurrency)  # the shared guard must not silently cap the caller's limit
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def run(index: int, item: Any) -> BatchResult:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = BatchResult(index, item, await self._achat(make_request(item), use_cache))
+                except Exception as e:
+                    result = BatchResult(index, item, error=f"{type(e).__name__}: {e}")
+                result.elapsed = time.perf_counter() - start
+                return result
+        
+        async with self._loop_client_scope():
+            tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+            if ordered:
+                return list(await asyncio.gather(*tasks))
+            return [await task for task in asyncio.as_completed(tasks)]
+    
+    async def _run_packed(self, items: Iterable[Any], method: str, text_of: Callable[[Any], str],
+                          make_request: Callable[[List[tuple]], ChatRequest], validate: Callable[[Any], Any],
+                          pack_size: int, concurrency: int, use_cache: Optional[bool]) -> List[BatchResult]:
+        """Send items N per request under stable ids, split the answers back out per item and
+        re-queue only the items whose entry was missing or invalid"""
+        results = [BatchResult(index, item) for index, item in enumerate(items)]
+        texts = {str(result.index): self._fit(method, text_of(result.item)) for result in results}
+        pending = list(texts)
+        
+        async with self._loop_client_scope():  # one client across the retry passes
+            for attempt in range(Config.PACK_MAX_ATTEMPTS):
+                if not pending:
+                    break
+                costs = {item_id: estimate_tokens(texts[item_id]) + 8 for item_id in pending}
+                packs = pack_items(costs, pack_size, Config.PACKED_PROMPT_TOKENS)
+                answers = await self._run_batch(
+                    packs, lambda pack: make_request([(item_id, texts[item_id]) for item_id in pack]),
+                    concurrency, True, use_cache if attempt == 0 else False  # retries must not replay a cached answer
+                )
+                
+                pending = []
+                for answer in answers:
+                    for item_id in answer.item:
+                        result = results[int(item_id)]
+                        result.elapsed += answer.elapsed
+                        try:
+                            if not answer.ok:
+                                raise ValueError(answer.error)
+                            if item_id not in answer.result:
+                                raise ValueError(f"No result for item {item_id}")
+                            result.result, result.error = validate(answer.result[item_id]), None
+                        except Exception as e:
+                            result.error = str(e)
+                            pending.append(item_id)
+        return results
+    
+    async def analyze_many(self, videos: Iterable[ViralVideo], concurrency: int = Config.AI_CONCURRENCY,
+                           ordered: bool = True, write_back: bool = True,
+                           use_cache: Optional[bool] = None, pack_size: Optional[int] = None) -> List[BatchResult]:
+        """Analyze videos concurrently and store each successful score on its viral_videos row.
+        With pack_size, several transcripts share each request (results always keep input order)."""
+        if pack_size:
+            results = await self._run_packed(
+                videos, "analyze_viral_video", lambda video: video.audio_transcript,
+                self._packed_analysis_request, _validate_analysis, pack_size, concurrency, use_cache
             )
+        else:
+            results = await self._run_batch(
+                videos, lambda video: self._analysis_request(video.audio_transcript),
+                concurrency, ordered, use_cache
+            )
+        
+        if write_back:
+            self.db.update_video_scores_many(
+                (result.item.id, int(result.result['score']), "analyzed")
+                for result in results if result.ok and result.item.id is not None
+            )
+        return results
+    
+    async def score_many(self, contents: Iterable[str], concurrency: int = Config.AI_CONCURRENCY,
+                         ordered: bool = True, use_cache: Optional[bool] = None,
+                         pack_size: Optional[int] = None) -> List[BatchResult]:
+        """Score content authenticity concurrently, optionally pack_size items per request"""
+        if pack_size:
+            return await self._run_packed(
+                contents, "score_content_authenticity", lambda content: content,
+                self._packed_authenticity_request, lambda entry: _validate_score(entry.get('score')),
+                pack_size, concurrency, use_cache
+            )
+        return await self._run_batch(contents, self._authenticity_request, concurrency, ordered, use_cache)
+    
+    async def generate_many(self, specs: Iterable[Dict[str, str]], concurrency: int = Config.AI_CONCURRENCY,
+                            ordered: bool = True, write_back: bool = True,
+                            use_cache: Optional[bool] = None) -> List[BatchResult]:
+        """Generate scripts concurrently; each spec holds the generate_script keyword arguments"""
+        results = await self._run_batch(
+            specs, lambda spec: self._script_request(**spec), concurrency, ordered, use_cache
+        )
+        
+        successful = [result for result in results if result.ok]
+        scripts = [script_from_data(result.result, result.item['content_type'], result.item['video_length'],
+                                    result.item['target_audience'], result.item['template_type'],
+                                    result.item['key_message'])
+                   for result in successful]
+        if write_back and scripts:
+            for script, script_id in zip(scripts, self.db.insert_scripts_many(scripts)):
+                script.id = script_id
+        for result, script in zip(successful, scripts):
+            result.result = script
+        return results
+    
+    def analyze_viral_video(self, video_url: str, transcript: str, use_cache: Optional[bool] = None) -> Dict[str, Any]:
+        """Analyze a viral video for affiliate marketing potential"""
+        try:
+            return self._chat(self._analysis_request(transcript), use_cache)
             
-            return json.loads(response.choices[0].message.content)
-            
+        except AIServiceUnavailable:
+            raise  # a fallback score would be stored as if it were real
         except Exception as e:
             print(f"Error analyzing video: {e}")
             return {
@@ -387,50 +2761,19 @@ class AIAgent:
             }
     
     def generate_script(self, content_type: str, video_length: str, target_audience: str, 
-                       key_message: str, template_type: str) -> Dict[str, Any]:
+                       key_message: str, template_type: str, use_cache: Optional[bool] = None) -> Dict[str, Any]:
         """Generate a script based on viral patterns"""
         try:
-            prompt = f"""
-            Generate a viral video script for affiliate marketing with these parameters:
-            - Content Type: {content_type}
-            - Video Length: {video_length}
-            - Target Audience: {target_audience}
-            - Key Message: {key_message}
-            - Template Type: {template_type}
-            
-            Create a script following Shannon Smith's authentic approach. Focus on:
-            - High-ticket affiliate products (Systeme.io, ClickFunnels, Jasper AI)
-            - Authentic storytelling with real income numbers
-            - Trust-building through personal experiences
-            - Clear call-to-action for engagement
-            
-            Return JSON with:
-            - title: Compelling video title
-            - hook: Opening hook (first 3 seconds)
-            - problem: Problem identification
-            - solution: Solution presentation
-            - proof: Social proof/results
-            - cta: Call to action
-            - full_script: Complete script
-            - hashtags: Array of relevant hashtags
-            - estimated_engagement: Predicted engagement rate (0-100)
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
-                messages=[
-                    {"role": "system", "content": "You are an expert at creating viral affiliate marketing scripts. Respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
-            
-            return json.loads(response.choices[0].message.content)
+            request = self._script_request(content_type, video_length, target_audience, key_message, template_type)
+            return self._chat(request, use_cache)
             
+        except AIServiceUnavailable:
+            raise
         except Exception as e:
             print(f"Error generating script: {e}")
             return {
-                "title": "Error generating script",
+                "failed": True,  # placeholder: never stored, indexed or reused
+                "title": SCRIPT_ERROR_TITLE,
                 "hook": "Script generation failed",
                 "problem": "Technical error occurred",
                 "solution": "Please try again",
@@ -441,87 +2784,170 @@ class AIAgent:
                 "estimated_engagement": 0
             }
     
-    def score_content_authenticity(self, content: str) -> int:
+    def stream_script(self, content_type: str, video_length: str, target_audience: str,
+                      key_message: str, template_type: str, use_cache: Optional[bool] = None) -> Iterator[tuple]:
+        """Streaming generate_script: yields ("hook", "..."), ("problem", "...") and the other
+        script fields as soon as each one is complete"""
+        request = self._script_request(content_type, video_length, target_audience, key_message, template_type)
+        return self._stream_chat(request, use_cache)
+    
+    def score_content_authenticity(self, content: str, use_cache: Optional[bool] = None) -> int:
         """Score content authenticity (0-100)"""
         try:
-            prompt = f"""
-            Score this content for authenticity on a scale of 0-100.
-            Consider: personal story elements, specific numbers, realistic claims, trust indicators.
-            
-            Content: "{content}"
-            
-            Return only a number between 0-100.
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
-                messages=[
-                    {"role": "system", "content": "You are an expert at evaluating content authenticity. Return only a number."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            return int(response.choices[0].message.content.strip())
+            return self._chat(self._authenticity_request(content), use_cache)
             
+        except AIServiceUnavailable:
+            raise
         except Exception as e:
             print(f"Error scoring authenticity: {e}")
             return 50
 
 class ViralAIAgent:
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.ai = AIAgent(Config.OPENAI_API_KEY)
+    def __init__(self, db: Optional[DatabaseManager] = None, ai: Optional[AIAgent] = None):
+        self._owns_db = db is None
+        self.db = db or DatabaseManager()
+        self.ai = ai or AIAgent(Config.OPENAI_API_KEY, db=self.db)
+        self.scorer = HeuristicScorer()
+        self._script_index: Optional[ScriptRequestIndex] = None
         
-    def scan_viral_content(self, platform: str = "all") -> List[ViralVideo]:
+    def close(self):
+        """Release the database handle if this agent created it"""
+        self.ai.close()
+        if self._owns_db:
+            self.db.close()
+    
+    def __enter__(self) -> 'ViralAIAgent':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def scan_viral_content(self, platform: str = "all",
+                           columns: Optional[Iterable[str]] = None) -> Iterator[ViralVideo]:
         """Simulate scanning for viral content (500K+ views in past 7 days)"""
         print(f"Scanning for viral content on {platform}...")
         
         # In real implementation, this would connect to social media APIs
-        # For now, return sample data from database
-        return self.db.get_viral_videos()
+        # For now, stream sample data from database
+        return self.db.iter_viral_videos(platform=None if platform == "all" else platform, columns=columns)
+    
+    @property
+    def script_index(self) -> ScriptRequestIndex:
+        """Similarity index of recent script requests, warmed from the database on first use"""
+        if self._script_index is None:
+            index = ScriptRequestIndex()
+            for script_id, content_type, video_length, target_audience, key_message, template_type in \
+                    reversed(self.db.recent_script_requests(index.capacity)):
+                index.add(script_id, video_length,
+                          index.vectorize(content_type, target_audience, key_message, template_type))
+            self._script_index = index
+        return self._script_index
+    
+    def find_similar_script(self, content_type: str, video_length: str, target_audience: str,
+                            key_message: str, template_type: str,
+                            threshold: float = Config.SCRIPT_SIMILARITY_THRESHOLD) -> Optional[tuple]:
+        """(GeneratedScript, similarity) for an earlier request that differs only in wording, if any"""
+        index = self.script_index
+        match = index.lookup(video_length, index.vectorize(content_type, target_audience, key_message, template_type),
+                             threshold)
+        if match is None:
+            return None
+        script = self.db.get_script(match[0])
+        return (script, match[1]) if script else None
+    
+    def reuse_script(self, script: GeneratedScript) -> GeneratedScript:
+        """Serve an existing script for a near-duplicate request and record the hit"""
+        self.db.record_script_hit(script.id)
+        script.cache_hits += 1
+        return script
+    
+    def _index_script(self, script: GeneratedScript):
+        index = self.script_index
+        index.add(script.id, script.video_length, index.vectorize(
+            script.content_type, script.target_audience, script.key_message, script.template_type))
     
     def generate_content_script(self, content_type: str, video_length: str, 
                                target_audience: str, key_message: str, 
-                               template_type: str) -> GeneratedScript:
-        """Generate a new content script"""
+                               template_type: str, reuse_similar: bool = True) -> GeneratedScript:
+        """Generate a new content script, or return an existing one for a near-duplicate request"""
+        if reuse_similar:
+            similar = self.find_similar_script(content_type, video_length, target_audience, key_message, template_type)
+            if similar:
+                print(f"Reusing similar script ({similar[1]:.0%} match): {similar[0].title}")
+                return self.reuse_script(similar[0])
+        
         print(f"Generating {content_type} script for {target_audience}...")
         
         script_data = self.ai.generate_script(
             content_type, video_length, target_audience, key_message, template_type
         )
         
-        script = GeneratedScript(
-            title=script_data.get('title', 'Generated Script'),
-            content=script_data.get('full_script', 'Content generation failed'),
-            content_type=content_type,
-            video_length=video_length,
-            target_audience=target_audience,
-            template_type=template_type,
-            ai_generated=True,
-            status="generated"
-        )
+        script = script_from_data(script_data, content_type, video_length, target_audience, template_type,
+                                  key_message)
+        if script_data.get("failed"):
+            print("Script generation failed; nothing was saved")
+            return script
         
         script_id = self.db.insert_script(script)
         script.id = script_id
+        self._index_script(script)
         
         print(f"Script generated successfully: {script.title}")
         return script
     
+    def stream_content_script(self, content_type: str, video_length: str,
+                              target_audience: str, key_message: str,
+                              template_type: str) -> Iterator[tuple]:
+        """Generate a script field by field; the last item is ("script", saved GeneratedScript)"""
+        script_data = {}
+        for field, value in self.ai.stream_script(content_type, video_length, target_audience,
+                                                  key_message, template_type):
+            script_data[field] = value
+            yield field, value
+        
+        script = script_from_data(script_data, content_type, video_length, target_audience, template_type,
+                                  key_message)
+        script.id = self.db.insert_script(script)
+        self._index_script(script)
+        yield "script", script
+    
+    def analyze_videos(self, videos: Optional[Iterable[ViralVideo]] = None,
+                       concurrency: int = Config.AI_CONCURRENCY, prefilter: bool = True,
+                       top_k: Optional[int] = Config.HEURISTIC_TOP_K,
+                       threshold: Optional[float] = Config.HEURISTIC_THRESHOLD,
+                       pack_size: Optional[int] = Config.ANALYSIS_PACK_SIZE) -> List[BatchResult]:
+        """Analyze videos concurrently (default: every discovered, non-duplicate video) from sync code.
+        With prefilter, only the candidates the local HeuristicScorer ranks highest are sent to gpt-4o."""
+        if videos is None:
+            videos = self.db.iter_viral_videos(status="discovered", include_duplicates=False)
+        videos = self.scorer.select(videos, top_k, threshold) if prefilter else list(videos)
+        return self.ai.run(self.ai.analyze_many(videos, concurrency=concurrency, pack_size=pack_size))
+    
+    def score_contents(self, contents: Iterable[str], concurrency: int = Config.AI_CONCURRENCY,
+                       pack_size: Optional[int] = Config.AUTHENTICITY_PACK_SIZE) -> List[BatchResult]:
+        """Score content authenticity concurrently from sync code"""
+        return self.ai.run(self.ai.score_many(contents, concurrency=concurrency, pack_size=pack_size))
+    
+    def generate_scripts(self, specs: Iterable[Dict[str, str]],
+                         concurrency: int = Config.AI_CONCURRENCY) -> List[BatchResult]:
+        """Generate and store scripts concurrently from sync code"""
+        results = self.ai.run(self.ai.generate_many(specs, concurrency=concurrency))
+        for result in results:
+            if result.ok:
+                self._index_script(result.result)
+        return results
+    
     def get_dashboard_stats(self) -> Dict[str, Any]:
         """Get dashboard statistics"""
-        videos = self.db.get_viral_videos()
-        scripts = self.db.get_scripts()
-        
-        total_views = sum(v.views for v in videos)
-        avg_engagement = sum(v.engagement_rate for v in videos) / len(videos) if videos else 0
+        aggregates = self.db.get_dashboard_counters()
         
         return {
-            "monthly_revenue": 5600,
-            "videos_created": len(scripts),
-            "avg_engagement": round(avg_engagement, 1),
-            "conversion_rate": 4.2,
-            "total_views": total_views,
-            "viral_videos_found": len([v for v in videos if v.ai_score > 85])
+            "monthly_revenue": aggregates['monthly_revenue'],
+            "videos_created": aggregates['videos_created'],
+            "avg_engagement": round(aggregates['avg_engagement'], 1),
+            "conversion_rate": round(aggregates['conversion_rate'], 1),
+            "total_views": aggregates['total_views'],
+            "viral_videos_found": aggregates['viral_videos_found']
         }
     
     def get_affiliate_products(self) -> List[Dict[str, Any]]:
@@ -541,9 +2967,12 @@ class ViralAIAgent:
             print("4. View affiliate products")
             print("5. View generated scripts")
             print("6. Seed sample data")
-            print("7. Exit")
+            print("7. Search content")
+            print("8. Analyze discovered videos")
+            print("9. Rebuild dashboard counters")
+            print("10. Exit")
             
-            choice = input("\nEnter your choice (1-7): ").strip()
+            choice = input("\nEnter your choice (1-10): ").strip()
             
             if choice == "1":
                 self.scan_viral_content_interactive()
@@ -558,6 +2987,13 @@ class ViralAIAgent:
             elif choice == "6":
                 self.db.seed_sample_data()
             elif choice == "7":
+                self.search_content_interactive()
+            elif choice == "8":
+                self.analyze_videos_interactive()
+            elif choice == "9":
+                self.db.rebuild_counters()
+                print("Dashboard counters rebuilt from source tables.")
+            elif choice == "10":
                 print("Goodbye!")
                 break
             else:
@@ -566,14 +3002,15 @@ class ViralAIAgent:
     def scan_viral_content_interactive(self):
         """Interactive viral content scanning"""
         print("\n📊 Scanning for viral content...")
-        videos = self.scan_viral_content()
+        total = self.db.count_viral_videos()
         
-        if not videos:
+        if not total:
             print("No viral videos found in database. Run option 6 to seed sample data.")
             return
         
-        print(f"\nFound {len(videos)} viral videos:")
-        for i, video in enumerate(videos[:5], 1):
+        print(f"\nFound {total} viral videos:")
+        list_columns = ('title', 'platform', 'views', 'ai_score', 'engagement_rate')
+        for i, video in enumerate(islice(self.scan_viral_content(columns=list_columns), 5), 1):
             print(f"{i}. {video.title}")
             print(f"   Platform: {video.platform} | Views: {video.views:,} | AI Score: {video.ai_score}")
             print(f"   Engagement: {video.engagement_rate}%")
@@ -593,14 +3030,79 @@ class ViralAIAgent:
             print("Please fill in all fields.")
             return
         
-        script = self.generate_content_script(
-            content_type, video_length, target_audience, key_message, template_type
-        )
+        similar = self.find_similar_script(content_type, video_length, target_audience, key_message, template_type)
+        if similar:
+            script, similarity = similar
+            print(f"\nA similar script already exists ({similarity:.0%} match): {script.title}")
+            if input("Reuse it instead of generating a new one? (Y/n): ").strip().lower() != "n":
+                self.reuse_script(script)
+                print("-" * 50)
+                print(script.content)
+                print("-" * 50)
+                return
         
-        print(f"\n📝 Generated Script: {script.title}")
-        print("-" * 50)
-        print(script.content)
+        sections = {"title": "📝 Title", "hook": "🎣 Hook", "problem": "❓ Problem", "solution": "💡 Solution",
+                    "proof": "📈 Proof", "cta": "👉 Call to action"}
         print("-" * 50)
+        try:
+            for field, value in self.stream_content_script(
+                content_type, video_length, target_audience, key_message, template_type
+            ):
+                if field in sections:
+                    print(f"{sections[field]}: {value}\n", flush=True)
+                elif field == "script":
+                    print("-" * 50)
+                    print(f"Script saved (#{value.id}): {value.title}")
+        except AIServiceUnavailable as e:
+            print(f"OpenAI is unavailable right now, nothing was saved: {e}")
+        except ValueError as e:
+            print(f"The script response was incomplete, nothing was saved: {e}")
+        except openai.OpenAIError as e:  # not retryable (bad key, bad request): report it, keep the menu alive
+            print(f"OpenAI rejected the request, nothing was saved: {e}")
+    
+    def analyze_videos_interactive(self):
+        """Interactive batch analysis of discovered videos"""
+        print("\n🤖 Analyzing discovered videos...")
+        waiting = self.db.count_viral_videos(status="discovered", include_duplicates=False)
+        results = self.analyze_videos()
+        
+        if not results:
+            print("No discovered videos passed the local pre-filter." if waiting else
+                  "No discovered videos waiting for analysis.")
+            return
+        
+        print(f"Local pre-filter sent {len(results)} of {waiting} discovered videos to gpt-4o")
+        
+        failed = [result for result in results if not result.ok]
+        print(f"Analyzed {len(results) - len(failed)} of {len(results)} videos")
+        for result in failed:
+            print(f"   ✗ {result.item.title}: {result.error}")
+    
+    def search_content_interactive(self):
+        """Interactive full-text search"""
+        print("\n🔎 Search Content")
+        
+        query = input("Search for (e.g. passive income): ").strip()
+        platform = input("Platform (blank for all): ").strip() or None
+        
+        if not query:
+            print("Please enter a search query.")
+            return
+        
+        hits = self.db.search(query, limit=10, platform=platform)
+        if not hits:
+            print("No matches found.")
+            return
+        
+        for heading, group in (("Videos", hits.videos), ("Scripts", hits.scripts)):
+            if not group:
+                continue
+            print(f"{heading}:")
+            for i, hit in enumerate(group, 1):
+                source = f" [{hit.platform}]" if hit.platform else ""
+                print(f"{i}.{source} {hit.title} (bm25 {hit.bm25:.2f})")
+                print(f"   {hit.snippet}")
+                print()
     
     def show_dashboard_stats(self):
         """Show dashboard statistics"""
@@ -630,17 +3132,18 @@ class ViralAIAgent:
     def show_generated_scripts(self):
         """Show generated scripts"""
         print("\n📝 Generated Scripts")
-        scripts = self.db.get_scripts()
-        
-        if not scripts:
-            print("No scripts found. Generate some scripts first!")
-            return
+        found = False
         
-        for i, script in enumerate(scripts, 1):
+        list_columns = ('title', 'content_type', 'video_length', 'target_audience', 'status')
+        for i, script in enumerate(self.db.iter_scripts(columns=list_columns), 1):
+            found = True
             print(f"{i}. {script.title}")
             print(f"   Type: {script.content_type} | Length: {script.video_length}")
             print(f"   Audience: {script.target_audience} | Status: {script.status}")
             print()
+        
+        if not found:
+            print("No scripts found. Generate some scripts first!")
 
 def main():
     """Main function to run the Viral AI Agent"""
@@ -653,8 +3156,8 @@ def main():
     
     try:
         # Initialize and run the agent
-        agent = ViralAIAgent()
-        agent.run_interactive_mode()
+        with ViralAIAgent() as agent:
+            agent.run_interactive_mode()
         
     except KeyboardInterrupt:
         print("\n\nExiting...")